@@ -3,21 +3,23 @@
 from __future__ import annotations
 
 import os
-import json
 import sys
 from pathlib import Path
-from datetime import timedelta, datetime, timezone
+from datetime import timedelta
 
 from flask import Flask, jsonify
 from flask_wtf.csrf import CSRFError
 
 from .blueprints import register_blueprints
 from .extensions import init_extensions
+from .services.database import close_request_db
 from .services.i18n import SUPPORTED_LOCALES, register_jinja
 from .services.ui import register_ui
 from .services.security import init_security
 from .services.auto_migrate import auto_upgrade
-from .services.bootstrap import ensure_base_tables
+from .services.bootstrap import ensure_base_tables, role_name_unique, table_ready
+from .services.db_restore import RESTORE_MARKER_NAME, apply_pending_db_restore
+from .services.doctor_colors import init_doctor_colors_table
 from .services.admin_guard import ensure_admin_exists
 from .services.data_fixes import backfill_missing_payment_doctors
 from .services.reception_bootstrap import ensure_reception_permissions
@@ -89,72 +91,17 @@ def create_app() -> Flask:
     if not secret_key:
         secret_key = os.urandom(32)
 
-    def _apply_pending_db_restore(data_root_path: Path, main_db: Path) -> None:
-        """Apply a requested restore before opening the main database."""
-        marker_path = data_root_path / "restore_pending.json"
-        if not marker_path.exists():
-            return
-        try:
-            marker = json.loads(marker_path.read_text(encoding="utf-8"))
-        except Exception:
-            return
-
-        backup_name = (marker.get("backup_name") or "").strip()
-        if not backup_name or "/" in backup_name or "\\" in backup_name:
-            return
-
-        backup_path = data_root_path / "backups" / backup_name
-        if not backup_path.exists():
-            return
-
-        import sqlite3
-
-        # Safety backup of current DB before overwriting.
-        try:
-            ts = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
-            safety_path = data_root_path / "backups" / f"app-before-restore-{ts}.db"
-            src = sqlite3.connect(str(main_db))
-            try:
-                dst = sqlite3.connect(str(safety_path))
-                try:
-                    src.backup(dst)
-                finally:
-                    dst.close()
-            finally:
-                src.close()
-        except Exception:
-            # If safety backup fails, do not proceed.
-            return
-
-        # Restore requested backup into app.db.
-        try:
-            src = sqlite3.connect(str(backup_path))
-            try:
-                dst = sqlite3.connect(str(main_db))
-                try:
-                    src.backup(dst)
-                finally:
-                    dst.close()
-            finally:
-                src.close()
-        except Exception:
-            return
-
-        # Clear marker on success.
-        try:
-            marker_path.unlink()
-        except Exception:
-            pass
-
     if db_override:
         db_path = Path(db_override)
     else:
         db_path = data_root / "app.db"
         # Apply pending restore only for the main DB (never for preview DBs).
-        try:
-            _apply_pending_db_restore(data_root, db_path)
-        except Exception:
-            pass
+        # A single lstat keeps the common no-restore startup cheap.
+        if os.path.lexists(data_root / RESTORE_MARKER_NAME):
+            try:
+                apply_pending_db_restore(data_root, db_path)
+            except Exception:
+                pass
 
     default_locale = os.getenv("CLINIC_DEFAULT_LOCALE", "en").lower()
     if default_locale not in SUPPORTED_LOCALES:
@@ -175,7 +122,11 @@ def create_app() -> Flask:
         SESSION_COOKIE_SAMESITE="Lax",
         PERMANENT_SESSION_LIFETIME=timedelta(hours=12),
         SQLALCHEMY_DATABASE_URI=f"sqlite:///{db_path}",
-        SQLALCHEMY_ENGINE_OPTIONS={"connect_args": {"check_same_thread": False}},
+        # Raise sqlite3's per-connection prepared-statement cache (default 128)
+        # so the hot appointment/patient queries stay compiled across requests.
+        SQLALCHEMY_ENGINE_OPTIONS={
+            "connect_args": {"check_same_thread": False, "cached_statements": 256}
+        },
         RATELIMIT_STORAGE_URI=os.getenv("RATELIMIT_STORAGE_URI", "memory://"),
         DATA_ROOT=str(data_root),
         PALMER_PLUS_DB=str(db_path),
@@ -205,10 +156,27 @@ def create_app() -> Flask:
     register_jinja(app)
     register_ui(app)
     init_extensions(app)
+    app.teardown_appcontext(close_request_db)
     login_manager.init_app(app)
     register_blueprints(app)
     auto_upgrade(app)
     ensure_base_tables(Path(app.config["PALMER_PLUS_DB"]))
+    # Checked once here so appointment helpers skip a sqlite_master probe per call.
+    app.config["APPOINTMENTS_TABLE_READY"] = table_ready(
+        Path(app.config["PALMER_PLUS_DB"]), "appointments"
+    )
+    # Legacy databases with duplicate role names cannot get the UNIQUE index;
+    # role creation falls back to an explicit name check there.
+    app.config["ROLE_NAME_UNIQUE"] = role_name_unique(Path(app.config["PALMER_PLUS_DB"]))
+    # Bring doctor_colors up to date once so its helpers skip the
+    # CREATE/PRAGMA/ALTER round-trips on every call.
+    with app.app_context():
+        try:
+            init_doctor_colors_table()
+        except Exception:
+            pass
+        else:
+            app.config["DOCTOR_COLORS_TABLE_READY"] = True
     ensure_reception_permissions()
     # Fill missing doctor_id on older clinic databases (safe default: Any Doctor).
     try:
@@ -220,9 +188,12 @@ def create_app() -> Flask:
     init_security(app)
     register_cli(app)
 
-    # Disable template caching so changes show immediately even when debug is False
-    app.config.setdefault("TEMPLATES_AUTO_RELOAD", True)
-    app.jinja_env.auto_reload = True
+    # Disable template caching so changes show immediately even when debug is False.
+    # Frozen builds ship templates read-only inside the bundle, so skip the
+    # per-render mtime check there and keep serving the compiled templates.
+    reload_templates = not getattr(sys, "frozen", False)
+    app.config.setdefault("TEMPLATES_AUTO_RELOAD", reload_templates)
+    app.jinja_env.auto_reload = reload_templates
     app.jinja_env.cache.clear()
 
     # Add CSRF error handling to catch CSRF validation failures
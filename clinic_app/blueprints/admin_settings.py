@@ -4,9 +4,14 @@ import csv
 import os
 import re
 import hashlib
-from collections.abc import Iterable, Mapping
+import shutil
+import tempfile
+from collections import defaultdict, namedtuple
+from collections.abc import Iterable, Iterator, Mapping
+from contextlib import contextmanager
 import json
 from datetime import datetime, timezone
+from functools import lru_cache
 from pathlib import Path
 from types import SimpleNamespace
 from uuid import uuid4
@@ -14,30 +19,36 @@ import io
 
 from flask import (
     Blueprint,
+    Response,
     abort,
     current_app,
     flash,
+    g,
+    has_app_context,
     jsonify,
     redirect,
     render_template,
     request,
     send_file,
+    stream_with_context,
     url_for,
 )
 from flask_login import current_user
-from sqlalchemy import bindparam, func, select, text
+from sqlalchemy import bindparam, exists, func, literal, or_, select, text
 from sqlalchemy.exc import IntegrityError, OperationalError
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import lazyload, raiseload, selectinload
 from flask_wtf.csrf import validate_csrf
 
 from clinic_app.services.security import require_permission
 from clinic_app.services.csrf import ensure_csrf_token
 from clinic_app.services.doctor_colors import (
+    DEFAULT_COLOR,
     DEFAULT_COLORS,
     ANY_DOCTOR_LABEL,
+    bulk_reset_doctor_colors,
     delete_doctor_color,
     get_all_doctors_with_colors,
-    init_doctor_colors_table,
+    get_doctor_colors,
     set_doctor_color,
     ensure_unique_doctor_id,
     ensure_unique_numeric_id,
@@ -52,22 +63,13 @@ from clinic_app.services.doctor_colors import (
 )
 import sqlite3
 
-from clinic_app.services.theme_settings import get_setting, get_theme_variables, set_setting
+from clinic_app.services.theme_settings import get_setting, get_theme_variables, set_setting, set_settings
 from clinic_app.services.appointments import _slugify as slugify_doctor
 from clinic_app.extensions import db, csrf
 from clinic_app.services.database import db as db_sqlite
+from clinic_app.services.db_restore import RESTORE_MARKER_NAME
 from clinic_app.models_rbac import Permission, Role, User, role_permissions, user_roles, LEGACY_ROLE_PERMISSIONS
-try:
-    from PIL import Image  # type: ignore
-except Exception:  # pragma: no cover
-    Image = None  # type: ignore[assignment]
-from clinic_app.services.ui import render_page
-from clinic_app.services.import_first_stable import (
-    analyze_first_stable_excel,
-    analyze_import_csv_template,
-    extract_first_stable_payments,
-    extract_import_csv_payments,
-)
+from clinic_app.services.ui import logo_version, render_page
 from clinic_app.services.i18n import T
 from clinic_app.services.payments import money
 from clinic_app.services.patients import MergeConflict, merge_patient_records, migrate_patients_drop_unique_short_id, next_short_id
@@ -75,43 +77,188 @@ from clinic_app.services.patients import MergeConflict, merge_patient_records, m
 bp = Blueprint("admin_settings", __name__, url_prefix="/admin")
 csrf.exempt(bp)
 
+# Role pages only read role.permissions (and each permission's own columns).
+# Anything else, e.g. the joined Permission.roles back-reference, must be asked
+# for explicitly instead of being loaded silently per row.
+_ROLE_PERMISSIONS_ONLY = (selectinload(Role.permissions).raiseload("*"), raiseload("*"))
+
+# Role views work on the request-scoped session returned by db.session(); the
+# extension's teardown_appcontext hook removes it, so they do not close it.
+
+
+PermissionRow = namedtuple("PermissionRow", "id code description")
+_PERMISSIONS_CACHE_KEY = "admin_settings.permissions"
+
+
+def _all_permissions(session) -> list[PermissionRow]:
+    """Return all permissions ordered by code, cached for the app's lifetime.
+
+    Permissions are seeded by migrations and startup hooks, not edited at
+    runtime; call ``invalidate_permissions_cache()`` after changing them.
+    """
+    cached = current_app.extensions.get(_PERMISSIONS_CACHE_KEY)
+    if cached is None:
+        rows = session.execute(
+            select(Permission.id, Permission.code, Permission.description).order_by(Permission.code)
+        ).all()
+        cached = current_app.extensions[_PERMISSIONS_CACHE_KEY] = tuple(PermissionRow(*row) for row in rows)
+    return list(cached)
+
+
+def invalidate_permissions_cache() -> None:
+    current_app.extensions.pop(_PERMISSIONS_CACHE_KEY, None)
+    current_app.extensions.pop(_PERMISSION_GROUPS_CACHE_KEY, None)
+    invalidate_role_index_cache()
+
+
+RoleRow = namedtuple("RoleRow", "id name description permissions")
+
+
+def _role_index_rows(session) -> list[RoleRow]:
+    """Roles for the settings table as plain rows, skipping ORM hydration."""
+    perms_by_role: dict[int, list[PermissionRow]] = {}
+    links = session.execute(
+        select(role_permissions.c.role_id, Permission.id, Permission.code, Permission.description)
+        .join(Permission, Permission.id == role_permissions.c.permission_id)
+        .order_by(Permission.code)
+    )
+    for role_id, perm_id, code, description in links:
+        perms_by_role.setdefault(role_id, []).append(PermissionRow(perm_id, code, description))
+    rows = session.execute(select(Role.id, Role.name, Role.description).order_by(Role.name))
+    return [
+        RoleRow(role_id, name, description, perms_by_role.get(role_id, []))
+        for role_id, name, description in rows
+    ]
+
+
+_ROLE_INDEX_CACHE_KEY = "admin_settings.role_index"
+
+
+def _cached_role_index_rows(session) -> list[RoleRow]:
+    """``_role_index_rows`` cached per app; role writes call ``invalidate_role_index_cache()``."""
+    cached = current_app.extensions.get(_ROLE_INDEX_CACHE_KEY)
+    if cached is None:
+        cached = current_app.extensions[_ROLE_INDEX_CACHE_KEY] = tuple(_role_index_rows(session))
+    return list(cached)
+
+
+def invalidate_role_index_cache() -> None:
+    current_app.extensions.pop(_ROLE_INDEX_CACHE_KEY, None)
+
 
 def _all_roles(session) -> list[Role]:
     """Return all roles ordered by name."""
-    return session.execute(select(Role).order_by(Role.name)).unique().scalars().all()
+    # lazyload() drops the default joined permissions load; with no JOIN fan-out
+    # the rows are already unique, so .unique() is unnecessary.
+    return session.execute(select(Role).options(lazyload(Role.permissions)).order_by(Role.name)).scalars().all()
+
+
+RoleOption = namedtuple("RoleOption", "id name")
+
+
+def _role_options(session) -> list[RoleOption]:
+    """Role ids and names for the user form checkboxes, without ORM hydration."""
+    rows = session.execute(select(Role.id, Role.name).order_by(Role.name))
+    return [RoleOption(role_id, name) for role_id, name in rows]
 
 
-def _roles_from_form(session, form_data) -> list[Role]:
-    """Resolve role ids from the submitted form into ORM objects."""
-    role_values: Iterable[object]
+# Signed decimal strings ``int()`` accepts for a submitted role id.
+_ROLE_ID_RE = re.compile(r"[+-]?\d+")
+
+
+def _roles_from_form(session, form_data, roles_by_id: Mapping[int, Role] | None = None) -> list[Role]:
+    """Resolve role ids from the submitted form into ORM objects.
+
+    When ``roles_by_id`` (from ``_all_roles``) is given, ids are resolved
+    against it and no query is issued.
+    """
     if hasattr(form_data, "getlist"):
         role_values = form_data.getlist("roles")  # type: ignore[call-arg]
     elif isinstance(form_data, Mapping):
-        role_values = form_data.get("roles", [])  # type: ignore[assignment]
-    elif isinstance(form_data, Iterable):
-        role_values = form_data
+        role_values = form_data.get("roles") or []
     else:
-        role_values = []
+        role_values = list(form_data or [])
+
+    # Predicate filter instead of try/int()/except per value; bools are not ids.
+    role_ids = [
+        int(raw)
+        for raw in role_values
+        if (isinstance(raw, int) and not isinstance(raw, bool))
+        or (isinstance(raw, str) and _ROLE_ID_RE.fullmatch(raw.strip()))
+    ]
 
-    role_ids: list[int] = []
-    for raw in role_values:
-        if raw in (None, ""):
-            continue
+    if roles_by_id is not None:
+        return [roles_by_id[role_id] for role_id in dict.fromkeys(role_ids) if role_id in roles_by_id]
+    if not role_ids:
+        return []
+    stmt = select(Role).options(lazyload(Role.permissions)).where(Role.id.in_(role_ids))
+    return session.execute(stmt).scalars().all()
+
+
+def _permission_ids_from_form(form_data) -> set[int]:
+    """Collect submitted permission ids, skipping values that are not integers."""
+    if hasattr(form_data, "getlist"):
+        raw_values = form_data.getlist("permissions")
+    else:
+        raw_values = form_data.get("permissions") or []
+    ids: set[int] = set()
+    add = ids.add
+    for raw in raw_values:
         try:
-            value = int(raw)
+            add(int(raw))
         except (TypeError, ValueError):
             continue
-        role_ids.append(value)
+    return ids
 
-    if not role_ids:
-        return []
-    stmt = select(Role).where(Role.id.in_(role_ids))
-    return session.execute(stmt).unique().scalars().all()
+
+def _add_role_permissions(session, role_id: int, permission_ids: Iterable[int]) -> None:
+    """Link permissions to a role by id without loading Permission objects.
+
+    ``INSERT OR IGNORE ... SELECT`` drops ids that do not exist in
+    ``permissions`` and skips links the role already has.
+    """
+    ids = set(permission_ids)
+    if not ids:
+        return
+    session.execute(
+        role_permissions.insert()
+        .prefix_with("OR IGNORE")
+        .from_select(
+            ["role_id", "permission_id"],
+            select(literal(role_id), Permission.id).where(Permission.id.in_(ids)),
+        )
+    )
+
+
+def _sync_role_permissions(session, role_id: int, permission_ids: set[int]) -> None:
+    """Make a role's permission links match ``permission_ids``, touching only the changes.
+
+    One DELETE for links no longer wanted and one INSERT OR IGNORE for new
+    ones; the current links are never read back into Python.
+    """
+    stale = role_permissions.delete().where(role_permissions.c.role_id == role_id)
+    if permission_ids:
+        stale = stale.where(role_permissions.c.permission_id.not_in(permission_ids))
+    session.execute(stale)
+    _add_role_permissions(session, role_id, permission_ids)
+
+
+def _role_permissions_payload(permissions: Iterable[PermissionRow]) -> list[dict[str, object]]:
+    """JSON permission list for a role response.
+
+    Callers pass the cached rows matching the submitted ids, which are exactly
+    the links ``INSERT ... SELECT`` keeps, so no re-read is needed.
+    """
+    return [{"id": perm.id, "code": perm.code, "name": perm.code} for perm in permissions]
+
+
+_CK_USERS_ROLE_RE = re.compile(
+    r"ck_users_role.*check constraint failed|check constraint failed.*ck_users_role", re.I | re.S
+)
 
 
 def _is_ck_users_role_error(err: BaseException) -> bool:
-    message = str(err).lower()
-    return "ck_users_role" in message and "check constraint failed" in message
+    return _CK_USERS_ROLE_RE.search(str(err)) is not None
 
 
 def _commit_with_legacy_role_fallback(session, user: User) -> None:
@@ -145,114 +292,154 @@ def _fallback_user_id(session, exclude_user_id: str) -> str | None:
     return fallback
 
 
+# Columns referencing users.id that block deleting a user until reassigned.
+_USER_FK_COLUMNS = (
+    ("expense_receipts", "created_by"),
+    ("receipts", "issued_by_user_id"),
+    ("receipt_reprints", "user_id"),
+)
+_USER_FK_TARGETS_KEY = "admin_settings.user_fk_targets"
+
+
+def _user_fk_targets(session) -> tuple[tuple[str, str], ...]:
+    """Return the ``_USER_FK_COLUMNS`` present in this database (probed once per app)."""
+    targets = current_app.extensions.get(_USER_FK_TARGETS_KEY)
+    if targets is None:
+        found = []
+        for table, column in _USER_FK_COLUMNS:
+            columns = {row[1] for row in session.execute(text(f"PRAGMA table_info({table})"))}
+            if column in columns:
+                found.append((table, column))
+        targets = current_app.extensions[_USER_FK_TARGETS_KEY] = tuple(found)
+    return targets
+
+
 def _reassign_linked_records(session, source_user_id: str, target_user_id: str | None) -> bool:
     """Reassign FK references that block deletion."""
     if not target_user_id:
         return False
-    try:
-        # Reassign expense_receipts.created_by
-        session.execute(
-            text("UPDATE expense_receipts SET created_by=:target WHERE created_by=:source"),
-            {"target": target_user_id, "source": source_user_id},
-        )
-    except OperationalError:
-        # Expense receipts table not present; skip
-        pass
+    params = {"target": target_user_id, "source": source_user_id}
+    # Only tables/columns that exist are touched, so no OperationalError probing.
+    for table, column in _user_fk_targets(session):
+        session.execute(text(f"UPDATE {table} SET {column}=:target WHERE {column}=:source"), params)
+    return True
 
-    try:
-        # Reassign receipts.issued_by_user_id
-        session.execute(
-            text("UPDATE receipts SET issued_by_user_id=:target WHERE issued_by_user_id=:source"),
-            {"target": target_user_id, "source": source_user_id},
-        )
-    except OperationalError:
-        # Receipts table not present or column doesn't exist; skip
-        pass
 
-    try:
-        # Reassign receipt_reprints.user_id
-        session.execute(
-            text("UPDATE receipt_reprints SET user_id=:target WHERE user_id=:source"),
-            {"target": target_user_id, "source": source_user_id},
+def _admin_role_id(session) -> int | None:
+    return session.scalar(select(Role.id).where(Role.name == "Admin"))
+
+
+def _is_protected_admin(user: User) -> bool:
+    """True for the primary admin account (``admin`` username or ``admin-`` id)."""
+    return user.username == "admin" or (user.id or "").startswith("admin-")
+
+
+def _has_other_admins(session, admin_role_id: int | None, exclude_user_id: str) -> bool:
+    # One round-trip; each EXISTS stops at its first match.
+    other_admin = exists().where(func.lower(User.role) == "admin", User.id != exclude_user_id)
+    if admin_role_id is not None:
+        other_admin = or_(
+            other_admin,
+            exists().where(user_roles.c.role_id == admin_role_id, user_roles.c.user_id != exclude_user_id),
         )
-    except OperationalError:
-        # Receipt reprints table not present; skip
-        pass
+    return bool(session.scalar(select(other_admin)))
+
+
+# (emoji, i18n key) per permission group, in display order.
+_PERMISSION_GROUPS = (
+    ("👥", "perm_group_user_mgmt"),
+    ("📅", "perm_group_appointments"),
+    ("🏥", "perm_group_patients"),
+    ("💰", "perm_group_payments_receipts"),
+    ("📊", "perm_group_reports_exports"),
+    ("⚙️", "perm_group_system_admin"),
+    ("🖼️", "perm_group_images_media"),
+    ("💼", "perm_group_expenses"),
+)
+# Keyword -> group index, checked in order; the first substring hit wins.
+_PERMISSION_GROUP_RULES = (
+    ("user", 0), ("role", 0), ("admin", 0),
+    ("appointment", 1), ("schedule", 1),
+    ("patient", 2),
+    ("payment", 3), ("receipt", 3),
+    ("report", 4), ("export", 4), ("collection", 4),
+    ("doctor", 5), ("color", 5), ("system", 5),
+    ("image", 6), ("media", 6),
+    ("expense", 7),
+)
+_DEFAULT_PERMISSION_GROUP = 5
 
-    return True
 
+@lru_cache(maxsize=256)
+def _permission_group(code: str) -> int:
+    """Index into ``_PERMISSION_GROUPS`` for a permission code (first matching rule wins)."""
+    code = code.lower()
+    for keyword, index in _PERMISSION_GROUP_RULES:
+        if keyword in code:
+            return index
+    return _DEFAULT_PERMISSION_GROUP
 
-def _admin_role(session) -> Role | None:
-    return session.execute(select(Role).where(Role.name == "Admin")).unique().scalars().one_or_none()
 
+_PERMISSION_GROUPS_CACHE_KEY = "admin_settings.permission_groups"
 
-def _has_other_admins(session, admin_role_id: int | None, exclude_user_id: str) -> bool:
-    legacy_count = session.scalar(
-        select(func.count())
-        .select_from(User)
-        .where(func.lower(User.role) == "admin", User.id != exclude_user_id)
-    )
-    if legacy_count:
-        return True
-    if admin_role_id is None:
-        return False
-    assigned = session.scalar(
-        select(func.count())
-        .select_from(user_roles)
-        .where(user_roles.c.role_id == admin_role_id, user_roles.c.user_id != exclude_user_id)
-    )
-    return bool(assigned)
-
-
-def _grouped_permissions(session) -> dict[str, list[Permission]]:
-    """Group permissions into logical categories."""
-    permissions = session.execute(select(Permission).order_by(Permission.code)).unique().scalars().all()
-
-    groups = {
-        f"👥 {T('perm_group_user_mgmt')}": [],
-        f"📅 {T('perm_group_appointments')}": [],
-        f"🏥 {T('perm_group_patients')}": [],
-        f"💰 {T('perm_group_payments_receipts')}": [],
-        f"📊 {T('perm_group_reports_exports')}": [],
-        f"⚙️ {T('perm_group_system_admin')}": [],
-        f"🖼️ {T('perm_group_images_media')}": [],
-        f"💼 {T('perm_group_expenses')}": [],
+
+def _grouped_permissions(session) -> dict[str, list[PermissionRow]]:
+    """Group permissions into logical categories.
+
+    The grouping is cached with the permissions; only the labels are
+    translated per call, since they follow the request locale.
+    """
+    buckets = current_app.extensions.get(_PERMISSION_GROUPS_CACHE_KEY)
+    if buckets is None:
+        grouped: defaultdict[int, list[PermissionRow]] = defaultdict(list)
+        for perm in _all_permissions(session):
+            grouped[_permission_group(perm.code)].append(perm)
+        # Cache a plain dict so later lookups cannot insert empty groups.
+        buckets = current_app.extensions[_PERMISSION_GROUPS_CACHE_KEY] = dict(grouped)
+
+    # Translate labels once, for non-empty groups only.
+    return {
+        f"{emoji} {T(key)}": list(buckets[index])
+        for index, (emoji, key) in enumerate(_PERMISSION_GROUPS)
+        if index in buckets
     }
 
-    for perm in permissions:
-        code = perm.code.lower()
-        if any(keyword in code for keyword in ['user', 'role', 'admin']):
-            groups[f"👥 {T('perm_group_user_mgmt')}"].append(perm)
-        elif any(keyword in code for keyword in ['appointment', 'schedule']):
-            groups[f"📅 {T('perm_group_appointments')}"].append(perm)
-        elif any(keyword in code for keyword in ['patient']):
-            groups[f"🏥 {T('perm_group_patients')}"].append(perm)
-        elif any(keyword in code for keyword in ['payment', 'receipt']):
-            groups[f"💰 {T('perm_group_payments_receipts')}"].append(perm)
-        elif any(keyword in code for keyword in ['report', 'export', 'collection']):
-            groups[f"📊 {T('perm_group_reports_exports')}"].append(perm)
-        elif any(keyword in code for keyword in ['doctor', 'color', 'system']):
-            groups[f"⚙️ {T('perm_group_system_admin')}"].append(perm)
-        elif any(keyword in code for keyword in ['image', 'media']):
-            groups[f"🖼️ {T('perm_group_images_media')}"].append(perm)
-        elif any(keyword in code for keyword in ['expense']):
-            groups[f"💼 {T('perm_group_expenses')}"].append(perm)
-        else:
-            groups[f"⚙️ {T('perm_group_system_admin')}"].append(perm)  # Default group
 
-    # Remove empty groups
-    return {k: v for k, v in groups.items() if v}
+def _redirect_to_settings():
+    """Redirect back to the settings page (built only on the redirect path)."""
+    return redirect(url_for("admin_settings.index"))
+
+
+def _utcnow_iso() -> str:
+    """Current UTC time as ISO 8601 text, the format the user/settings rows store."""
+    return datetime.now(timezone.utc).isoformat()
+
+
+_FALSY_STRINGS = frozenset({"0", "false", "off", "no", ""})
 
 
 def _bool_from_value(value: object) -> bool:
     """Convert form/JSON values to a boolean flag."""
+    if value is True or value is False:
+        return value
     if isinstance(value, str):
-        return value.lower() not in {"0", "false", "off", "no", ""}
+        return value.lower() not in _FALSY_STRINGS
     return bool(value)
 
 
-def _get_user_by_any_id(session, user_id: str) -> User | None:
-    """Fetch a user by id, falling back to username lookups."""
+def _get_user_by_any_id(session, user_id: str, *, load_roles: bool = False) -> User | None:
+    """Fetch a user by id, falling back to username lookups.
+
+    ``load_roles`` fetches ``user.roles`` in one extra SELECT (without each
+    role's joined permissions) for callers that only read or replace the roles.
+    """
+    if load_roles:
+        options = (selectinload(User.roles).lazyload(Role.permissions),)
+        for column in (User.id, User.username):
+            user = session.execute(select(User).options(*options).where(column == user_id)).scalar_one_or_none()
+            if user:
+                return user
+        return None
     user = session.get(User, user_id)
     if user:
         return user
@@ -263,10 +450,22 @@ def _get_user_by_any_id(session, user_id: str) -> User | None:
     )
 
 
+_DEFAULT_ROLES_READY_KEY = "admin_settings.default_roles_ready"
+
+
 def _ensure_default_roles(session) -> None:
-    """Create missing default roles with safe permissions (do not overwrite existing roles)."""
+    """Create missing default roles with safe permissions (do not overwrite existing roles).
+
+    Runs its queries once per app; after a successful pass later calls return
+    immediately.
+    """
+    if current_app.extensions.get(_DEFAULT_ROLES_READY_KEY):
+        return
     try:
-        all_perms = session.execute(select(Permission).order_by(Permission.code)).unique().scalars().all()
+        # lazyload() drops the joined Permission.roles fan-out, so rows need no .unique().
+        all_perms = session.execute(
+            select(Permission).options(lazyload(Permission.roles)).order_by(Permission.code)
+        ).scalars().all()
     except Exception:
         all_perms = []
     if not all_perms:
@@ -308,10 +507,12 @@ def _ensure_default_roles(session) -> None:
         },
     ]
 
+    existing = set(
+        session.scalars(select(Role.name).where(Role.name.in_([spec["name"] for spec in defaults])))
+    )
     created = False
     for spec in defaults:
-        role = session.execute(select(Role).where(Role.name == spec["name"])).unique().scalars().one_or_none()
-        if role:
+        if spec["name"] in existing:
             continue
         role = Role(name=spec["name"], description=spec.get("description") or "")
         if spec.get("all"):
@@ -324,6 +525,8 @@ def _ensure_default_roles(session) -> None:
 
     if created:
         session.commit()
+        invalidate_role_index_cache()
+    current_app.extensions[_DEFAULT_ROLES_READY_KEY] = True
 
 
 @bp.route("/", methods=["GET"])
@@ -337,13 +540,14 @@ def index():
         # Ensure default roles exist (do not overwrite existing roles).
         _ensure_default_roles(session)
 
-        # Get all users with their roles
+        # Get all users with their roles (selectinload replaces the joined
+        # roles load, so user rows are not multiplied and need no .unique()).
         stmt = select(User).options(selectinload(User.roles)).order_by(User.created_at.desc())
-        users = session.execute(stmt).unique().scalars().all()
+        users = session.execute(stmt).scalars().all()
 
-        # Get all roles with their permissions
-        roles_stmt = select(Role).options(selectinload(Role.permissions)).order_by(Role.name)
-        roles = session.execute(roles_stmt).unique().scalars().all()
+        # Roles and permissions change rarely: served from per-app caches that
+        # role writes invalidate. Users stay live.
+        roles = _cached_role_index_rows(session)
 
         # Get grouped permissions
         permissions = _grouped_permissions(session)
@@ -382,7 +586,7 @@ def new_user_form():
     """Render a simple form for creating a user (HTML)."""
     session = db.session()
     try:
-        roles = _all_roles(session)
+        roles = _role_options(session)
         return render_template("admin/user_form.html", user=None, roles=roles, errors=[])
     finally:
         session.close()
@@ -398,7 +602,7 @@ def edit_user_form(user_id: str):
         user = _get_user_by_any_id(session, user_id)
         if not user:
             abort(404)
-        roles = _all_roles(session)
+        roles = _role_options(session)
         return render_template("admin/user_form.html", user=user, roles=roles, errors=[])
     finally:
         session.close()
@@ -410,11 +614,8 @@ def edit_user_form(user_id: str):
 def new_role_form():
     """Render a simple form for creating a role (HTML)."""
     session = db.session()
-    try:
-        permissions = session.execute(select(Permission).order_by(Permission.code)).unique().scalars().all()
-        return render_template("admin/role_form.html", role=None, permissions=permissions, errors=[])
-    finally:
-        session.close()
+    permissions = _all_permissions(session)
+    return render_template("admin/role_form.html", role=None, permissions=permissions, errors=[])
 
 
 @bp.route("/roles/<int:role_id>/edit", methods=["GET"])
@@ -423,14 +624,13 @@ def new_role_form():
 def edit_role_form(role_id: int):
     """Render the edit role form (HTML)."""
     session = db.session()
-    try:
-        role = session.get(Role, role_id)
-        if not role:
-            abort(404)
-        permissions = session.execute(select(Permission).order_by(Permission.code)).unique().scalars().all()
-        return render_template("admin/role_form.html", role=role, permissions=permissions, errors=[])
-    finally:
-        session.close()
+    role = session.execute(
+        select(Role).options(*_ROLE_PERMISSIONS_ONLY).where(Role.id == role_id)
+    ).scalar_one_or_none()
+    if not role:
+        abort(404)
+    permissions = _all_permissions(session)
+    return render_template("admin/role_form.html", role=role, permissions=permissions, errors=[])
 
 
 @bp.route("/users/create", methods=["POST"])
@@ -454,26 +654,29 @@ def create_user():
         full_name = (data.get("full_name") or "").strip() or username
         phone = (data.get("phone") or "").strip() or None
         is_active = _bool_from_value(data.get("is_active", True))
+        roles = _all_roles(session)
+        roles_by_id = {role.id: role for role in roles}
         if wants_json:
-            selected_roles = _roles_from_form(session, SimpleNamespace(getlist=lambda k: data.get("roles", [])))
+            selected_roles = _roles_from_form(
+                session, SimpleNamespace(getlist=lambda k: data.get("roles", [])), roles_by_id
+            )
         else:
-            selected_roles = _roles_from_form(session, data)
+            selected_roles = _roles_from_form(session, data, roles_by_id)
 
         errors = []
         if len(username) < 3:
             errors.append("Username must be at least 3 characters.")
         if not password:
             errors.append("Password is required.")
-        if session.scalar(select(User.id).where(User.username == username)):
+        if session.scalar(select(exists().where(User.username == username))):
             errors.append("Username already exists.")
 
         if errors:
             if wants_json:
                 return jsonify({"success": False, "errors": errors}), 400
-            roles = _all_roles(session)
             return render_template("admin/user_form.html", user=None, roles=roles, errors=errors), 200
 
-        now = datetime.now(timezone.utc).isoformat()
+        now = _utcnow_iso()
         new_user = User(
             id=str(uuid4()),
             username=username,
@@ -502,13 +705,13 @@ def create_user():
                 }
             })
         flash("User created successfully.", "ok")
-        return redirect(url_for("admin_settings.index"))
+        return _redirect_to_settings()
     except Exception as e:
         session.rollback()
         if wants_json:
             return jsonify({"success": False, "errors": [str(e)]}), 500
         errors = ["Could not create user: " + str(e)]
-        roles = _all_roles(session)
+        roles = _role_options(session)
         return render_template("admin/user_form.html", user=None, roles=roles, errors=errors), 500
     finally:
         session.close()
@@ -531,7 +734,7 @@ def update_user(user_id: str):
         else:
             validate_csrf((data or {}).get("csrf_token"), secret_key=current_app.secret_key)
 
-        user = _get_user_by_any_id(session, user_id)
+        user = _get_user_by_any_id(session, user_id, load_roles=True)
         if not user:
             if wants_json:
                 return jsonify({"success": False, "errors": ["User not found"]}), 404
@@ -542,22 +745,24 @@ def update_user(user_id: str):
         phone = (data.get("phone") or "").strip() or None
         is_active = _bool_from_value(data.get("is_active", True))
         password = (data.get("password") or "").strip()
+        roles = _all_roles(session)
+        roles_by_id = {role.id: role for role in roles}
         if wants_json:
-            selected_roles = _roles_from_form(session, SimpleNamespace(getlist=lambda k: data.get("roles", [])))
+            selected_roles = _roles_from_form(
+                session, SimpleNamespace(getlist=lambda k: data.get("roles", [])), roles_by_id
+            )
         else:
-            selected_roles = _roles_from_form(session, data)
+            selected_roles = _roles_from_form(session, data, roles_by_id)
 
-        admin_role = _admin_role(session)
-        will_be_admin = bool(
-            admin_role and any(role.id == admin_role.id for role in selected_roles)
-        )
-        protected_admin = user.username == "admin" or (user.id or "").startswith("admin-")
+        admin_role_id = next((role.id for role in roles if role.name == "Admin"), None)
+        will_be_admin = admin_role_id is not None and any(role.id == admin_role_id for role in selected_roles)
+        protected_admin = _is_protected_admin(user)
 
         errors = []
 
         # Last admin protection
         if not will_be_admin:
-            if not _has_other_admins(session, getattr(admin_role, "id", None), user.id):
+            if not _has_other_admins(session, admin_role_id, user.id):
                 errors.append("At least one admin account must remain. Assign another Admin before changing this user.")
             if protected_admin:
                 errors.append("The primary admin account must remain an Admin.")
@@ -566,7 +771,7 @@ def update_user(user_id: str):
             errors.append("Username must be at least 3 characters.")
 
         duplicate = session.scalar(
-            select(User.id).where(User.username == new_username, User.id != user.id)
+            select(exists().where(User.username == new_username, User.id != user.id))
         )
         if duplicate:
             errors.append("Username already exists.")
@@ -574,14 +779,13 @@ def update_user(user_id: str):
         if errors:
             if wants_json:
                 return jsonify({"success": False, "errors": errors}), 400
-            roles = _all_roles(session)
             return render_template("admin/user_form.html", user=user, roles=roles, errors=errors), 200
 
         user.username = new_username
         user.full_name = full_name or user.full_name or new_username
         user.phone = phone
         user.is_active = is_active
-        user.updated_at = datetime.now(timezone.utc).isoformat()
+        user.updated_at = _utcnow_iso()
 
         if password:
             user.set_password(password)
@@ -602,12 +806,12 @@ def update_user(user_id: str):
                 }
             })
         flash("User updated successfully.", "ok")
-        return redirect(url_for("admin_settings.index"))
+        return _redirect_to_settings()
     except Exception as e:
         session.rollback()
         if wants_json:
             return jsonify({"success": False, "errors": [str(e)]}), 500
-        roles = _all_roles(session)
+        roles = _role_options(session)
         errors = ["Could not update user: " + str(e)]
         return render_template("admin/user_form.html", user=user if 'user' in locals() else None, roles=roles, errors=errors), 500
     finally:
@@ -631,7 +835,7 @@ def delete_user(user_id: str):
         else:
             validate_csrf((data or {}).get("csrf_token"), secret_key=current_app.secret_key)
 
-        user = _get_user_by_any_id(session, user_id)
+        user = _get_user_by_any_id(session, user_id, load_roles=True)
         if not user:
             if wants_json:
                 return jsonify({"success": False, "errors": ["User not found"]}), 404
@@ -642,27 +846,27 @@ def delete_user(user_id: str):
             if wants_json:
                 return jsonify({"success": False, "errors": [message]}), 400
             flash(message, "err")
-            return redirect(url_for("admin_settings.index"))
-
-        admin_role = _admin_role(session)
-        is_admin = (user.role or "").lower() == "admin" or (
-            admin_role and any(role.id == admin_role.id for role in user.roles)
-        )
-        protected_admin = user.username == "admin" or (user.id or "").startswith("admin-")
+            return _redirect_to_settings()
 
-        if protected_admin:
+        # Checked before the admin-role lookup: it needs no query.
+        if _is_protected_admin(user):
             message = "The primary admin account cannot be deleted."
             if wants_json:
                 return jsonify({"success": False, "errors": [message]}), 400
             flash(message, "err")
-            return redirect(url_for("admin_settings.index"))
+            return _redirect_to_settings()
 
-        if is_admin and not _has_other_admins(session, getattr(admin_role, "id", None), user.id):
+        admin_role_id = _admin_role_id(session)
+        is_admin = (user.role or "").lower() == "admin" or (
+            admin_role_id is not None and any(role.id == admin_role_id for role in user.roles)
+        )
+
+        if is_admin and not _has_other_admins(session, admin_role_id, user.id):
             message = "At least one admin account must remain. Assign another Admin before deleting this user."
             if wants_json:
                 return jsonify({"success": False, "errors": [message]}), 400
             flash(message, "err")
-            return redirect(url_for("admin_settings.index"))
+            return _redirect_to_settings()
 
         # Reassign linked records that enforce FK constraints
         fallback_id = _fallback_user_id(session, user.id)
@@ -671,7 +875,7 @@ def delete_user(user_id: str):
             if wants_json:
                 return jsonify({"success": False, "errors": [message]}), 400
             flash(message, "err")
-            return redirect(url_for("admin_settings.index"))
+            return _redirect_to_settings()
 
         reassigned = _reassign_linked_records(session, user.id, fallback_id)
 
@@ -694,18 +898,18 @@ def delete_user(user_id: str):
             if wants_json:
                 return jsonify({"success": False, "errors": [message]}), 400
             flash(message, "err")
-            return redirect(url_for("admin_settings.index"))
+            return _redirect_to_settings()
 
         if wants_json:
             return jsonify({"success": True})
         flash("User deleted.", "ok")
-        return redirect(url_for("admin_settings.index"))
+        return _redirect_to_settings()
     except Exception as e:
         session.rollback()
         if wants_json:
             return jsonify({"success": False, "errors": [str(e)]}), 500
         flash(f"Could not delete user: {e}", "err")
-        return redirect(url_for("admin_settings.index"))
+        return _redirect_to_settings()
     finally:
         session.close()
 
@@ -727,39 +931,41 @@ def create_role():
             validate_csrf((data or {}).get("csrf_token"), secret_key=current_app.secret_key)
 
         name = (data.get("name") or "").strip()
-        description = (data.get("description") or "").strip() or None
-        raw_permissions = data.get("permissions", [])
-        if not wants_json and hasattr(data, "getlist"):
-            raw_permissions = data.getlist("permissions")
-        try:
-            permission_ids = [int(pid) for pid in raw_permissions]
-        except Exception:
-            permission_ids = []
-
         if len(name) < 2:
             errors = ["Role name must be at least 2 characters."]
             if wants_json:
                 return jsonify({"success": False, "errors": errors}), 400
-            permissions = session.execute(select(Permission).order_by(Permission.code)).unique().scalars().all()
+            permissions = _all_permissions(session)
             return render_template("admin/role_form.html", role=None, permissions=permissions, errors=errors), 200
 
-        if session.scalar(select(Role.id).where(Role.name == name)):
+        description = (data.get("description") or "").strip() or None
+        permission_ids = _permission_ids_from_form(data)
+
+        # roles.name is UNIQUE: let the INSERT detect duplicates instead of
+        # probing first, which also closes the check-then-insert race. Legacy
+        # databases whose duplicate names blocked the index still need the probe.
+        role = Role(name=name, description=description)
+        duplicate = False
+        if not current_app.config.get("ROLE_NAME_UNIQUE") and session.execute(
+            select(exists().where(Role.name == name))
+        ).scalar():
+            duplicate = True
+        else:
+            session.add(role)
+            try:
+                session.flush()
+            except IntegrityError:
+                session.rollback()
+                duplicate = True
+        if duplicate:
             errors = ["Role name already exists."]
             if wants_json:
                 return jsonify({"success": False, "errors": errors}), 400
-            permissions = session.execute(select(Permission).order_by(Permission.code)).unique().scalars().all()
+            permissions = _all_permissions(session)
             return render_template("admin/role_form.html", role=None, permissions=permissions, errors=errors), 200
-
-        role = Role(name=name, description=description)
-
-        if permission_ids:
-            permissions = session.execute(
-                select(Permission).where(Permission.id.in_(permission_ids))
-            ).unique().scalars().all()
-            role.permissions = permissions
-
-        session.add(role)
+        _add_role_permissions(session, role.id, permission_ids)
         session.commit()
+        invalidate_role_index_cache()
 
         if wants_json:
             return jsonify({
@@ -768,20 +974,20 @@ def create_role():
                     "id": role.id,
                     "name": role.name,
                     "description": role.description,
-                    "permissions": [{"id": p.id, "code": p.code, "name": p.code} for p in role.permissions]
+                    "permissions": _role_permissions_payload(
+                        perm for perm in _all_permissions(session) if perm.id in permission_ids
+                    ),
                 }
             })
         flash("Role created successfully.", "ok")
-        return redirect(url_for("admin_settings.index"))
+        return _redirect_to_settings()
     except Exception as e:
         session.rollback()
         if wants_json:
             return jsonify({"success": False, "errors": [str(e)]}), 500
-        permissions = session.execute(select(Permission).order_by(Permission.code)).unique().scalars().all()
+        permissions = _all_permissions(session)
         errors = ["Could not create role: " + str(e)]
         return render_template("admin/role_form.html", role=None, permissions=permissions, errors=errors), 500
-    finally:
-        session.close()
 
 
 @bp.route("/roles/<int:role_id>/update", methods=["POST"])
@@ -808,50 +1014,59 @@ def update_role(role_id: int):
             abort(404)
 
         new_name = (data.get("name") or "").strip()
+        if len(new_name) < 2:
+            # Cheap check first: skip form parsing and the validation queries below.
+            errors = ["Role name must be at least 2 characters."]
+            if wants_json:
+                return jsonify({"success": False, "errors": errors}), 400
+            permissions = _all_permissions(session)
+            return render_template("admin/role_form.html", role=role, permissions=permissions, errors=errors), 200
+
         description = (data.get("description") or "").strip() or None
-        raw_permissions = data.get("permissions", [])
-        if not wants_json and hasattr(data, "getlist"):
-            raw_permissions = data.getlist("permissions")
-        try:
-            permission_ids = [int(pid) for pid in raw_permissions]
-        except Exception:
-            permission_ids = []
+        permission_ids = _permission_ids_from_form(data)
 
         errors = []
-        if len(new_name) < 2:
-            errors.append("Role name must be at least 2 characters.")
-
-        duplicate = session.scalar(
-            select(Role.id).where(Role.name == new_name, Role.id != role.id)
-        )
+        manage_codes = {"users:manage", "admin.user.manage"}
+        # Both validation probes go out as scalar subqueries of one SELECT.
+        # Another role granting user management only needs to exist; EXISTS stops
+        # at the first link instead of counting distinct roles.
+        duplicate, other_roles_manage = session.execute(
+            select(
+                select(Role.id)
+                .where(Role.name == new_name, Role.id != role.id)
+                .limit(1)
+                .scalar_subquery(),
+                exists().where(
+                    role_permissions.c.role_id != role.id,
+                    role_permissions.c.permission_id == Permission.id,
+                    Permission.code.in_(manage_codes),
+                ),
+            )
+        ).one()
         if duplicate:
             errors.append("Role name already exists.")
 
-        manage_codes = {"users:manage", "admin.user.manage"}
-        perm_codes: set[str] = set()
-        if permission_ids:
-            perm_codes = set(
-                session.execute(select(Permission.code).where(Permission.id.in_(permission_ids))).scalars().all()
-            )
+        # Resolve the submitted permissions from the cached list instead of a
+        # SELECT ... IN; the same rows feed the JSON response below.
+        selected_permissions = [perm for perm in _all_permissions(session) if perm.id in permission_ids]
+        perm_codes = {perm.code for perm in selected_permissions}
 
         # Safety: never allow a change that removes all admin-management permissions.
         # This prevents lockout from Admin Settings.
         if role.name == "Admin" and not (perm_codes & manage_codes):
             errors.append("Admin role must keep user management permission.")
-
-        other_roles_manage_count = session.scalar(
-            select(func.count(func.distinct(Role.id)))
-            .select_from(Role)
-            .join(role_permissions, role_permissions.c.role_id == Role.id)
-            .join(Permission, Permission.id == role_permissions.c.permission_id)
-            .where(Role.id != role.id, Permission.code.in_(manage_codes))
-        ) or 0
-        if other_roles_manage_count == 0 and not (perm_codes & manage_codes):
+        if not other_roles_manage and not (perm_codes & manage_codes):
             errors.append("At least one role must keep user management permission.")
 
         # Safety: do not let the current user remove their own ability to manage users/roles.
+        # Roles and their permission codes are batch-loaded with selectinload;
+        # lazyload() keeps the joined Permission.roles back-reference out of it.
         try:
-            current_db_user = session.get(User, str(getattr(current_user, "id", "")))
+            current_db_user = session.execute(
+                select(User)
+                .options(selectinload(User.roles).selectinload(Role.permissions).lazyload(Permission.roles))
+                .where(User.id == str(getattr(current_user, "id", "")))
+            ).scalar_one_or_none()
         except Exception:
             current_db_user = None
         if current_db_user and current_db_user.is_active:
@@ -874,7 +1089,7 @@ def update_role(role_id: int):
         if errors:
             if wants_json:
                 return jsonify({"success": False, "errors": errors}), 400
-            permissions = session.execute(select(Permission).order_by(Permission.code)).unique().scalars().all()
+            permissions = _all_permissions(session)
             return render_template("admin/role_form.html", role=role, permissions=permissions, errors=errors), 200
 
         role.name = new_name
@@ -882,53 +1097,30 @@ def update_role(role_id: int):
 
         # Update role permissions using the association table directly.
         # This avoids ORM edge-cases and keeps the operation deterministic.
-        session.execute(role_permissions.delete().where(role_permissions.c.role_id == role.id))
-        effective_permission_ids: list[int] = []
-        if permission_ids:
-            effective_permission_ids = (
-                session.execute(select(Permission.id).where(Permission.id.in_(permission_ids))).scalars().all()
-            )
-            if effective_permission_ids:
-                session.execute(
-                    role_permissions.insert(),
-                    [{"role_id": role.id, "permission_id": pid} for pid in effective_permission_ids],
-                )
+        _sync_role_permissions(session, role.id, permission_ids)
 
         session.commit()
+        invalidate_role_index_cache()
 
         if wants_json:
-            effective_permissions: list[Permission] = []
-            if effective_permission_ids:
-                effective_permissions = (
-                    session.execute(
-                        select(Permission)
-                        .where(Permission.id.in_(effective_permission_ids))
-                        .order_by(Permission.code)
-                    )
-                    .unique()
-                    .scalars()
-                    .all()
-                )
             return jsonify({
                 "success": True,
                 "role": {
                     "id": role.id,
                     "name": role.name,
                     "description": role.description,
-                    "permissions": [{"id": p.id, "code": p.code, "name": p.code} for p in effective_permissions]
+                    "permissions": _role_permissions_payload(selected_permissions),
                 }
             })
         flash("Role updated successfully.", "ok")
-        return redirect(url_for("admin_settings.index"))
+        return _redirect_to_settings()
     except Exception as e:
         session.rollback()
         if wants_json:
             return jsonify({"success": False, "errors": [str(e)]}), 500
-        permissions = session.execute(select(Permission).order_by(Permission.code)).unique().scalars().all()
+        permissions = _all_permissions(session)
         errors = ["Could not update role: " + str(e)]
         return render_template("admin/role_form.html", role=role if 'role' in locals() else None, permissions=permissions, errors=errors), 500
-    finally:
-        session.close()
 
 
 @bp.route("/roles/<int:role_id>/delete", methods=["POST"])
@@ -947,23 +1139,18 @@ def delete_role(role_id: int):
         if not role:
             return jsonify({"success": False, "errors": ["Role not found"]}), 404
 
-        assigned = session.scalar(
-            select(func.count())
-            .select_from(user_roles)
-            .where(user_roles.c.role_id == role_id)
-        )
+        assigned = session.scalar(select(exists().where(user_roles.c.role_id == role_id)))
         if assigned:
             return jsonify({"success": False, "errors": ["Role is assigned to users and cannot be deleted."]}), 400
 
         session.delete(role)
         session.commit()
+        invalidate_role_index_cache()
 
         return jsonify({"success": True})
     except Exception as e:
         session.rollback()
         return jsonify({"success": False, "errors": [str(e)]}), 500
-    finally:
-        session.close()
 
 
 @bp.route("/colors/update", methods=["POST"])
@@ -987,8 +1174,6 @@ def update_color():
         if not color:
             return jsonify({"success": False, "errors": ["Doctor color is required"]}), 400
 
-        init_doctor_colors_table()
-
         # Normalize name for uniqueness
         normalized_name = doctor_label.lower()
 
@@ -1018,8 +1203,7 @@ def update_color():
 
         # Auto-generate a unique color for new doctors
         if not original_id and not raw_id:
-            existing_colors = [doc["color"] for doc in get_all_doctors_with_colors()]
-            color = generate_unique_color(existing_colors)
+            color = generate_unique_color(list(get_doctor_colors().values()))
 
         set_doctor_color(doctor_id, color, doctor_label or doctor_id)
 
@@ -1041,10 +1225,7 @@ def reset_colors():
         data = request.get_json() or {}
         ensure_csrf_token(data)
 
-        init_doctor_colors_table()
-        doctors = get_all_doctors_with_colors()
-        for doc in doctors:
-            set_doctor_color(doc["doctor_id"], "#6B7280", doc["doctor_label"])
+        bulk_reset_doctor_colors(DEFAULT_COLOR)
 
         return jsonify({"success": True})
     except Exception as e:
@@ -1124,28 +1305,38 @@ def purge_doctor():
 # --- Theme Settings ---
 
 
+_HEX_COLOR_RE = re.compile(r"#(?:[0-9a-fA-F]{3}|[0-9a-fA-F]{6})")
+
+
 def _valid_hex_color(value: str) -> bool:
-    if not isinstance(value, str):
-        return False
-    value = value.strip()
-    if len(value) not in (4, 7):
-        return False
-    if not value.startswith("#"):
-        return False
-    hex_part = value[1:]
-    return all(c in "0123456789abcdefABCDEF" for c in hex_part)
+    return isinstance(value, str) and _HEX_COLOR_RE.fullmatch(value.strip()) is not None
 
 
 def _clamp(value: float, min_value: float, max_value: float) -> float:
     return max(min_value, min(max_value, value))
 
 
+_DATA_ROOT_G_KEY = "_admin_settings_data_root"
+
+
 def _data_root() -> Path:
-    """Resolve the configured DATA_ROOT safely."""
-    try:
-        return Path(current_app.config.get("DATA_ROOT", "data"))
-    except Exception:
+    """Resolve the configured DATA_ROOT safely (once per app/request context)."""
+    if not has_app_context():
         return Path("data")
+    root = g.get(_DATA_ROOT_G_KEY)
+    if root is None:
+        root = Path(current_app.config.get("DATA_ROOT", "data"))
+        setattr(g, _DATA_ROOT_G_KEY, root)
+    return root
+
+
+def _data_relpath(path: str | os.PathLike[str], root: Path | None = None) -> str:
+    """Return ``path`` relative to DATA_ROOT (OS separators, as stored in settings).
+
+    Callers only pass paths built under the data root, so a pure prefix strip
+    replaces ``os.path.relpath`` and its cwd/abspath normalisation.
+    """
+    return str(Path(path).relative_to(root if root is not None else _data_root()))
 
 
 def _current_logo_file() -> Path | None:
@@ -1174,13 +1365,43 @@ def _ensure_logo_dir() -> Path:
     return path
 
 
+def _copy_logo(source: Path, dest: Path) -> None:
+    """Copy a logo into its ``*-current`` slot.
+
+    ``shutil.copyfile`` lets the OS copy the file (sendfile/copy_file_range on
+    Linux) instead of reading it into memory first. A real copy, not a hard
+    link: later restores overwrite the current file in place and must not
+    change the history entry it came from.
+    """
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    try:
+        shutil.copyfile(source, dest)
+    except shutil.SameFileError:
+        pass
+
+
 def _suggest_theme_colors_from_logo(logo_path: Path) -> tuple[str, str, str]:
     """Derive (primary, accent, brand) colors from a logo image.
 
     Kept intentionally simple and conservative: we pick the most frequent
-    non-grey color and derive a lighter accent variant from it.
+    non-grey color and derive a lighter accent variant from it. Results are
+    memoized per file version (mtime and size), so repeated clicks on an
+    unchanged logo skip decoding it again.
     """
-    if Image is None:
+    try:
+        stat = logo_path.stat()
+    except OSError as exc:  # pragma: no cover - defensive
+        raise RuntimeError(f"Cannot open logo: {exc}")
+    return _suggest_theme_colors_cached(str(logo_path), stat.st_mtime_ns, stat.st_size)
+
+
+@lru_cache(maxsize=8)
+def _suggest_theme_colors_cached(logo_path: str, mtime_ns: int, size: int) -> tuple[str, str, str]:
+    """Cached body of ``_suggest_theme_colors_from_logo``; keyed by file version."""
+    # Imported here: Pillow is only needed for this logo helper.
+    try:
+        from PIL import Image  # type: ignore
+    except Exception:  # pragma: no cover
         raise RuntimeError("Pillow is not installed. Install it to auto-pick colors from a logo.")
     try:
         img = Image.open(logo_path).convert("RGBA")
@@ -1191,31 +1412,28 @@ def _suggest_theme_colors_from_logo(logo_path: Path) -> tuple[str, str, str]:
     img = img.resize((64, 64))
     colors = img.getcolors(64 * 64) or []
 
-    def is_valid_color(r: int, g: int, b: int, a: int) -> bool:
-        # Skip transparent and near-black / near-white
-        if a < 40:
-            return False
-        brightness = (r + g + b) / 3.0
-        if brightness < 20 or brightness > 245:
-            return False
-        # Skip very dull greys
-        if max(abs(r - g), abs(r - b), abs(g - b)) < 12:
-            return False
-        return True
-
-    candidates: list[tuple[int, tuple[int, int, int]]] = []
-    for count, rgba in colors:
-        r, g, b, a = rgba
-        if is_valid_color(r, g, b, a):
-            candidates.append((count, (r, g, b)))
+    # One pass over the distinct colors, keeping the most frequent valid one
+    # (first seen wins ties, as with the previous stable sort). Skips
+    # transparent, near-black / near-white (brightness checked as the integer
+    # channel sum, i.e. average 20..245) and very dull greys.
+    best_count = 0
+    best_rgb: tuple[int, int, int] | None = None
+    for count, (red, green, blue, alpha) in colors:
+        if count <= best_count or alpha < 40:
+            continue
+        total = red + green + blue
+        if total < 60 or total > 735:
+            continue
+        if max(abs(red - green), abs(red - blue), abs(green - blue)) < 12:
+            continue
+        best_count, best_rgb = count, (red, green, blue)
 
-    if not candidates:
+    if best_rgb is None:
         # Fallback to safe defaults
         return "#3b82f6", "#0ea5e9", "#d4a74a"
 
     # Most frequent candidate is our base brand color
-    candidates.sort(key=lambda x: x[0], reverse=True)
-    base_r, base_g, base_b = candidates[0][1]
+    base_r, base_g, base_b = best_rgb
 
     def to_hex(r: int, g: int, b: int) -> str:
         return f"#{r:02x}{g:02x}{b:02x}"
@@ -1248,6 +1466,33 @@ def _suggest_theme_colors_from_logo(logo_path: Path) -> tuple[str, str, str]:
     return primary_hex, accent_hex, brand_hex
 
 
+_LOGO_MAX_BYTES = 2 * 1024 * 1024
+# Room for the multipart boundaries, part headers and the CSRF field around the file.
+_LOGO_FORM_OVERHEAD = 64 * 1024
+_LOGO_TOO_LARGE_ERROR = "Logo is too large (max 2MB)."
+
+
+def _logo_request_too_large() -> bool:
+    """Reject oversized upload bodies before Werkzeug parses and spools the form."""
+    total = request.content_length
+    return total is not None and total > _LOGO_MAX_BYTES + _LOGO_FORM_OVERHEAD
+
+
+def _logo_too_large(file) -> bool:
+    """Size guard for logo uploads.
+
+    When the whole request body is within the limit the file must be too, so
+    the spooled upload is only seeked to measure it for larger requests.
+    """
+    total = request.content_length
+    if total is not None and total <= _LOGO_MAX_BYTES:
+        return False
+    file.stream.seek(0, 2)
+    size = file.stream.tell()
+    file.stream.seek(0)
+    return bool(size and size > _LOGO_MAX_BYTES)
+
+
 def _save_logo_file(file) -> tuple[bool, str | list[str]]:
     """Save uploaded logo to history and set current logo path. Returns (ok, errors or rel_path)."""
     ext = Path(file.filename).suffix.lower()
@@ -1255,11 +1500,8 @@ def _save_logo_file(file) -> tuple[bool, str | list[str]]:
         return False, ["Logo must be a PNG or JPG image."]
 
     # Enforce a simple size guard (max ~2MB)
-    file.stream.seek(0, 2)
-    size = file.stream.tell()
-    file.stream.seek(0)
-    if size and size > 2 * 1024 * 1024:
-        return False, ["Logo is too large (max 2MB)."]
+    if _logo_too_large(file):
+        return False, [_LOGO_TOO_LARGE_ERROR]
 
     dest_dir = _ensure_logo_dir()
     ts = datetime.utcnow().strftime("%Y%m%d-%H%M%S")
@@ -1270,10 +1512,9 @@ def _save_logo_file(file) -> tuple[bool, str | list[str]]:
     try:
         file.save(history_path)
         # Copy to current logo
-        current_path.parent.mkdir(parents=True, exist_ok=True)
-        current_path.write_bytes(history_path.read_bytes())
+        _copy_logo(history_path, current_path)
         # Store relative path for serving (use relative to DATA_ROOT)
-        rel_path = os.path.relpath(current_path, _data_root())
+        rel_path = _data_relpath(current_path)
         set_setting("logo_path", rel_path, category="logo")
         return True, rel_path
     except Exception as exc:
@@ -1305,8 +1546,8 @@ def _auto_find_logo(kind: str = "logo") -> str | None:
     for path in candidates:
         if path.exists():
             try:
-                return os.path.relpath(path, root)
-            except Exception:
+                return _data_relpath(path, root)
+            except ValueError:
                 return str(path)
     return None
 
@@ -1316,11 +1557,8 @@ def _save_pdf_logo_file(file) -> tuple[bool, str | list[str]]:
     ext = Path(file.filename).suffix.lower()
     if ext not in {".png", ".jpg", ".jpeg"}:
         return False, ["Logo must be a PNG or JPG image."]
-    file.stream.seek(0, 2)
-    size = file.stream.tell()
-    file.stream.seek(0)
-    if size and size > 2 * 1024 * 1024:
-        return False, ["Logo is too large (max 2MB)."]
+    if _logo_too_large(file):
+        return False, [_LOGO_TOO_LARGE_ERROR]
 
     dest_dir = _ensure_pdf_logo_dir()
     ts = datetime.utcnow().strftime("%Y%m%d-%H%M%S")
@@ -1330,9 +1568,8 @@ def _save_pdf_logo_file(file) -> tuple[bool, str | list[str]]:
 
     try:
         file.save(history_path)
-        current_path.parent.mkdir(parents=True, exist_ok=True)
-        current_path.write_bytes(history_path.read_bytes())
-        rel_path = os.path.relpath(current_path, _data_root())
+        _copy_logo(history_path, current_path)
+        rel_path = _data_relpath(current_path)
         set_setting("pdf_logo_path", rel_path, category="logo")
         return True, rel_path
     except Exception as exc:
@@ -1340,35 +1577,34 @@ def _save_pdf_logo_file(file) -> tuple[bool, str | list[str]]:
 
 
 def _list_logo_history(base: Path, prefix: str) -> list[dict[str, str]]:
+    """List saved ``{prefix}-*`` logos under ``base``, newest first by mtime."""
+    marker = f"{prefix}-"
+    try:
+        with os.scandir(base) as it:
+            entries = [
+                (entry.stat().st_mtime_ns, entry.name, entry.path)
+                for entry in it
+                if entry.name.startswith(marker) and "." in entry.name[len(marker):] and entry.is_file()
+            ]
+    except FileNotFoundError:
+        return []
+    entries.sort(reverse=True)
+    data_root = _data_root()
     items: list[dict[str, str]] = []
-    if not base.exists():
-        return items
-    for path in sorted(base.glob(f"{prefix}-*.*")):
-        label = path.stem.replace(f"{prefix}-", "")
+    for _mtime, name, path in entries:
+        label = Path(name).stem.replace(marker, "")
         try:
-            rel_str = os.path.relpath(path, _data_root())
-        except Exception:
-            rel_str = str(path.name)
+            rel_str = _data_relpath(path, data_root)
+        except ValueError:
+            rel_str = name
         items.append({"label": label, "path": rel_str})
-    return list(reversed(items))  # newest first
+    return items
 
 
 def _list_pdf_logo_history() -> list[dict[str, str]]:
     return _list_logo_history(_pdf_logo_dir(), "pdf-logo")
 
 
-def _list_logo_history() -> list[dict[str, str]]:
-    """List saved logos in history with label and path."""
-    items: list[dict[str, str]] = []
-    base = _logo_dir()
-    if not base.exists():
-        return items
-    for path in sorted(base.glob("logo-*.*")):
-        label = path.stem.replace("logo-", "")
-        items.append({"label": label, "path": str(path.relative_to(_data_root()))})
-    return list(reversed(items))  # newest first
-
-
 @bp.route("/theme/update", methods=["POST"])
 @bp.route("/settings/theme/update", methods=["POST"])
 @csrf.exempt
@@ -1448,42 +1684,39 @@ def update_theme_settings():
     if errors:
         return jsonify({"success": False, "errors": errors}), 400
 
+    # Collected and written in one transaction instead of one commit per key.
+    updates: list[tuple[str, str, str]] = []
     if apply_colors:
-        if primary:
-            set_setting("primary_color", primary, category="colors")
-        if accent:
-            set_setting("accent_color", accent, category="colors")
-        if text_color:
-            set_setting("text_color", text_color, category="colors")
-        if btn_text_color:
-            set_setting("btn_text_color", btn_text_color, category="colors")
-        if metric_text_color:
-            set_setting("metric_text_color", metric_text_color, category="colors")
-        if page_bg_tint:
-            set_setting("page_bg_tint", page_bg_tint, category="colors")
-        if card_bg_tint:
-            set_setting("card_bg_tint", card_bg_tint, category="colors")
+        for key, value in (
+            ("primary_color", primary),
+            ("accent_color", accent),
+            ("text_color", text_color),
+            ("btn_text_color", btn_text_color),
+            ("metric_text_color", metric_text_color),
+            ("page_bg_tint", page_bg_tint),
+            ("card_bg_tint", card_bg_tint),
+        ):
+            if value:
+                updates.append((key, value, "colors"))
         if base_size:
-            set_setting("base_font_size", str(base_size), category="typography")
+            updates.append(("base_font_size", str(base_size), "typography"))
 
     if apply_branding:
-        set_setting("clinic_name", clinic_name, category="branding")
-        set_setting("clinic_name_enabled", "1" if clinic_name_enabled else "0", category="branding")
-        if clinic_brand_color:
-            set_setting("clinic_brand_color", clinic_brand_color, category="branding")
-        else:
-            set_setting("clinic_brand_color", "", category="branding")
-        set_setting("clinic_tagline", clinic_tagline, category="branding")
-        set_setting("clinic_tagline_enabled", "1" if clinic_tagline_enabled else "0", category="branding")
+        updates.append(("clinic_name", clinic_name, "branding"))
+        updates.append(("clinic_name_enabled", "1" if clinic_name_enabled else "0", "branding"))
+        updates.append(("clinic_brand_color", clinic_brand_color or "", "branding"))
+        updates.append(("clinic_tagline", clinic_tagline, "branding"))
+        updates.append(("clinic_tagline_enabled", "1" if clinic_tagline_enabled else "0", "branding"))
         if logo_scale_raw:
             # Clamp to guardrails 60–140
             try:
                 scale_val = int(float(logo_scale_raw))
                 scale_val = max(60, min(scale_val, 140))
-                set_setting("logo_scale", str(scale_val), category="branding")
+                updates.append(("logo_scale", str(scale_val), "branding"))
             except Exception:
-                set_setting("logo_scale", "100", category="branding")
+                updates.append(("logo_scale", "100", "branding"))
 
+    set_settings(updates)
     return jsonify({"success": True})
 
 
@@ -1517,6 +1750,17 @@ def theme_colors_from_logo():
     )
 
 
+# Logo URLs carrying ``_ts`` change whenever the logo does (``logo_version``:
+# file mtime in ns plus size), so browsers may keep them; bare URLs revalidate
+# via ETag/Last-Modified.
+_LOGO_MAX_AGE = 24 * 60 * 60
+
+
+def _send_logo(logo_path: Path):
+    max_age = _LOGO_MAX_AGE if request.args.get("_ts") else None
+    return send_file(logo_path, conditional=True, etag=True, max_age=max_age)
+
+
 @bp.route("/theme/logo", methods=["GET"])
 def theme_logo():
     """Serve the uploaded clinic logo if present."""
@@ -1528,7 +1772,7 @@ def theme_logo():
         # Clear stale setting so UI shows "no logo" again
         set_setting("logo_path", "", category="logo")
         abort(404)
-    return send_file(logo_path)
+    return _send_logo(logo_path)
 
 
 @bp.route("/theme/pdf_logo", methods=["GET"])
@@ -1561,7 +1805,7 @@ def theme_pdf_logo():
         set_setting("pdf_logo_path", "", category="logo")
         abort(404)
 
-    return send_file(logo_path)
+    return _send_logo(logo_path)
 
 
 @bp.route("/theme/logo/upload", methods=["POST"])
@@ -1569,6 +1813,8 @@ def theme_pdf_logo():
 def upload_logo():
     """Upload a clinic logo and store its relative path in theme settings."""
     try:
+        if _logo_request_too_large():
+            return jsonify({"success": False, "errors": [_LOGO_TOO_LARGE_ERROR]}), 400
         file = request.files.get("logo")
         if not file or not file.filename:
             return jsonify({"success": False, "errors": ["No file uploaded."]}), 400
@@ -1580,7 +1826,7 @@ def upload_logo():
         return jsonify(
             {
                 "success": True,
-                "logo_url": url_for("admin_settings.theme_logo", _ts=int(datetime.utcnow().timestamp())),
+                "logo_url": url_for("admin_settings.theme_logo", _ts=logo_version(res)),
             }
         )
     except Exception as exc:
@@ -1612,14 +1858,13 @@ def select_logo():
     ext = source.suffix.lower()
     current_path = _data_root() / "theme" / f"logo-current{ext}"
     try:
-        current_path.parent.mkdir(parents=True, exist_ok=True)
-        current_path.write_bytes(source.read_bytes())
-        rel = os.path.relpath(current_path, _data_root())
+        _copy_logo(source, current_path)
+        rel = _data_relpath(current_path)
         set_setting("logo_path", rel, category="logo")
         return jsonify(
             {
                 "success": True,
-                "logo_url": url_for("admin_settings.theme_logo", _ts=int(datetime.utcnow().timestamp())),
+                "logo_url": url_for("admin_settings.theme_logo", _ts=logo_version(rel)),
             }
         )
     except Exception as exc:
@@ -1639,11 +1884,15 @@ def reset_theme_defaults():
     Branding (clinic name, tagline, logo, scale) is not changed here.
     """
     try:
-        set_setting("primary_color", "#3b82f6", category="colors")
-        set_setting("accent_color", "#0ea5e9", category="colors")
-        set_setting("text_color", "#111827", category="colors")
-        set_setting("btn_text_color", "", category="colors")
-        set_setting("base_font_size", "16", category="typography")
+        set_settings(
+            [
+                ("primary_color", "#3b82f6", "colors"),
+                ("accent_color", "#0ea5e9", "colors"),
+                ("text_color", "#111827", "colors"),
+                ("btn_text_color", "", "colors"),
+                ("base_font_size", "16", "typography"),
+            ]
+        )
         return jsonify({"success": True})
     except Exception as exc:
         return jsonify({"success": False, "errors": [str(exc)]}), 500
@@ -1666,6 +1915,8 @@ def logo_history():
 def upload_pdf_logo():
     """Upload a PDF-specific clinic logo."""
     try:
+        if _logo_request_too_large():
+            return jsonify({"success": False, "errors": [_LOGO_TOO_LARGE_ERROR]}), 400
         file = request.files.get("logo")
         if not file or not file.filename:
             return jsonify({"success": False, "errors": ["No file uploaded."]}), 400
@@ -1677,7 +1928,7 @@ def upload_pdf_logo():
         return jsonify(
             {
                 "success": True,
-                "logo_url": url_for("admin_settings.theme_pdf_logo", _ts=int(datetime.utcnow().timestamp())),
+                "logo_url": url_for("admin_settings.theme_pdf_logo", _ts=logo_version(res)),
             }
         )
     except Exception as exc:
@@ -1708,9 +1959,8 @@ def select_pdf_logo():
     ext = source.suffix.lower()
     current_path = _data_root() / "theme" / f"pdf-logo-current{ext}"
     try:
-        current_path.parent.mkdir(parents=True, exist_ok=True)
-        current_path.write_bytes(source.read_bytes())
-        rel = os.path.relpath(current_path, _data_root())
+        _copy_logo(source, current_path)
+        rel = _data_relpath(current_path)
         set_setting("pdf_logo_path", rel, category="logo")
         return jsonify({"success": True})
     except Exception as exc:
@@ -1727,6 +1977,34 @@ def pdf_logo_history():
     return jsonify({"success": True, "logo_history": history})
 
 
+_UPLOAD_COPY_CHUNK = 1 << 20
+
+
+def _write_upload(upload, tmp) -> None:
+    """Copy an uploaded import file into its open temp file in 1 MiB chunks, then close it.
+
+    Writing through the handle ``NamedTemporaryFile`` returned avoids reopening
+    the path, and the larger chunks cut syscalls on big workbooks.
+    """
+    shutil.copyfileobj(upload.stream, tmp, _UPLOAD_COPY_CHUNK)
+    tmp.close()
+
+
+@contextmanager
+def _uploaded_import_file(upload, suffix: str) -> Iterator[Path]:
+    """Yield a temp copy of an uploaded import file for analysis.
+
+    The file sits in its own ``TemporaryDirectory`` outside the data folder, so
+    one cleanup removes it on every exit path; cleanup errors (e.g. a handle a
+    reader still holds on Windows) are ignored instead of raised.
+    """
+    with tempfile.TemporaryDirectory(prefix="clinic-import-", ignore_cleanup_errors=True) as tmp_dir:
+        tmp_path = Path(tmp_dir) / f"upload{suffix}"
+        with open(tmp_path, "wb") as fh:
+            _write_upload(upload, fh)
+        yield tmp_path
+
+
 @bp.route("/settings/data-import/first-stable/preview", methods=["POST"])
 @require_permission("admin.user.manage")
 def preview_first_stable_import():
@@ -1735,6 +2013,8 @@ def preview_first_stable_import():
 
     The frontend uses multipart/form-data when a user uploads a file.
     """
+    from clinic_app.services.import_first_stable import analyze_first_stable_excel, analyze_import_csv_template
+
     # CSRF validation for both JSON and multipart form requests.
     if request.content_type and request.content_type.startswith("multipart/"):
         data = {"csrf_token": request.form.get("csrf_token") or request.headers.get("X-CSRFToken")}
@@ -1755,9 +2035,6 @@ def preview_first_stable_import():
 
     # Use an uploaded Excel/CSV file – save to a temporary location outside
     # the app's data folder, analyse it, then remove the temp file.
-    import tempfile
-    import os
-
     suffix = Path(upload.filename).suffix or ".xlsx"
     suffix_lower = suffix.lower()
     if suffix_lower not in {".xlsx", ".xlsm", ".csv"}:
@@ -1770,14 +2047,12 @@ def preview_first_stable_import():
             ),
             400,
         )
-    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
-    tmp_path = Path(tmp.name)
     try:
-        upload.save(tmp_path)
-        if suffix_lower == ".csv":
-            preview = analyze_import_csv_template(tmp_path, max_preview_rows=10000, mode=analyze_mode)
-        else:
-            preview = analyze_first_stable_excel(tmp_path, max_preview_rows=10000, mode=analyze_mode)
+        with _uploaded_import_file(upload, suffix) as tmp_path:
+            if suffix_lower == ".csv":
+                preview = analyze_import_csv_template(tmp_path, max_preview_rows=10000, mode=analyze_mode)
+            else:
+                preview = analyze_first_stable_excel(tmp_path, max_preview_rows=10000, mode=analyze_mode)
     except FileNotFoundError:
         return (
             jsonify(
@@ -1802,15 +2077,6 @@ def preview_first_stable_import():
                 400,
             )
         return jsonify({"success": False, "errors": [str(exc)]}), 500
-    finally:
-        try:
-            tmp.close()
-        except Exception:
-            pass
-        try:
-            os.unlink(tmp_path)
-        except Exception:
-            pass
 
     counts = preview.get("counts") or {}
     rows = preview.get("rows") or []
@@ -1847,17 +2113,7 @@ def preview_first_stable_import():
     )
 
 
-@bp.route("/settings/data-import/template.csv", methods=["GET"])
-@require_permission("admin.user.manage")
-def download_import_template():
-    """
-    Download a simple CSV template other clinics can fill with their data.
-
-    This does not depend on the legacy Excel structure and is intended as the
-    long-term, clinic-friendly import format.
-    """
-    import csv
-
+def _build_import_template_csv() -> bytes:
     buf = io.StringIO()
     writer = csv.writer(buf)
     writer.writerow(
@@ -1898,13 +2154,33 @@ def download_import_template():
             "Any Doctor",
         ]
     )
-    buf.seek(0)
+    return buf.getvalue().encode("utf-8-sig")
+
+
+# The template never changes at runtime, so it is built once at import and
+# served with a fixed Last-Modified/ETag that lets browsers revalidate it.
+_IMPORT_TEMPLATE_CSV = _build_import_template_csv()
+_IMPORT_TEMPLATE_MODIFIED = datetime.now(timezone.utc).replace(microsecond=0)
+_IMPORT_TEMPLATE_ETAG = hashlib.sha1(_IMPORT_TEMPLATE_CSV).hexdigest()
+
+
+@bp.route("/settings/data-import/template.csv", methods=["GET"])
+@require_permission("admin.user.manage")
+def download_import_template():
+    """
+    Download a simple CSV template other clinics can fill with their data.
 
+    This does not depend on the legacy Excel structure and is intended as the
+    long-term, clinic-friendly import format.
+    """
     return send_file(
-        io.BytesIO(buf.read().encode("utf-8-sig")),
+        io.BytesIO(_IMPORT_TEMPLATE_CSV),
         mimetype="text/csv",
         as_attachment=True,
         download_name="clinic-import-template.csv",
+        conditional=True,
+        etag=_IMPORT_TEMPLATE_ETAG,
+        last_modified=_IMPORT_TEMPLATE_MODIFIED,
     )
 
 
@@ -1917,38 +2193,23 @@ def export_payments_csv():
     conn = db_sqlite()
     # We prefer all page numbers from patient_pages; if that table is empty/missing,
     # fall back to patients.primary_page_number when available.
-    has_patient_pages = False
-    try:
-        has_patient_pages = (
-            conn.execute(
-                "SELECT 1 FROM sqlite_master WHERE type='table' AND name='patient_pages' LIMIT 1"
-            ).fetchone()
-            is not None
-        )
-    except Exception:
-        has_patient_pages = False
-
-    has_primary_page_number = False
-    try:
-        has_primary_page_number = (
-            conn.execute("SELECT 1 FROM pragma_table_info('patients') WHERE name='primary_page_number' LIMIT 1")
-            .fetchone()
-            is not None
-        )
-    except Exception:
-        has_primary_page_number = False
+    has_patient_pages, has_primary_page_number = _schema_flags(conn)
 
     if has_patient_pages:
-        pages_expr = """
-        (
-          SELECT GROUP_CONCAT(page_number, ', ')
-            FROM (SELECT page_number
-                    FROM patient_pages
-                   WHERE patient_id = p.id
-                   ORDER BY page_number)
-        )
+        # Aggregate every patient's pages once and join the result, rather than
+        # re-running a correlated GROUP_CONCAT for each payment row.
+        pages_join = """
+          LEFT JOIN (
+            SELECT patient_id, GROUP_CONCAT(page_number, ', ') AS pages
+              FROM (SELECT patient_id, page_number
+                      FROM patient_pages
+                     ORDER BY patient_id, page_number)
+             GROUP BY patient_id
+          ) pp ON pp.patient_id = p.id
         """
+        pages_expr = "pp.pages"
     else:
+        pages_join = ""
         pages_expr = "NULL"
 
     if has_primary_page_number:
@@ -1956,77 +2217,97 @@ def export_payments_csv():
     else:
         page_numbers_expr = f"COALESCE({pages_expr}, '')"
 
-    rows = conn.execute(
-        f"""
-      SELECT pay.id, p.short_id, p.full_name, p.phone,
-             {page_numbers_expr} AS page_numbers,
-             pay.paid_at, pay.amount_cents, pay.method, pay.note,
-             pay.treatment, pay.remaining_cents, pay.total_amount_cents,
-             pay.examination_flag, pay.followup_flag, pay.discount_cents,
-             pay.doctor_id, pay.doctor_label
-      FROM payments pay JOIN patients p ON p.id = pay.patient_id
-      ORDER BY pay.paid_at IS NULL, pay.paid_at ASC
-    """,
-    ).fetchall()
-    conn.close()
+    try:
+        rows = conn.execute(
+            f"""
+          SELECT pay.id, p.short_id, p.full_name, p.phone,
+                 {page_numbers_expr} AS page_numbers,
+                 pay.paid_at, pay.amount_cents, pay.method, pay.note,
+                 pay.treatment, pay.remaining_cents, pay.total_amount_cents,
+                 pay.examination_flag, pay.followup_flag, pay.discount_cents,
+                 pay.doctor_id, pay.doctor_label
+          FROM payments pay JOIN patients p ON p.id = pay.patient_id
+          {pages_join}
+          ORDER BY pay.paid_at IS NULL, pay.paid_at ASC
+        """,
+        )
+    except Exception:
+        conn.close()
+        raise
+
+    def generate():
+        # Rows are read from the cursor and flushed in ~64KB chunks, so the
+        # export never holds the whole table (or the whole CSV) in memory.
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+
+        def drain() -> str:
+            chunk = buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+            return chunk
 
-    buf = io.StringIO()
-    writer = csv.writer(buf)
-    writer.writerow(
-        [
-            "file_number",
-            "page_number",
-            "full_name",
-            "phone",
-            "date",
-            "total_amount",
-            "paid_today",
-            "remaining",
-            "visit_type",
-            "treatment_type",
-            "notes",
-            # Optional columns (safe to ignore on import)
-            "method",
-            "discount",
-            "doctor_label",
-            "payment_id",
-        ]
-    )
-    for row in rows:
-        total_cents = row["total_amount_cents"] or 0
-        discount_cents = row["discount_cents"] or 0
-        paid_cents = row["amount_cents"] or 0
-        remaining_cents = row["remaining_cents"]
-        if remaining_cents is None:
-            remaining_cents = max(total_cents - discount_cents - paid_cents, 0)
-        visit_type = "exam" if (row["examination_flag"] or 0) == 1 else ("followup" if (row["followup_flag"] or 0) == 1 else "")
         writer.writerow(
             [
-                row["short_id"] or "",
-                row["page_numbers"] or "",
-                row["full_name"],
-                row["phone"] or "",
-                row["paid_at"] or "",
-                money(total_cents),
-                money(paid_cents),
-                money(int(remaining_cents or 0)),
-                visit_type,
-                row["treatment"] or "",
-                row["note"] or "",
-                row["method"] or "",
-                money(discount_cents),
-                row["doctor_label"] or ANY_DOCTOR_LABEL,
-                row["id"],
+                "file_number",
+                "page_number",
+                "full_name",
+                "phone",
+                "date",
+                "total_amount",
+                "paid_today",
+                "remaining",
+                "visit_type",
+                "treatment_type",
+                "notes",
+                # Optional columns (safe to ignore on import)
+                "method",
+                "discount",
+                "doctor_label",
+                "payment_id",
             ]
         )
-    buf.seek(0)
+        yield "\ufeff" + drain()
+        for row in rows:
+            total_cents = row["total_amount_cents"] or 0
+            discount_cents = row["discount_cents"] or 0
+            paid_cents = row["amount_cents"] or 0
+            remaining_cents = row["remaining_cents"]
+            if remaining_cents is None:
+                remaining_cents = max(total_cents - discount_cents - paid_cents, 0)
+            visit_type = "exam" if (row["examination_flag"] or 0) == 1 else ("followup" if (row["followup_flag"] or 0) == 1 else "")
+            writer.writerow(
+                [
+                    row["short_id"] or "",
+                    row["page_numbers"] or "",
+                    row["full_name"],
+                    row["phone"] or "",
+                    row["paid_at"] or "",
+                    money(total_cents),
+                    money(paid_cents),
+                    money(int(remaining_cents or 0)),
+                    visit_type,
+                    row["treatment"] or "",
+                    row["note"] or "",
+                    row["method"] or "",
+                    money(discount_cents),
+                    row["doctor_label"] or ANY_DOCTOR_LABEL,
+                    row["id"],
+                ]
+            )
+            if buf.tell() >= 64 * 1024:
+                yield drain()
+        tail = drain()
+        if tail:
+            yield tail
+
     ts = datetime.now().strftime("%Y%m%d-%H%M")
-    return send_file(
-        io.BytesIO(buf.read().encode("utf-8-sig")),
-        mimetype="text/csv",
-        as_attachment=True,
-        download_name=f"clinic-payments-{ts}.csv",
-    )
+    response = Response(stream_with_context(generate()), mimetype="text/csv")
+    response.headers["Content-Disposition"] = f'attachment; filename="clinic-payments-{ts}.csv"'
+    # The response owns the connection: this runs after the generator is closed,
+    # whether it finished, was abandoned mid-stream or never started.
+    response.call_on_close(conn.close)
+    return response
 
 
 def _db_file_path() -> Path:
@@ -2048,42 +2329,57 @@ def _create_db_backup() -> Path:
     ts = datetime.now().strftime("%Y%m%d-%H%M%S")
     backup_path = backup_dir / f"app-{ts}.db"
 
-    # Use SQLite's backup API instead of copying the file, because Windows can
-    # lock open database files during runtime.
+    # Let SQLite write the copy instead of copying the file, because Windows can
+    # lock open database files during runtime. VACUUM INTO writes a compacted
+    # snapshot in one statement; the backup API covers older SQLite builds and
+    # a target that already exists (VACUUM INTO refuses to overwrite).
     src = sqlite3.connect(str(db_path))
     try:
-        dst = sqlite3.connect(str(backup_path))
         try:
-            src.backup(dst)
-        finally:
-            dst.close()
+            src.execute("VACUUM INTO ?", (str(backup_path),))
+        except sqlite3.OperationalError:
+            dst = sqlite3.connect(str(backup_path))
+            try:
+                src.backup(dst)
+            finally:
+                dst.close()
     finally:
         src.close()
     return backup_path
 
 
-def _patient_pages_table_exists(conn: sqlite3.Connection) -> bool:
+_SCHEMA_FLAGS_CACHE_KEY = "admin_settings.schema_flags"
+
+
+def _schema_flags(conn: sqlite3.Connection) -> tuple[bool, bool]:
+    """Return (patient_pages table exists, patients.primary_page_number exists).
+
+    Both are probed in one query and remembered for the app's lifetime: the
+    schema only changes through migrations and restores, which run at startup.
+    The import loops ask these once per row.
+    """
+    cached = current_app.extensions.get(_SCHEMA_FLAGS_CACHE_KEY)
+    if cached is not None:
+        return cached
     try:
-        return (
-            conn.execute(
-                "SELECT 1 FROM sqlite_master WHERE type='table' AND name='patient_pages' LIMIT 1"
-            ).fetchone()
-            is not None
-        )
+        row = conn.execute(
+            """
+            SELECT EXISTS(SELECT 1 FROM sqlite_master WHERE type='table' AND name='patient_pages'),
+                   EXISTS(SELECT 1 FROM pragma_table_info('patients') WHERE name='primary_page_number')
+            """
+        ).fetchone()
     except Exception:
-        return False
+        return False, False
+    cached = current_app.extensions[_SCHEMA_FLAGS_CACHE_KEY] = (bool(row[0]), bool(row[1]))
+    return cached
+
+
+def _patient_pages_table_exists(conn: sqlite3.Connection) -> bool:
+    return _schema_flags(conn)[0]
 
 
 def _patients_primary_page_column_exists(conn: sqlite3.Connection) -> bool:
-    try:
-        return (
-            conn.execute(
-                "SELECT 1 FROM pragma_table_info('patients') WHERE name='primary_page_number' LIMIT 1"
-            ).fetchone()
-            is not None
-        )
-    except Exception:
-        return False
+    return _schema_flags(conn)[1]
 
 
 def _split_page_numbers(raw: str) -> list[str]:
@@ -2094,6 +2390,12 @@ def _split_page_numbers(raw: str) -> list[str]:
     parts = [p.strip() for p in txt.replace("،", ",").split(",")]
     return [p for p in parts if p]
 
+
+# Arabic-Indic digits (U+0660..U+0669) to ASCII, and the first run of digits.
+_ARABIC_INDIC_DIGITS = str.maketrans("٠١٢٣٤٥٦٧٨٩", "0123456789")
+_FIRST_NUMBER_RE = re.compile(r"(\d+)")
+
+
 def _first_page_number_token(raw: str) -> str:
     """Best-effort: return the first numeric page token (normalised), for identity matching.
 
@@ -2102,33 +2404,22 @@ def _first_page_number_token(raw: str) -> str:
     txt = (raw or "").strip()
     if not txt:
         return ""
-    txt = txt.translate(
-        str.maketrans(
-            {
-                "٠": "0",
-                "١": "1",
-                "٢": "2",
-                "٣": "3",
-                "٤": "4",
-                "٥": "5",
-                "٦": "6",
-                "٧": "7",
-                "٨": "8",
-                "٩": "9",
-            }
-        )
-    )
-    m = re.search(r"(\d+)", txt)
+    txt = txt.translate(_ARABIC_INDIC_DIGITS)
+    m = _FIRST_NUMBER_RE.search(txt)
     if not m:
         return ""
     digits = (m.group(1) or "").lstrip("0")
     return digits or "0"
 
+
+_NON_DIGIT_RE = re.compile(r"\D+")
+
+
 def _normalize_file_number_token(raw: str) -> str:
     txt = (raw or "").strip()
     if not txt:
         return ""
-    digits = "".join(ch for ch in txt if ch.isdigit())
+    digits = _NON_DIGIT_RE.sub("", txt)
     if not digits:
         return ""
     digits = digits.lstrip("0")
@@ -2165,8 +2456,13 @@ def _first_two_tokens(raw: str) -> str:
     return " ".join(parts[:2])
 
 
+def _first_two_name_key(raw: str | None) -> str:
+    """Grouping key for duplicate detection: the first two normalised name tokens."""
+    return _first_two_tokens(_normalize_db_name(raw or ""))
+
+
 def _normalize_db_phone(raw: str) -> str:
-    return "".join(ch for ch in (raw or "") if ch.isdigit())
+    return _NON_DIGIT_RE.sub("", raw or "")
 
 
 def _db_duplicate_groups(
@@ -2199,16 +2495,27 @@ def _db_duplicate_groups(
         cols = "id, short_id, full_name, phone"
         if has_primary:
             cols += ", primary_page_number"
-        rows = conn.execute(f"SELECT {cols} FROM patients ORDER BY full_name").fetchall()
+        # Name keys are computed in SQLite (via a Python UDF, so normalisation
+        # matches the import side) and single-member groups are filtered out
+        # there; Python only builds candidates for names that repeat.
+        conn.create_function("first_two_name", 1, _first_two_name_key, deterministic=True)
+        rows = conn.execute(
+            f"""
+            SELECT * FROM (
+              SELECT k.*, COUNT(*) OVER (PARTITION BY k.first_two) AS group_size
+                FROM (SELECT {cols}, first_two_name(full_name) AS first_two FROM patients) k
+               WHERE k.first_two != ''
+            )
+             WHERE group_size >= 2
+             ORDER BY full_name
+            """
+        ).fetchall()
     finally:
         conn.close()
 
     groups: dict[str, list[dict[str, str]]] = {}
     for r in rows:
-        name_norm = _normalize_db_name(r["full_name"] or "")
-        first_two = _first_two_tokens(name_norm)
-        if not first_two:
-            continue
+        first_two = r["first_two"]
         cand = {
             "id": r["id"],
             "short_id": r["short_id"] or "",
@@ -2323,23 +2630,26 @@ def _merge_patient_pages_for_merge(conn: sqlite3.Connection, *, source_id: str,
     except Exception:
         rows = []
 
+    # Diff against the target's pages once instead of probing per source row.
+    existing = {
+        r[0]
+        for r in conn.execute(
+            "SELECT page_number FROM patient_pages WHERE patient_id=?",
+            (target_id,),
+        )
+    }
+    to_insert = []
     for r in rows:
         page_number = (r["page_number"] or "").strip()
-        if not page_number:
-            continue
-        exists = conn.execute(
-            "SELECT 1 FROM patient_pages WHERE patient_id=? AND page_number=? LIMIT 1",
-            (target_id, page_number),
-        ).fetchone()
-        if exists:
-            continue
-        try:
-            conn.execute(
-                "INSERT INTO patient_pages (id, patient_id, page_number, notebook_name) VALUES (?, ?, ?, ?)",
-                (str(uuid4()), target_id, page_number, r["notebook_name"]),
-            )
-        except Exception:
+        if not page_number or page_number in existing:
             continue
+        existing.add(page_number)
+        to_insert.append((str(uuid4()), target_id, page_number, r["notebook_name"]))
+    if to_insert:
+        conn.executemany(
+            "INSERT INTO patient_pages (id, patient_id, page_number, notebook_name) VALUES (?, ?, ?, ?)",
+            to_insert,
+        )
 
     try:
         conn.execute("DELETE FROM patient_pages WHERE patient_id=?", (source_id,))
@@ -2347,6 +2657,10 @@ def _merge_patient_pages_for_merge(conn: sqlite3.Connection, *, source_id: str,
         pass
 
 
+# Child tables cleared for the source patient once a DB-duplicate merge succeeds.
+_MERGE_CLEANUP_TABLES = ("diagnosis", "diagnosis_event", "medical", "medical_event")
+
+
 @bp.route("/settings/data-import/duplicates-db/merge", methods=["POST"])
 @require_permission("admin.user.manage")
 def merge_db_duplicate_patients():
@@ -2386,26 +2700,28 @@ def merge_db_duplicate_patients():
             # If target has no primary page number but source does, keep it.
             try:
                 if _patients_primary_page_column_exists(conn):
-                    tgt_page = conn.execute(
-                        "SELECT primary_page_number FROM patients WHERE id=?",
-                        (target_id,),
-                    ).fetchone()
-                    src_page = conn.execute(
-                        "SELECT primary_page_number FROM patients WHERE id=?",
-                        (source_id,),
-                    ).fetchone()
-                    if tgt_page and src_page:
-                        if not (tgt_page["primary_page_number"] or "").strip() and (src_page["primary_page_number"] or "").strip():
-                            conn.execute(
-                                "UPDATE patients SET primary_page_number=? WHERE id=?",
-                                (src_page["primary_page_number"], target_id),
-                            )
+                    conn.execute(
+                        """
+                        UPDATE patients
+                           SET primary_page_number = (
+                               SELECT s.primary_page_number FROM patients s WHERE s.id=?
+                           )
+                         WHERE id=?
+                           AND TRIM(COALESCE(primary_page_number, '')) = ''
+                           AND EXISTS (
+                               SELECT 1 FROM patients s
+                                WHERE s.id=? AND TRIM(COALESCE(s.primary_page_number, '')) <> ''
+                           )
+                        """,
+                        (source_id, target_id, source_id),
+                    )
             except Exception:
                 pass
 
             # After a successful merge, remove any remaining diagnosis/medical rows
             # for the source (if they were not moved) and delete the source patient.
-            for tbl in ("diagnosis", "diagnosis_event", "medical", "medical_event"):
+            # All of these run inside the merge's single transaction.
+            for tbl in _MERGE_CLEANUP_TABLES:
                 try:
                     cur.execute(f"DELETE FROM {tbl} WHERE patient_id=?", (source_id,))
                 except Exception:
@@ -2927,6 +3243,8 @@ def _insert_payment_row(
 @require_permission("admin.user.manage")
 def commit_data_import():
     """Import an uploaded file into the **main** clinic database (with backup)."""
+    from clinic_app.services.import_first_stable import extract_first_stable_payments, extract_import_csv_payments
+
     # CSRF validation for both JSON and multipart form requests.
     if request.content_type and request.content_type.startswith("multipart/"):
         data = {"csrf_token": request.form.get("csrf_token") or request.headers.get("X-CSRFToken")}
@@ -3007,7 +3325,7 @@ def commit_data_import():
     source_kind = "csv" if suffix_lower == ".csv" else "first_stable"
 
     try:
-        upload.save(tmp_path)
+        _write_upload(upload, tmp)
         if suffix_lower == ".csv":
             payments, counts = extract_import_csv_payments(tmp_path)
         else:
@@ -3414,7 +3732,7 @@ def download_import_report(name: str):
     if not report_path.exists():
         abort(404)
     return send_file(
-        io.BytesIO(report_path.read_bytes()),
+        report_path,
         mimetype="application/json",
         as_attachment=True,
         download_name=safe,
@@ -3480,6 +3798,8 @@ def import_report_meta(name: str):
 @require_permission("admin.user.manage")
 def preflight_data_import():
     """Dry-run import against the real DB (no writes)."""
+    from clinic_app.services.import_first_stable import extract_first_stable_payments, extract_import_csv_payments
+
     if request.content_type and request.content_type.startswith("multipart/"):
         data = {"csrf_token": request.form.get("csrf_token") or request.headers.get("X-CSRFToken")}
     else:
@@ -3505,38 +3825,24 @@ def preflight_data_import():
     import_zero_entries = _bool_from_value(raw_import_zero_entries) if raw_import_zero_entries is not None else True
     never_auto_merge = _bool_from_value(raw_never_auto_merge) if raw_never_auto_merge is not None else False
 
-    import tempfile
-    import os
-
     suffix = Path(upload.filename).suffix or ".xlsx"
     suffix_lower = suffix.lower()
     if suffix_lower not in {".xlsx", ".xlsm", ".csv"}:
         return jsonify({"success": False, "errors": [T("data_import_unsupported_file")]}), 400
 
-    tmp = tempfile.NamedTemporaryFile(delete=False, suffix=suffix)
-    tmp_path = Path(tmp.name)
     source_kind = "csv" if suffix_lower == ".csv" else "first_stable"
 
     try:
-        upload.save(tmp_path)
-        if suffix_lower == ".csv":
-            payments, counts = extract_import_csv_payments(tmp_path)
-        else:
-            payments, counts = extract_first_stable_payments(tmp_path)
+        with _uploaded_import_file(upload, suffix) as tmp_path:
+            if suffix_lower == ".csv":
+                payments, counts = extract_import_csv_payments(tmp_path)
+            else:
+                payments, counts = extract_first_stable_payments(tmp_path)
     except Exception as exc:
         msg = str(exc) or ""
         if "File is not a zip file" in msg or "BadZipFile" in msg:
             return jsonify({"success": False, "errors": [T("data_import_unsupported_file")]}), 400
         return jsonify({"success": False, "errors": [str(exc)]}), 500
-    finally:
-        try:
-            tmp.close()
-        except Exception:
-            pass
-        try:
-            os.unlink(tmp_path)
-        except Exception:
-            pass
 
     if not payments:
         return jsonify({"success": True, "message": T("data_import_no_rows"), "counts": counts, "result": {}})
@@ -3894,7 +4200,7 @@ def download_db_backup(name: str):
     if not backup_path.exists():
         abort(404)
     return send_file(
-        io.BytesIO(backup_path.read_bytes()),
+        backup_path,
         mimetype="application/octet-stream",
         as_attachment=True,
         download_name=safe,
@@ -3902,7 +4208,7 @@ def download_db_backup(name: str):
 
 
 def _restore_marker_path() -> Path:
-    return Path(current_app.config["DATA_ROOT"]) / "restore_pending.json"
+    return Path(current_app.config["DATA_ROOT"]) / RESTORE_MARKER_NAME
 
 
 @bp.route("/settings/db-backups/restore", methods=["POST"])
@@ -3937,7 +4243,7 @@ def restore_db_backup():
         return jsonify({"success": False, "errors": [f"{T('data_import_backup_failed')}: {exc}"]}), 500
 
     marker = {
-        "requested_at": datetime.now(timezone.utc).isoformat(),
+        "requested_at": _utcnow_iso(),
         "backup_name": name,
         "safety_backup_name": safety_backup.name,
     }
@@ -3982,7 +4288,7 @@ def get_user(user_id: str):
         # Load user with roles relationship
         user = session.execute(
             select(User).options(selectinload(User.roles)).where(User.id == user_id)
-        ).unique().scalars().one_or_none()
+        ).scalars().one_or_none()
 
         if not user:
             return jsonify({"success": False, "errors": ["User not found"]}), 404
@@ -4008,26 +4314,23 @@ def get_user(user_id: str):
 def get_role(role_id: int):
     """Get role data for editing via AJAX."""
     session = db.session()
-    try:
-        # Load role with permissions relationship
-        role = session.execute(
-            select(Role).options(selectinload(Role.permissions)).where(Role.id == role_id)
-        ).unique().scalars().one_or_none()
+    # Load role with permissions relationship
+    role = session.execute(
+        select(Role).options(*_ROLE_PERMISSIONS_ONLY).where(Role.id == role_id)
+    ).scalar_one_or_none()
 
-        if not role:
-            return jsonify({"success": False, "errors": ["Role not found"]}), 404
+    if not role:
+        return jsonify({"success": False, "errors": ["Role not found"]}), 404
 
-        return jsonify({
-            "success": True,
-            "role": {
-                "id": role.id,
-                "name": role.name,
-                "description": role.description,
-                "permissions": [perm.id for perm in role.permissions]
-            }
-        })
-    finally:
-        session.close()
+    return jsonify({
+        "success": True,
+        "role": {
+            "id": role.id,
+            "name": role.name,
+            "description": role.description,
+            "permissions": [perm.id for perm in role.permissions]
+        }
+    })
 
 
 # --- Patient Settings API ---
@@ -4279,7 +4582,7 @@ def _admin_setting_get(session, key: str) -> str | None:
         return None
 
 def _admin_setting_set(session, key: str, value: str, setting_type: str) -> None:
-    now = datetime.now(timezone.utc).isoformat()
+    now = _utcnow_iso()
     existing = None
     try:
         existing = session.execute(
@@ -17,6 +17,11 @@ from sqlalchemy.orm import scoped_session, sessionmaker
 from clinic_app.services.arabic_search import normalize_arabic
 
 
+def _py_lower(value: Any) -> Any:
+    """Unicode-aware ``lower()`` for SQL; SQLite's built-in only folds ASCII."""
+    return value.lower() if isinstance(value, str) else value
+
+
 class SQLAlchemyEngine:
     """Minimal SQLAlchemy integration for the app."""
 
@@ -41,6 +46,7 @@ class SQLAlchemyEngine:
 
             # Register custom Arabic normalization function for search
             dbapi_connection.create_function("normalize_arabic", 1, normalize_arabic)
+            dbapi_connection.create_function("py_lower", 1, _py_lower, deterministic=True)
 
         session_factory = sessionmaker(bind=self._engine, autoflush=False, future=True)
         self._session_factory = scoped_session(session_factory)
@@ -4,7 +4,7 @@ from __future__ import annotations
 
 from datetime import datetime, timezone
 from flask_login import UserMixin
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, Table, Text
+from sqlalchemy import Boolean, Column, ForeignKey, Index, Integer, String, Table, Text
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 from werkzeug.security import check_password_hash, generate_password_hash
 
@@ -159,6 +159,8 @@ role_permissions = Table(
         ForeignKey("permissions.id", ondelete="CASCADE"),
         primary_key=True,
     ),
+    # role_id lookups use the (role_id, permission_id) primary key.
+    Index("ix_role_permissions_permission_id", "permission_id"),
 )
 
 
@@ -167,6 +169,8 @@ user_roles = Table(
     Base.metadata,
     Column("user_id", String, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True),
     Column("role_id", Integer, ForeignKey("roles.id", ondelete="CASCADE"), primary_key=True),
+    # user_id lookups use the (user_id, role_id) primary key.
+    Index("ix_user_roles_role_id", "role_id"),
 )
 
 
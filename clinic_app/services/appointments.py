@@ -2,15 +2,21 @@
 
 from __future__ import annotations
 
-from datetime import datetime, timedelta, timezone
+import calendar
+from collections import namedtuple
+from functools import lru_cache
+from datetime import datetime, timedelta
+import re
 import sqlite3
+import time
 import uuid
-from typing import Sequence
+from typing import Iterator, Sequence
 
-from flask import current_app
+from flask import current_app, g
 
-from clinic_app.services.database import db
+from clinic_app.services.database import request_db
 from clinic_app.services.doctor_colors import (
+    DOCTOR_CHOICES_CACHE_KEY,
     get_doctor_colors,
     get_deleted_doctors,
     ANY_DOCTOR_ID,
@@ -22,6 +28,102 @@ from clinic_app.services.doctor_colors import (
 ISO_FMT = "%Y-%m-%dT%H:%M:%S"
 UPCOMING_THRESHOLD_SECONDS = 3600  # 1 hour threshold for "upcoming" status
 
+# SQL text is kept in module-level constants so every call hands sqlite3 the
+# exact same string and hits the connection's prepared-statement cache.
+SELECT_APPT_SQL = "SELECT * FROM appointments WHERE id=?"
+SELECT_APPT_ID_SQL = "SELECT id FROM appointments WHERE id=?"
+SELECT_PATIENT_SQL = "SELECT id, full_name, phone FROM patients WHERE id = ?"
+SELECT_PATIENT_LOOKUP_SQL = """
+    SELECT id, full_name, phone
+    FROM patients
+    WHERE short_id = ? COLLATE NOCASE OR full_name = ? COLLATE NOCASE
+    ORDER BY created_at DESC
+    LIMIT 1
+"""
+# starts_at_ts/ends_at_ts are trigger-maintained epoch copies (see bootstrap).
+SELECT_OVERLAP_SQL = """
+    SELECT id, title
+    FROM appointments
+    WHERE doctor_id = ?
+      AND starts_at_ts < ?
+      AND ends_at_ts > ?
+"""
+SELECT_OVERLAP_EXCL_SQL = SELECT_OVERLAP_SQL + " AND id != ?"
+# Writes carry the overlap probe in their own WHERE clause, so the check and
+# the write run as one statement; rowcount 0 means a conflict blocked it.
+_NO_OVERLAP_SQL = """
+    NOT EXISTS (
+        SELECT 1 FROM appointments
+        WHERE doctor_id = ? AND starts_at_ts < ? AND ends_at_ts > ? AND id != ?
+    )
+"""
+INSERT_APPT_SQL = """
+    INSERT INTO appointments(
+        id, patient_id, patient_name, patient_phone,
+        doctor_id, doctor_label, title, notes,
+        starts_at, ends_at, status, room, reminder_minutes, created_at, updated_at
+    )
+    SELECT ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'scheduled', ?, 0, datetime('now'), datetime('now')
+    WHERE""" + _NO_OVERLAP_SQL
+UPDATE_APPT_SQL = """
+    UPDATE appointments
+    SET patient_id=?,
+        patient_name=?,
+        patient_phone=?,
+        doctor_id=?,
+        doctor_label=?,
+        title=?,
+        notes=?,
+        starts_at=?,
+        ends_at=?,
+        updated_at=datetime('now')
+    WHERE id=? AND""" + _NO_OVERLAP_SQL
+MOVE_APPT_SQL = """
+    UPDATE appointments
+    SET doctor_id=?, doctor_label=?, starts_at=?, ends_at=?, updated_at=datetime('now')
+    WHERE id=? AND""" + _NO_OVERLAP_SQL
+UPDATE_STATUS_SQL = "UPDATE appointments SET status=?, updated_at=datetime('now') WHERE id=?"
+DELETE_APPT_SQL = "DELETE FROM appointments WHERE id=?"
+SELECT_APPT_WITH_SHORT_ID_SQL = """
+    SELECT a.*, p.short_id AS patient_short_id
+    FROM appointments a
+    LEFT JOIN patients p ON p.id = a.patient_id
+    WHERE a.id=?
+"""
+
+
+# Fixed column list for list_for_day so rows can be unpacked into a namedtuple
+# (C-level attribute access) instead of sqlite3.Row name lookups.
+_LIST_COLUMNS = (
+    "id",
+    "patient_id",
+    "patient_name",
+    "patient_phone",
+    "doctor_id",
+    "doctor_label",
+    "title",
+    "notes",
+    "starts_at",
+    "ends_at",
+    "status",
+    "room",
+    "starts_at_ts",
+    "ends_at_ts",
+)
+AppointmentRow = namedtuple("AppointmentRow", _LIST_COLUMNS + ("patient_short_id",))
+LIST_SELECT_SQL = (
+    "SELECT "
+    + ", ".join(f"a.{col}" for col in _LIST_COLUMNS)
+    + """, p.short_id AS patient_short_id
+    FROM appointments a
+    LEFT JOIN patients p ON p.id = a.patient_id
+    WHERE a.starts_at >= ?"""
+)
+
+
+def _appointment_row(cursor: sqlite3.Cursor, row: tuple) -> AppointmentRow:
+    return AppointmentRow(*row)
+
 
 class AppointmentError(Exception):
     """Base exception for appointment operations."""
@@ -35,18 +137,41 @@ class AppointmentNotFound(AppointmentError):
     """Raised when an appointment cannot be located."""
 
 
-def _format_clock_label(dt: datetime) -> str:
-    hour = dt.hour % 12 or 12
-    minute = dt.strftime("%M")
-    ampm = "PM" if dt.hour >= 12 else "AM"
-    return f"{hour}:{minute} {ampm}"
+def _parse_iso(value: str) -> datetime:
+    """Parse a fixed-width ``ISO_FMT`` string without going through strptime."""
+
+    return datetime(
+        int(value[0:4]),
+        int(value[5:7]),
+        int(value[8:10]),
+        int(value[11:13]),
+        int(value[14:16]),
+        int(value[17:19]),
+    )
+
+
+def _duration_minutes(starts_at: str, ends_at: str) -> int:
+    """Return whole minutes between two ``ISO_FMT`` strings."""
+
+    if starts_at[:10] == ends_at[:10]:
+        start_secs = int(starts_at[11:13]) * 3600 + int(starts_at[14:16]) * 60 + int(starts_at[17:19])
+        end_secs = int(ends_at[11:13]) * 3600 + int(ends_at[14:16]) * 60 + int(ends_at[17:19])
+        return (end_secs - start_secs) // 60
+    return int((_parse_iso(ends_at) - _parse_iso(starts_at)).total_seconds() // 60)
+
+
+@lru_cache(maxsize=1440)
+def _format_clock_label(hhmm: str) -> str:
+    """Format ``HH:MM`` as ``9:05 AM``; cached since a day has at most 1440 minutes."""
+    hour = int(hhmm[:2])
+    minute = int(hhmm[3:5])
+    ampm = "PM" if hour >= 12 else "AM"
+    return f"{hour % 12 or 12}:{minute:02d} {ampm}"
 
 
 def _slot_labels(starts_at: str, ends_at: str) -> dict[str, str]:
-    start_dt = datetime.strptime(starts_at, ISO_FMT)
-    end_dt = datetime.strptime(ends_at, ISO_FMT)
-    start_label = _format_clock_label(start_dt)
-    end_label = _format_clock_label(end_dt)
+    start_label = _format_clock_label(starts_at[11:16])
+    end_label = _format_clock_label(ends_at[11:16])
     return {
         "start_label": start_label,
         "end_label": end_label,
@@ -60,64 +185,76 @@ def format_time_range(starts_at: str, ends_at: str) -> str:
     return _slot_labels(starts_at, ends_at)["range_label"]
 
 
+# Separators become "-"; anything that is not a word character is dropped.
+# ``\w`` matches str.isalnum() plus "_", which the table has already mapped.
+_SLUG_TABLE = str.maketrans({" ": "-", "_": "-"})
+_SLUG_DROP = re.compile(r"[^\w-]")
+
+
 def _slugify(label: str) -> str:
-    keep = []
-    for ch in label.lower():
-        if ch.isalnum():
-            keep.append(ch)
-        elif ch in {" ", "-", "_"}:
-            keep.append("-")
-    slug = "".join(keep).strip("-")
+    slug = _SLUG_DROP.sub("", label.lower().translate(_SLUG_TABLE)).strip("-")
     return slug or "doctor"
 
 
 def doctor_choices(*, include_inactive: bool = False, include_status: bool = False) -> list[tuple]:
     """
     Return (id, label, is_active) for doctors stored in doctor_colors.
+
+    Results are memoized on ``flask.g`` for the current app/request context;
+    doctor_colors writers drop the cache so later calls see the change.
     """
-    from clinic_app.services.doctor_colors import _load_colors, _ensure_table, ANY_DOCTOR_ID, ANY_DOCTOR_LABEL, DEFAULT_COLOR
+    cache = g.setdefault(DOCTOR_CHOICES_CACHE_KEY, {})
+    key = (include_inactive, include_status)
+    cached = cache.get(key)
+    if cached is None:
+        cached = cache[key] = _load_doctor_choices(
+            include_inactive=include_inactive, include_status=include_status
+        )
+    return list(cached)
 
-    conn = current_app.extensions["db"].raw_connection()  # type: ignore
-    try:
-        _ensure_table(conn)
-        colors = _load_colors(conn)
-        result: list[tuple] = []
-        # Ensure Any Doctor is first
-        if include_status:
-            result.append((ANY_DOCTOR_ID, ANY_DOCTOR_LABEL, 1))
-        else:
-            result.append((ANY_DOCTOR_ID, ANY_DOCTOR_LABEL))
-        for doc_id, info in colors.items():
-            if info.get("is_purged", 0):
-                continue
-            active_flag = info.get("is_active", 1)
-            if not include_inactive and active_flag == 0:
-                continue
-            if doc_id == ANY_DOCTOR_ID:
-                continue
-            label = info.get("label") or doc_id
-            result.append((doc_id, label, active_flag) if include_status else (doc_id, label))
-        return result
-    finally:
-        conn.close()
 
+def doctor_labels() -> dict[str, str]:
+    """Return ``{doctor_id: label}`` for active doctors, memoized like ``doctor_choices``."""
+    cache = g.setdefault(DOCTOR_CHOICES_CACHE_KEY, {})
+    labels = cache.get("labels")
+    if labels is None:
+        labels = cache["labels"] = dict(doctor_choices())
+    return labels
 
-def get_appointment_time_status(starts_at: str, ends_at: str) -> str:
-    """Determine time-based status of appointment."""
-    now = datetime.now(timezone.utc)
-    start_dt = datetime.strptime(starts_at, ISO_FMT).replace(tzinfo=timezone.utc)
-    end_dt = datetime.strptime(ends_at, ISO_FMT).replace(tzinfo=timezone.utc)
-    
-    if now < start_dt:
-        # Future appointment
-        if (start_dt - now).total_seconds() < UPCOMING_THRESHOLD_SECONDS:
-            return "upcoming"  # Yellow
-        else:
-            return "scheduled"  # Green
-    elif now >= start_dt and now <= end_dt:
-        return "in-progress"  # Blue
+
+def _load_doctor_choices(*, include_inactive: bool, include_status: bool) -> list[tuple]:
+    from clinic_app.services.doctor_colors import _known_doctors
+
+    result: list[tuple] = []
+    # Ensure Any Doctor is first
+    if include_status:
+        result.append((ANY_DOCTOR_ID, ANY_DOCTOR_LABEL, 1))
     else:
-        return "overdue"  # Red
+        result.append((ANY_DOCTOR_ID, ANY_DOCTOR_LABEL))
+    for doc_id, info in _known_doctors().items():
+        if info.get("is_purged", 0):
+            continue
+        active_flag = info.get("is_active", 1)
+        if not include_inactive and active_flag == 0:
+            continue
+        if doc_id == ANY_DOCTOR_ID:
+            continue
+        label = info.get("label") or doc_id
+        result.append((doc_id, label, active_flag) if include_status else (doc_id, label))
+    return result
+
+
+def get_appointment_time_status(start_ts: int, end_ts: int, now_ts: int | None = None) -> str:
+    """Determine time-based status of appointment from epoch seconds.
+
+    Pass ``now_ts`` when classifying a batch so the clock is read once.
+    """
+    if now_ts is None:
+        now_ts = int(time.time())
+    if now_ts < start_ts:
+        # Future appointment: yellow within the threshold, green otherwise
+        return "upcoming" if start_ts - now_ts < UPCOMING_THRESHOLD_SECONDS else "scheduled"
+    return "in-progress" if now_ts <= end_ts else "overdue"  # Blue / Red
 
 
 def _combine_datetime(day: str, time24: str) -> datetime:
@@ -139,12 +276,14 @@ def _serialize(dt: datetime) -> str:
     return dt.replace(second=0, microsecond=0).strftime(ISO_FMT)
 
 
-def _table_exists(conn: sqlite3.Connection, table: str) -> bool:
-    row = conn.execute(
-        "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?",
-        (table,),
-    ).fetchone()
-    return bool(row)
+def _epoch(dt: datetime) -> int:
+    """Epoch seconds for a naive datetime, matching SQLite's strftime('%s', ...)."""
+    return calendar.timegm(dt.replace(second=0, microsecond=0).timetuple())
+
+
+def _table_ready() -> bool:
+    """Return the startup check recorded by ``create_app`` (no SQL round-trip)."""
+    return bool(current_app.config.get("APPOINTMENTS_TABLE_READY"))
 
 
 def _cleanup_invalid_appointments(conn: sqlite3.Connection) -> None:
@@ -183,41 +322,34 @@ def _resolve_patient(conn: sqlite3.Connection, lookup: str) -> tuple[str | None,
     normalized = lookup.strip()
     if not normalized:
         return None, None, None
-    row = conn.execute(
-        """
-        SELECT id, full_name, phone
-        FROM patients
-        WHERE lower(short_id) = lower(?) OR lower(full_name) = lower(?)
-        ORDER BY created_at DESC
-        LIMIT 1
-        """,
-        (normalized, normalized),
-    ).fetchone()
+    row = conn.execute(SELECT_PATIENT_LOOKUP_SQL, (normalized, normalized)).fetchone()
     if not row:
         return None, None, None
     return row["id"], row["full_name"], row["phone"]
 
 
+def _overlap_params(
+    doctor_id: str, start_dt: datetime, end_dt: datetime, exclude_id: str
+) -> tuple[str, int, int, str]:
+    """Bind values for ``_NO_OVERLAP_SQL``."""
+    return doctor_id, _epoch(end_dt), _epoch(start_dt), exclude_id
+
+
 def _check_overlap(
     conn: sqlite3.Connection,
     doctor_id: str,
-    start_iso: str,
-    end_iso: str,
+    start_dt: datetime,
+    end_dt: datetime,
     *,
     exclude_id: str | None = None,
 ) -> None:
-    params: list[str] = [doctor_id, end_iso, start_iso]
-    sql = """
-        SELECT id, title
-        FROM appointments
-        WHERE doctor_id = ?
-          AND starts_at < ?
-          AND ends_at > ?
-    """
+    start_ts, end_ts = _epoch(start_dt), _epoch(end_dt)
     if exclude_id:
-        sql += " AND id != ?"
-        params.append(exclude_id)
-    conflict = conn.execute(sql, params).fetchone()
+        conflict = conn.execute(
+            SELECT_OVERLAP_EXCL_SQL, (doctor_id, end_ts, start_ts, exclude_id)
+        ).fetchone()
+    else:
+        conflict = conn.execute(SELECT_OVERLAP_SQL, (doctor_id, end_ts, start_ts)).fetchone()
     if conflict:
         raise AppointmentOverlap(f"conflict_with:{conflict['id']}")
 
@@ -229,10 +361,7 @@ def _extract_patient_details(conn, form_data: dict[str, str]) -> tuple[str | Non
     patient_lookup = (form_data.get("patient_lookup") or "").strip()
 
     if patient_id:
-        row = conn.execute(
-            "SELECT id, full_name, phone FROM patients WHERE id = ?",
-            (patient_id,),
-        ).fetchone()
+        row = conn.execute(SELECT_PATIENT_SQL, (patient_id,)).fetchone()
         if row:
             return row["id"], row["full_name"], row["phone"]
 
@@ -257,8 +386,9 @@ def create_appointment(form_data: dict[str, str], *, actor_id: str | None) -> st
     except (TypeError, ValueError):
         duration = _slot_minutes()
     duration = max(duration, 1)
-    doctor_id = form_data.get("doctor_id") or doctor_choices()[0][0]
-    doctor_label = next((label for slug, label in doctor_choices() if slug == doctor_id), doctor_id)
+    labels = doctor_labels()
+    doctor_id = form_data.get("doctor_id") or next(iter(labels))
+    doctor_label = labels.get(doctor_id, doctor_id)
     title = (form_data.get("title") or "").strip()
     if not title:
         raise AppointmentError("title_required")
@@ -267,27 +397,20 @@ def create_appointment(form_data: dict[str, str], *, actor_id: str | None) -> st
     start_dt = _combine_datetime(day, start_time)
     end_dt = start_dt + timedelta(minutes=duration)
     grace = timedelta(minutes=_grace_minutes())
-    overlap_start = _serialize(start_dt - grace)
-    overlap_end = _serialize(end_dt + grace)
+    overlap_start = start_dt - grace
+    overlap_end = end_dt + grace
 
-    conn = db()
+    conn = request_db()
     try:
-        if not _table_exists(conn, "appointments"):
+        if not _table_ready():
             raise AppointmentError("appointments_table_missing")
         conn.execute("BEGIN IMMEDIATE")
 
         pid, patient_display, patient_phone = _extract_patient_details(conn, form_data)
 
-        _check_overlap(conn, doctor_id, overlap_start, overlap_end)
         appt_id = str(uuid.uuid4())
-        conn.execute(
-            """
-            INSERT INTO appointments(
-                id, patient_id, patient_name, patient_phone,
-                doctor_id, doctor_label, title, notes,
-                starts_at, ends_at, status, room, reminder_minutes, created_at, updated_at
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 'scheduled', ?, 0, datetime('now'), datetime('now'))
-            """,
+        cur = conn.execute(
+            INSERT_APPT_SQL,
             (
                 appt_id,
                 pid,
@@ -300,8 +423,12 @@ def create_appointment(form_data: dict[str, str], *, actor_id: str | None) -> st
                 _serialize(start_dt),
                 _serialize(end_dt),
                 form_data.get("room") or None,
+                *_overlap_params(doctor_id, overlap_start, overlap_end, appt_id),
             ),
         )
+        if cur.rowcount == 0:
+            _check_overlap(conn, doctor_id, overlap_start, overlap_end)
+            raise AppointmentOverlap("conflict")
         conn.commit()
         return appt_id
     except Exception:
@@ -312,50 +439,35 @@ def create_appointment(form_data: dict[str, str], *, actor_id: str | None) -> st
 
 
 def update_appointment(appt_id: str, form_data: dict[str, str], *, actor_id: str | None) -> str:
-    conn = db()
+    conn = request_db()
     try:
-        if not _table_exists(conn, "appointments"):
+        if not _table_ready():
             raise AppointmentError("appointments_table_missing")
-        existing = conn.execute("SELECT * FROM appointments WHERE id=?", (appt_id,)).fetchone()
+        existing = conn.execute(SELECT_APPT_SQL, (appt_id,)).fetchone()
         if not existing:
             raise AppointmentNotFound(appt_id)
 
         doctor_id = form_data.get("doctor_id") or existing["doctor_id"]
-        doctor_label = next((label for slug, label in doctor_choices() if slug == doctor_id), doctor_id)
+        if doctor_id == existing["doctor_id"] and existing["doctor_label"]:
+            doctor_label = existing["doctor_label"]
+        else:
+            doctor_label = doctor_labels().get(doctor_id, doctor_id)
         title = (form_data.get("title") or "").strip() or existing["title"]
         notes = (form_data.get("notes") or "").strip()
         start_time = form_data.get("start_time") or existing["starts_at"][11:16]
         day = form_data.get("day") or existing["starts_at"][:10]
 
         start_dt = _combine_datetime(day, start_time)
-        existing_duration = datetime.strptime(existing["ends_at"], ISO_FMT) - datetime.strptime(
-            existing["starts_at"], ISO_FMT
-        )
-        duration_minutes = max(int(existing_duration.total_seconds() // 60), 1)
+        duration_minutes = max(_duration_minutes(existing["starts_at"], existing["ends_at"]), 1)
         end_dt = start_dt + timedelta(minutes=duration_minutes)
         grace = timedelta(minutes=_grace_minutes())
-        overlap_start = _serialize(start_dt - grace)
-        overlap_end = _serialize(end_dt + grace)
+        overlap_start = start_dt - grace
+        overlap_end = end_dt + grace
 
         conn.execute("BEGIN IMMEDIATE")
         pid, patient_display, patient_phone = _extract_patient_details(conn, form_data)
-
-        _check_overlap(conn, doctor_id, overlap_start, overlap_end, exclude_id=appt_id)
-        conn.execute(
-            """
-            UPDATE appointments
-            SET patient_id=?,
-                patient_name=?,
-                patient_phone=?,
-                doctor_id=?,
-                doctor_label=?,
-                title=?,
-                notes=?,
-                starts_at=?,
-                ends_at=?,
-                updated_at=datetime('now')
-            WHERE id=?
-            """,
+        cur = conn.execute(
+            UPDATE_APPT_SQL,
             (
                 pid,
                 patient_display,
@@ -367,8 +479,12 @@ def update_appointment(appt_id: str, form_data: dict[str, str], *, actor_id: str
                 _serialize(start_dt),
                 _serialize(end_dt),
                 appt_id,
+                *_overlap_params(doctor_id, overlap_start, overlap_end, appt_id),
             ),
         )
+        if cur.rowcount == 0:
+            _check_overlap(conn, doctor_id, overlap_start, overlap_end, exclude_id=appt_id)
+            raise AppointmentNotFound(appt_id)
         conn.commit()
         return appt_id
     except Exception:
@@ -378,7 +494,8 @@ def update_appointment(appt_id: str, form_data: dict[str, str], *, actor_id: str
         conn.close()
 
 
-def _build_search_filter(rows: list[sqlite3.Row], patient_short_ids: dict[str, str | None], search: str | None) -> list[sqlite3.Row]:
+def _build_search_filter(rows: list[sqlite3.Row], search: str | None) -> list[sqlite3.Row]:
+    """Python fallback for rows fetched without the SQL search filter."""
     if not search:
         return rows
     needle = search.strip().lower()
@@ -389,7 +506,7 @@ def _build_search_filter(rows: list[sqlite3.Row], patient_short_ids: dict[str, s
         patient_name = (row["patient_name"] or "").lower()
         patient_phone = (row["patient_phone"] or "").lower()
         title = (row["title"] or "").lower()
-        short_id = (patient_short_ids.get(row["patient_id"]) or "").lower()
+        short_id = (row["patient_short_id"] or "").lower()
         if any(
             needle in value
             for value in (patient_name, patient_phone, title, short_id)
@@ -398,17 +515,27 @@ def _build_search_filter(rows: list[sqlite3.Row], patient_short_ids: dict[str, s
     return filtered
 
 
-def _filter_show(rows: list[sqlite3.Row], mode: str) -> list[sqlite3.Row]:
+def _show_mode(mode: str | None) -> str:
     mode = (mode or "upcoming").lower()
     if mode not in {"upcoming", "past", "all"}:
         mode = "upcoming"
+    return mode
+
+
+def _filter_show(rows: list[sqlite3.Row], mode: str) -> list[sqlite3.Row]:
+    """Python fallback for rows fetched without the SQL ``show`` filter.
+
+    ``starts_at`` is NOT NULL in the schema and malformed rows are removed by
+    ``_cleanup_invalid_appointments``, so rows are compared without guards.
+    """
+    mode = _show_mode(mode)
     if mode == "all":
         return rows
     now_iso = datetime.now().strftime(ISO_FMT)
     if mode == "past":
-        return [row for row in rows if (row["starts_at"] or "") < now_iso]
+        return [row for row in rows if row["starts_at"] < now_iso]
     # default upcoming
-    return [row for row in rows if (row["starts_at"] or "") >= now_iso]
+    return [row for row in rows if row["starts_at"] >= now_iso]
 
 
 def list_for_day(
@@ -419,11 +546,25 @@ def list_for_day(
     search: str | None = None,
     show: str = "upcoming",
 ) -> list[dict[str, str]]:
+    return list(
+        _iter_for_day(day, doctor_id=doctor_id, end_day=end_day, search=search, show=show)
+    )
+
+
+def _iter_for_day(
+    day: str,
+    *,
+    doctor_id: str | None,
+    end_day: str | None,
+    search: str | None,
+    show: str,
+) -> Iterator[dict[str, str]]:
+    """Yield display-ready appointments while stepping the cursor (no fetchall)."""
     start_iso = f"{day}T00:00:00"
     end_iso = f"{end_day or day}T23:59:59" if end_day else None
-    conn = db()
+    conn = request_db()
     try:
-        if not _table_exists(conn, "appointments"):
+        if not _table_ready():
             raise AppointmentError("appointments_table_missing")
 
         # First, clean up any invalid records
@@ -433,98 +574,99 @@ def list_for_day(
         deleted_ids = {d["doctor_id"] for d in get_deleted_doctors()}
 
         params: list[str] = [start_iso]
-        sql = """
-            SELECT *
-            FROM appointments
-            WHERE starts_at >= ?
-        """
+        sql = LIST_SELECT_SQL
         if end_iso:
-            sql += " AND starts_at <= ?"
+            sql += " AND a.starts_at <= ?"
             params.append(end_iso)
         if doctor_id:
             if doctor_id == ANY_DOCTOR_ID:
                 ids = [ANY_DOCTOR_ID] + [d for d in deleted_ids]
                 placeholders = ",".join("?" for _ in ids)
-                sql += f" AND doctor_id IN ({placeholders})"
+                sql += f" AND a.doctor_id IN ({placeholders})"
                 params.extend(ids)
             else:
-                sql += " AND doctor_id = ?"
+                sql += " AND a.doctor_id = ?"
                 params.append(doctor_id)
-        sql += " ORDER BY starts_at ASC"
-        rows = conn.execute(sql, params).fetchall()
-        patient_short_ids: dict[str, str | None] = {}
-        patient_ids = [row["patient_id"] for row in rows if row["patient_id"]]
-        if patient_ids:
-            unique_ids = list({pid for pid in patient_ids if pid})
-            placeholders = ",".join(["?"] * len(unique_ids))
-            short_rows = conn.execute(
-                f"SELECT id, short_id FROM patients WHERE id IN ({placeholders})",
-                unique_ids,
-            ).fetchall()
-            patient_short_ids = {r["id"]: r["short_id"] for r in short_rows}
-
-        rows = _build_search_filter(rows, patient_short_ids, search)
-        rows = _filter_show(rows, show)
+        mode = _show_mode(show)
+        if mode != "all":
+            # Local wall-clock "now", matching how starts_at is stored.
+            sql += " AND a.starts_at < ?" if mode == "past" else " AND a.starts_at >= ?"
+            params.append(datetime.now().strftime(ISO_FMT))
+        needle = (search or "").strip().lower()
+        if needle:
+            # py_lower (registered per connection) matches Python's str.lower(),
+            # so non-ASCII letters such as "É" fold like the needle does.
+            sql += """
+                AND (
+                    instr(py_lower(COALESCE(a.patient_name, '')), ?) > 0
+                    OR instr(py_lower(COALESCE(a.patient_phone, '')), ?) > 0
+                    OR instr(py_lower(COALESCE(a.title, '')), ?) > 0
+                    OR instr(py_lower(COALESCE(p.short_id, '')), ?) > 0
+                )
+            """
+            params.extend([needle] * 4)
+        sql += " ORDER BY a.starts_at ASC"
+        cursor = conn.cursor()
+        cursor.row_factory = _appointment_row
+        rows = cursor.execute(sql, params)
 
         doctor_colors = get_doctor_colors()
-        result = []
+        # One clock read for the whole batch.
+        now_ts = int(time.time())
         for row in rows:
             try:
                 # Validate datetime strings
-                starts_at = row["starts_at"]
-                ends_at = row["ends_at"]
+                starts_at = row.starts_at
+                ends_at = row.ends_at
 
                 if not starts_at or not ends_at:
                     # Skip invalid records
                     continue
 
-                start = datetime.strptime(starts_at, ISO_FMT)
-                end = datetime.strptime(ends_at, ISO_FMT)
-                duration = int((end - start).total_seconds() // 60)
+                start_ts = row.starts_at_ts
+                end_ts = row.ends_at_ts
+                duration = (end_ts - start_ts) // 60
 
-                doctor_id_value = row["doctor_id"]
+                doctor_id_value = row.doctor_id
                 is_deleted = doctor_id_value in deleted_ids
                 display_doctor_id = ANY_DOCTOR_ID if is_deleted else doctor_id_value
                 display_doctor_label = (
                     ANY_DOCTOR_LABEL
                     if is_deleted
-                    else (row["doctor_label"] or row["doctor_id"])
+                    else (row.doctor_label or row.doctor_id)
                 )
 
                 doctor_color = doctor_colors.get(display_doctor_id, DEFAULT_COLOR)
 
                 # Get time-based status
-                time_status = get_appointment_time_status(starts_at, ends_at)
+                time_status = get_appointment_time_status(start_ts, end_ts, now_ts)
                 labels = _slot_labels(starts_at, ends_at)
 
-                result.append(
-                    {
-                        "id": row["id"],
-                        "patient_id": row["patient_id"],
-                        "patient_name": row["patient_name"] or "—",
-                        "patient_phone": row["patient_phone"],
-                        "patient_short_id": patient_short_ids.get(row["patient_id"]),
-                        "doctor_id": display_doctor_id,
-                        "doctor_label": display_doctor_label,
-                        "title": row["title"] or "Untitled Appointment",
-                        "notes": row["notes"],
-                        "starts_at": starts_at,
-                        "ends_at": ends_at,
-                        "status": row["status"] or "scheduled",
-                        "room": row["room"],
-                        "duration": duration,
-                        "doctor_color": doctor_color,
-                        "time_status": time_status,
-                        "time_label": labels["range_label"],
-                        "start_label": labels["start_label"],
-                        "end_label": labels["end_label"],
-                    }
-                )
+                yield {
+                    "id": row.id,
+                    "patient_id": row.patient_id,
+                    "patient_name": row.patient_name or "—",
+                    "patient_phone": row.patient_phone,
+                    "patient_short_id": row.patient_short_id,
+                    "doctor_id": display_doctor_id,
+                    "doctor_label": display_doctor_label,
+                    "title": row.title or "Untitled Appointment",
+                    "notes": row.notes,
+                    "starts_at": starts_at,
+                    "ends_at": ends_at,
+                    "status": row.status or "scheduled",
+                    "room": row.room,
+                    "duration": duration,
+                    "doctor_color": doctor_color,
+                    "time_status": time_status,
+                    "time_label": labels["range_label"],
+                    "start_label": labels["start_label"],
+                    "end_label": labels["end_label"],
+                }
             except (ValueError, TypeError, KeyError) as e:
                 # Log and skip invalid records instead of crashing
-                current_app.logger.warning(f"Skipping invalid appointment record {row.get('id', 'unknown')}: {e}")
+                current_app.logger.warning(f"Skipping invalid appointment record {row.id}: {e}")
                 continue
-        return result
     finally:
         conn.close()
 
@@ -533,57 +675,46 @@ def update_status(appt_id: str, status: str) -> None:
     allowed = {"scheduled", "checked_in", "in_progress", "done", "no_show", "cancelled"}
     if status not in allowed:
         raise AppointmentError("invalid_status")
-    conn = db()
+    conn = request_db()
     try:
-        if not _table_exists(conn, "appointments"):
+        if not _table_ready():
             raise AppointmentError("appointments_table_missing")
-        cur = conn.execute("SELECT id FROM appointments WHERE id=?", (appt_id,)).fetchone()
+        cur = conn.execute(SELECT_APPT_ID_SQL, (appt_id,)).fetchone()
         if not cur:
             raise AppointmentNotFound(appt_id)
-        conn.execute(
-            "UPDATE appointments SET status=?, updated_at=datetime('now') WHERE id=?",
-            (status, appt_id),
-        )
+        conn.execute(UPDATE_STATUS_SQL, (status, appt_id))
         conn.commit()
     finally:
         conn.close()
 
 
 def timeline_blocks(appointments: Sequence[dict[str, str]]) -> list[dict[str, object]]:
-    """Return appointments grouped by hour for easier rendering."""
+    """Return appointments grouped by hour for easier rendering.
+
+    Expects ``list_for_day`` output, which is already ordered by ``starts_at``,
+    so each hour bucket keeps that order without re-sorting.
+    """
 
-    blocks: dict[str, list[dict[str, str]]] = {}
+    entries: list[list[dict[str, str]]] = [[] for _ in range(24)]
     for appt in appointments:
-        hour = appt["starts_at"][11:13]
-        blocks.setdefault(hour, []).append(appt)
-    for hour in blocks:
-        blocks[hour].sort(key=lambda item: item["starts_at"])
-    ordered = []
-    for hr in range(24):
-        key = f"{hr:02d}"
-        ordered.append(
-            {
-                "hour": key,
-                "entries": blocks.get(key, []),
-            }
-        )
-    return ordered
+        entries[int(appt["starts_at"][11:13])].append(appt)
+    return [{"hour": f"{hr:02d}", "entries": entries[hr]} for hr in range(24)]
 
 
 def move_appointment_slot(appt_id: str, *, target_doctor: str, target_time: str) -> dict[str, str]:
     """Move an appointment to a new doctor/time slot."""
 
-    conn = db()
+    conn = request_db()
     try:
-        if not _table_exists(conn, "appointments"):
+        if not _table_ready():
             raise AppointmentError("appointments_table_missing")
         conn.execute("BEGIN IMMEDIATE")
-        appt = conn.execute("SELECT * FROM appointments WHERE id=?", (appt_id,)).fetchone()
+        appt = conn.execute(SELECT_APPT_SQL, (appt_id,)).fetchone()
         if not appt:
             raise AppointmentNotFound(appt_id)
 
-        doctor_labels = dict(doctor_choices())
-        if target_doctor not in doctor_labels:
+        labels = doctor_labels()
+        if target_doctor not in labels:
             raise AppointmentError("invalid_doctor")
 
         day = appt["starts_at"][:10]
@@ -591,30 +722,29 @@ def move_appointment_slot(appt_id: str, *, target_doctor: str, target_time: str)
         new_start = _combine_datetime(day, target_time)
         new_end = new_start + timedelta(minutes=_slot_minutes())
         grace = timedelta(minutes=_grace_minutes())
-        overlap_start = _serialize(new_start - grace)
-        overlap_end = _serialize(new_end + grace)
-        _check_overlap(conn, target_doctor, overlap_start, overlap_end, exclude_id=appt_id)
+        overlap_start = new_start - grace
+        overlap_end = new_end + grace
 
         serialized_start = _serialize(new_start)
         serialized_end = _serialize(new_end)
-        conn.execute(
-            """
-            UPDATE appointments
-            SET doctor_id=?, doctor_label=?, starts_at=?, ends_at=?, updated_at=datetime('now')
-            WHERE id=?
-            """,
+        cur = conn.execute(
+            MOVE_APPT_SQL,
             (
                 target_doctor,
-                doctor_labels[target_doctor],
+                labels[target_doctor],
                 serialized_start,
                 serialized_end,
                 appt_id,
+                *_overlap_params(target_doctor, overlap_start, overlap_end, appt_id),
             ),
         )
+        if cur.rowcount == 0:
+            _check_overlap(conn, target_doctor, overlap_start, overlap_end, exclude_id=appt_id)
+            raise AppointmentOverlap("conflict")
         conn.commit()
         return {
             "doctor_id": target_doctor,
-            "doctor_label": doctor_labels[target_doctor],
+            "doctor_label": labels[target_doctor],
             "starts_at": serialized_start,
             "ends_at": serialized_end,
         }
@@ -627,25 +757,18 @@ def move_appointment_slot(appt_id: str, *, target_doctor: str, target_time: str)
 
 def get_appointment_by_id(appt_id: str) -> dict[str, str] | None:
     """Get a single appointment by ID."""
-    conn = db()
+    conn = request_db()
     try:
-        if not _table_exists(conn, "appointments"):
+        if not _table_ready():
             return None
-        row = conn.execute("SELECT * FROM appointments WHERE id=?", (appt_id,)).fetchone()
+        row = conn.execute(SELECT_APPT_WITH_SHORT_ID_SQL, (appt_id,)).fetchone()
         if not row:
             return None
-        patient_short_id = None
-        if row["patient_id"]:
-            short_row = conn.execute(
-                "SELECT short_id FROM patients WHERE id=?", (row["patient_id"],)
-            ).fetchone()
-            if short_row:
-                patient_short_id = short_row["short_id"]
 
         doctor_colors = get_doctor_colors()
         deleted_ids = {d["doctor_id"] for d in get_deleted_doctors()}
         # Get time-based status
-        time_status = get_appointment_time_status(row["starts_at"], row["ends_at"])
+        time_status = get_appointment_time_status(row["starts_at_ts"], row["ends_at_ts"])
 
         doctor_id_value = row["doctor_id"]
         is_deleted = doctor_id_value in deleted_ids
@@ -655,16 +778,14 @@ def get_appointment_by_id(appt_id: str) -> dict[str, str] | None:
         )
         doctor_color = doctor_colors.get(display_doctor_id, DEFAULT_COLOR)
         
-        start = datetime.strptime(row["starts_at"], ISO_FMT)
-        end = datetime.strptime(row["ends_at"], ISO_FMT)
-        duration = int((end - start).total_seconds() // 60)
+        duration = _duration_minutes(row["starts_at"], row["ends_at"])
         
         return {
             "id": row["id"],
             "patient_name": row["patient_name"],
             "patient_phone": row["patient_phone"],
             "patient_id": row["patient_id"],
-            "patient_short_id": patient_short_id,
+            "patient_short_id": row["patient_short_id"],
             "doctor_id": display_doctor_id,
             "doctor_label": display_doctor_label,
             "title": row["title"],
@@ -683,18 +804,18 @@ def get_appointment_by_id(appt_id: str) -> dict[str, str] | None:
 
 def delete_appointment(appt_id: str) -> None:
     """Delete an appointment by ID."""
-    conn = db()
+    conn = request_db()
     try:
-        if not _table_exists(conn, "appointments"):
+        if not _table_ready():
             raise AppointmentError("appointments_table_missing")
 
         # Check if appointment exists
-        cur = conn.execute("SELECT id FROM appointments WHERE id=?", (appt_id,)).fetchone()
+        cur = conn.execute(SELECT_APPT_ID_SQL, (appt_id,)).fetchone()
         if not cur:
             raise AppointmentNotFound(appt_id)
 
         # Delete the appointment
-        conn.execute("DELETE FROM appointments WHERE id=?", (appt_id,))
+        conn.execute(DELETE_APPT_SQL, (appt_id,))
         conn.commit()
     finally:
         conn.close()
@@ -801,28 +922,23 @@ def auto_generate_time_slot(start_time: str, duration_minutes: int | None = None
 
 def validate_time_slot_overlap(doctor_id: str, start_time: str, end_time: str, day: str, exclude_appointment_id: str | None = None) -> bool:
     """Check if a proposed time slot overlaps with existing appointments for the same doctor."""
-    conn = db()
+    conn = request_db()
     try:
         start_iso = f"{day}T{start_time}:00"
         end_iso = f"{day}T{end_time}:00"
 
+        # Caller-supplied HH:MM may be unpadded ("9:00"), so parse with
+        # strptime; _parse_iso is only for stored fixed-width values.
         grace_minutes = _grace_minutes()
-        grace_start = (datetime.strptime(start_iso, ISO_FMT) - timedelta(minutes=grace_minutes)).strftime(ISO_FMT)
-        grace_end = (datetime.strptime(end_iso, ISO_FMT) + timedelta(minutes=grace_minutes)).strftime(ISO_FMT)
-
-        params = [doctor_id, grace_end, grace_start]
-        sql = """
-            SELECT id FROM appointments
-            WHERE doctor_id = ?
-              AND starts_at < ?
-              AND ends_at > ?
-        """
+        grace_start = _epoch(datetime.strptime(start_iso, ISO_FMT) - timedelta(minutes=grace_minutes))
+        grace_end = _epoch(datetime.strptime(end_iso, ISO_FMT) + timedelta(minutes=grace_minutes))
 
         if exclude_appointment_id:
-            sql += " AND id != ?"
-            params.append(exclude_appointment_id)
-
-        conflict = conn.execute(sql, params).fetchone()
+            conflict = conn.execute(
+                SELECT_OVERLAP_EXCL_SQL, (doctor_id, grace_end, grace_start, exclude_appointment_id)
+            ).fetchone()
+        else:
+            conflict = conn.execute(SELECT_OVERLAP_SQL, (doctor_id, grace_end, grace_start)).fetchone()
         return conflict is not None
     finally:
         conn.close()
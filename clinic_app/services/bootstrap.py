@@ -20,6 +20,15 @@ def _table_exists(conn: sqlite3.Connection, table_name: str) -> bool:
     return row is not None
 
 
+def table_ready(db_path: Path, table_name: str) -> bool:
+    """Return True when ``table_name`` exists in the database at ``db_path``."""
+    conn = sqlite3.connect(db_path)
+    try:
+        return _table_exists(conn, table_name)
+    finally:
+        conn.close()
+
+
 def _column_names(conn: sqlite3.Connection, table_name: str) -> set[str]:
     rows = conn.execute(f"PRAGMA table_info({table_name})").fetchall()
     return {str(row[1]) for row in rows}
@@ -97,6 +106,111 @@ def _ensure_reception_indexes(conn: sqlite3.Connection) -> None:
             )
 
 
+def _ensure_appointment_epoch_columns(conn: sqlite3.Connection) -> None:
+    """Keep INTEGER epoch copies of starts_at/ends_at for overlap checks.
+
+    The ISO text columns stay the source of truth; triggers mirror them so
+    every writer (including raw SQL in scripts and tests) keeps them in sync.
+    """
+    if not _table_exists(conn, "appointments"):
+        return
+    _ensure_column(conn, "appointments", "starts_at_ts INTEGER")
+    _ensure_column(conn, "appointments", "ends_at_ts INTEGER")
+    _execute_statements(
+        conn,
+        [
+            """
+            UPDATE appointments
+            SET starts_at_ts = CAST(strftime('%s', starts_at) AS INTEGER),
+                ends_at_ts = CAST(strftime('%s', ends_at) AS INTEGER)
+            WHERE starts_at_ts IS NULL OR ends_at_ts IS NULL
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS appointments_epoch_insert
+            AFTER INSERT ON appointments
+            BEGIN
+                UPDATE appointments
+                SET starts_at_ts = CAST(strftime('%s', NEW.starts_at) AS INTEGER),
+                    ends_at_ts = CAST(strftime('%s', NEW.ends_at) AS INTEGER)
+                WHERE id = NEW.id;
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS appointments_epoch_update
+            AFTER UPDATE OF starts_at, ends_at ON appointments
+            BEGIN
+                UPDATE appointments
+                SET starts_at_ts = CAST(strftime('%s', NEW.starts_at) AS INTEGER),
+                    ends_at_ts = CAST(strftime('%s', NEW.ends_at) AS INTEGER)
+                WHERE id = NEW.id;
+            END
+            """,
+            # Overlap probe: doctor_id = ? AND starts_at_ts < ? AND ends_at_ts > ?
+            """
+            CREATE INDEX IF NOT EXISTS idx_appointments_doctor_span_ts
+            ON appointments(doctor_id, starts_at_ts, ends_at_ts)
+            """,
+            # Superseded by the epoch index above.
+            "DROP INDEX IF EXISTS idx_appointments_doctor_span",
+        ],
+    )
+
+
+def _ensure_patient_lookup_indexes(conn: sqlite3.Connection) -> None:
+    """Case-insensitive indexes for appointment patient lookups by file number or name."""
+    if not _table_exists(conn, "patients"):
+        return
+    cols = _column_names(conn, "patients")
+    if "short_id" in cols:
+        conn.execute(
+            """
+            CREATE INDEX IF NOT EXISTS idx_patients_short_id_nocase
+            ON patients(short_id COLLATE NOCASE)
+            """
+        )
+    if "full_name" in cols:
+        conn.execute(
+            """
+            CREATE INDEX IF NOT EXISTS idx_patients_full_name_nocase
+            ON patients(full_name COLLATE NOCASE)
+            """
+        )
+
+
+def _role_name_has_unique_index(conn: sqlite3.Connection) -> bool:
+    for index in conn.execute("PRAGMA index_list(roles)").fetchall():
+        if not index[2]:
+            continue
+        cols = [row[2] for row in conn.execute(f"PRAGMA index_info('{index[1]}')").fetchall()]
+        if cols == ["name"]:
+            return True
+    return False
+
+
+def _ensure_role_name_unique(conn: sqlite3.Connection) -> None:
+    """Back role creation's IntegrityError check with a UNIQUE index on roles.name.
+
+    Fresh databases get it from the RBAC migration; older tables created before
+    it may not. Existing duplicate names are left alone, in which case the
+    index is skipped and ``role_name_unique`` reports False.
+    """
+    if not _table_exists(conn, "roles") or _role_name_has_unique_index(conn):
+        return
+    try:
+        conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_roles_name_unique ON roles(name)")
+    except sqlite3.IntegrityError:
+        pass
+
+
+def role_name_unique(db_path: Path) -> bool:
+    """Return True when a UNIQUE index guards roles.name at ``db_path``."""
+    conn = sqlite3.connect(db_path)
+    try:
+        return _table_exists(conn, "roles") and _role_name_has_unique_index(conn)
+    finally:
+        conn.close()
+
+
 def ensure_base_tables(db_path: Path) -> None:
     db_path.parent.mkdir(parents=True, exist_ok=True)
     conn = sqlite3.connect(db_path)
@@ -259,6 +373,9 @@ def ensure_base_tables(db_path: Path) -> None:
                 """,
             ],
         )
+        _ensure_appointment_epoch_columns(conn)
+        _ensure_patient_lookup_indexes(conn)
+        _ensure_role_name_unique(conn)
         _ensure_reception_entries_compat(conn)
         _ensure_reception_indexes(conn)
         conn.commit()
@@ -5,8 +5,12 @@ from __future__ import annotations
 import sqlite3
 from contextlib import contextmanager
 
+from flask import g, has_app_context
+
 from clinic_app.extensions import db as sa_db
 
+_REQUEST_CONN_KEY = "_request_sqlite_conn"
+
 
 def db() -> sqlite3.Connection:
     """Return a raw sqlite3 connection with PRAGMAs applied."""
@@ -14,6 +18,64 @@ def db() -> sqlite3.Connection:
     return sa_db.raw_connection()
 
 
+class _RequestConnection:
+    """Shared per-context connection whose ``close()`` only ends the transaction.
+
+    Callers keep their usual ``try/finally: conn.close()`` shape. Every
+    ``request_db()`` checkout is counted, and only the outermost ``close()``
+    rolls back (mirroring what the pool does on check-in). A helper called
+    inside another helper's ``BEGIN IMMEDIATE`` block therefore leaves the
+    outer caller's uncommitted writes alone; nested helpers must not commit
+    on the outer caller's behalf. ``with request_db() as conn:`` is the
+    sqlite3 transaction scope (commit on success, rollback on error).
+    """
+
+    def __init__(self, conn) -> None:
+        self._conn = conn
+        self._depth = 0
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        self._conn.driver_connection.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return self._conn.driver_connection.__exit__(exc_type, exc, tb)
+
+    def close(self) -> None:
+        if self._depth > 0:
+            self._depth -= 1
+        if self._depth == 0:
+            self._conn.rollback()
+
+
+def request_db() -> sqlite3.Connection:
+    """Return one pooled connection reused for the current app/request context.
+
+    Outside an app context this falls back to a fresh ``db()`` connection.
+    Pair each call with one ``close()``; see ``_RequestConnection`` for nesting.
+    """
+
+    if not has_app_context():
+        return db()
+    conn = g.get(_REQUEST_CONN_KEY)
+    if conn is None:
+        conn = _RequestConnection(db())
+        setattr(g, _REQUEST_CONN_KEY, conn)
+    conn._depth += 1
+    return conn  # type: ignore[return-value]
+
+
+def close_request_db(exception: BaseException | None = None) -> None:
+    """Return the context's shared connection to the pool (teardown hook)."""
+
+    conn = g.pop(_REQUEST_CONN_KEY, None)
+    if conn is not None:
+        conn._conn.close()
+
+
 @contextmanager
 def session_scope():
     """Provide a transactional scope for ORM usage."""
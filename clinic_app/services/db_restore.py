@@ -0,0 +1,64 @@
+"""Apply a database restore requested from the admin backups page."""
+
+from __future__ import annotations
+
+import json
+import sqlite3
+from datetime import datetime, timezone
+from pathlib import Path
+
+# Written by admin_settings.restore_db_backup; consumed on the next startup.
+RESTORE_MARKER_NAME = "restore_pending.json"
+
+
+def _copy_database(source: Path, target: Path) -> None:
+    src = sqlite3.connect(str(source))
+    try:
+        dst = sqlite3.connect(str(target))
+        try:
+            src.backup(dst)
+        finally:
+            dst.close()
+    finally:
+        src.close()
+
+
+def apply_pending_db_restore(data_root: Path, main_db: Path) -> bool:
+    """Apply a requested restore before opening the main database.
+
+    Returns True when a backup was copied over ``main_db``.
+    """
+    marker_path = data_root / RESTORE_MARKER_NAME
+    try:
+        marker = json.loads(marker_path.read_text(encoding="utf-8"))
+    except Exception:
+        return False
+
+    backup_name = (marker.get("backup_name") or "").strip()
+    if not backup_name or "/" in backup_name or "\\" in backup_name:
+        return False
+
+    backup_path = data_root / "backups" / backup_name
+    if not backup_path.exists():
+        return False
+
+    # Safety backup of current DB before overwriting.
+    try:
+        ts = datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
+        _copy_database(main_db, data_root / "backups" / f"app-before-restore-{ts}.db")
+    except Exception:
+        # If safety backup fails, do not proceed.
+        return False
+
+    # Restore requested backup into app.db.
+    try:
+        _copy_database(backup_path, main_db)
+    except Exception:
+        return False
+
+    # Clear marker on success.
+    try:
+        marker_path.unlink()
+    except Exception:
+        pass
+    return True
@@ -7,15 +7,65 @@ from typing import Dict, Optional
 from datetime import datetime, timezone
 import secrets
 
+from flask import current_app, g, has_app_context
+
 from clinic_app.services.database import db
 
 DEFAULT_COLORS: Dict[str, str] = {}
 DEFAULT_COLOR = "#6B7280"
 ANY_DOCTOR_ID = "any-doctor"
 ANY_DOCTOR_LABEL = "Any Doctor"
+# flask.g attribute holding the doctor_colors snapshot and doctor_choices() results.
+DOCTOR_CHOICES_CACHE_KEY = "_doctor_choices_cache"
+
+
+def _invalidate_doctor_cache() -> None:
+    """Drop memoized doctor lists after a doctor_colors write."""
+    if has_app_context():
+        g.pop(DOCTOR_CHOICES_CACHE_KEY, None)
+
+
+def _known_doctors() -> dict[str, dict[str, object]]:
+    """Return doctor_colors rows keyed by id, loaded once per app/request context.
+
+    The snapshot lives in the ``DOCTOR_CHOICES_CACHE_KEY`` dict, so the writers'
+    ``_invalidate_doctor_cache()`` drops it along with the doctor choices.
+    """
+    cache = g.setdefault(DOCTOR_CHOICES_CACHE_KEY, {}) if has_app_context() else {}
+    colors = cache.get("colors")
+    if colors is None:
+        conn = db()
+        try:
+            _ensure_table(conn)
+            colors = cache["colors"] = _load_colors(conn)
+        finally:
+            conn.close()
+    return colors
+
+
+def _doctors_by_name() -> dict[str, list[str]]:
+    """Non-purged doctor ids keyed by lowercased label, built from the snapshot.
+
+    Cached next to it, so ``_invalidate_doctor_cache()`` drops both together.
+    """
+    colors = _known_doctors()
+    cache = g.setdefault(DOCTOR_CHOICES_CACHE_KEY, {}) if has_app_context() else {}
+    index = cache.get("names")
+    if index is None:
+        index = {}
+        for doc_id, info in colors.items():
+            if info.get("is_purged", 0):
+                continue
+            label = (info.get("label") or doc_id or "").strip().lower()
+            index.setdefault(label, []).append(doc_id)
+        cache["names"] = index
+    return index
 
 
 def _ensure_table(conn: sqlite3.Connection) -> None:
+    # create_app() runs the full check once and sets this flag.
+    if has_app_context() and current_app.config.get("DOCTOR_COLORS_TABLE_READY"):
+        return
     cursor = conn.cursor()
     cursor.execute(
         """
@@ -138,20 +188,15 @@ def _now_iso() -> str:
 
 def get_doctor_colors() -> dict[str, str]:
     """Get configured colors for active doctors."""
-    conn = db()
     try:
-        try:
-            _ensure_table(conn)
-            colors = _load_colors(conn)
-        except Exception:
-            return {}
-        result: dict[str, str] = {}
-        for k, v in colors.items():
-            if v.get("is_active", 1) and not v.get("is_purged", 0):
-                result[k] = v.get("color") or DEFAULT_COLOR
-        return result
-    finally:
-        conn.close()
+        colors = _known_doctors()
+    except Exception:
+        return {}
+    result: dict[str, str] = {}
+    for k, v in colors.items():
+        if v.get("is_active", 1) and not v.get("is_purged", 0):
+            result[k] = v.get("color") or DEFAULT_COLOR
+    return result
 
 
 def set_doctor_color(doctor_id: str, color: str, label: str | None = None) -> None:
@@ -179,24 +224,45 @@ def set_doctor_color(doctor_id: str, color: str, label: str | None = None) -> No
                 )
             else:
                 raise
-        conn.commit()
 
-        # Propagate to appointments table
+        # Propagate to appointments table in the same transaction: one commit
+        # (and one WAL sync) per color change instead of two connections' worth.
         try:
-            appt_conn = db()
-            appt_cur = appt_conn.cursor()
-            appt_cur.execute(
+            cursor.execute(
                 "UPDATE appointments SET doctor_label=?, color=? WHERE doctor_id=?",
                 (label or doctor_id, color, doctor_id),
             )
-            appt_conn.commit()
-        except Exception:
+        except sqlite3.OperationalError:
             pass
-        finally:
-            try:
-                appt_conn.close()
-            except Exception:
-                pass
+        conn.commit()
+        _invalidate_doctor_cache()
+    finally:
+        conn.close()
+
+
+def bulk_reset_doctor_colors(color: str = DEFAULT_COLOR) -> int:
+    """Set every active, non-purged doctor (and their appointments) to ``color``.
+
+    One UPDATE per table and a single commit instead of a ``set_doctor_color``
+    round-trip per doctor. Returns the number of doctor rows changed.
+    """
+    conn = db()
+    try:
+        _ensure_table(conn)
+        cursor = conn.cursor()
+        active = "COALESCE(is_active, 1)=1 AND COALESCE(is_purged, 0)=0"
+        cursor.execute(f"UPDATE doctor_colors SET color=? WHERE {active}", (color,))
+        count = cursor.rowcount
+        try:
+            cursor.execute(
+                f"UPDATE appointments SET color=? WHERE doctor_id IN (SELECT doctor_id FROM doctor_colors WHERE {active})",
+                (color,),
+            )
+        except sqlite3.OperationalError:
+            pass
+        conn.commit()
+        _invalidate_doctor_cache()
+        return count
     finally:
         conn.close()
 
@@ -230,6 +296,7 @@ def delete_doctor_color(doctor_id: str) -> None:
                     (doctor_id, color, now),
                 )
         conn.commit()
+        _invalidate_doctor_cache()
     finally:
         conn.close()
 
@@ -251,6 +318,7 @@ def restore_doctor_color(doctor_id: str) -> None:
             (doctor_id,),
         )
         conn.commit()
+        _invalidate_doctor_cache()
     finally:
         conn.close()
 
@@ -296,55 +364,39 @@ def purge_doctor_color(doctor_id: str) -> None:
 
         cursor.execute("DELETE FROM doctor_colors WHERE doctor_id = ?", (doctor_id,))
         conn.commit()
+        _invalidate_doctor_cache()
     finally:
         conn.close()
 
 
 def get_deleted_doctors() -> list[dict[str, object]]:
     """Return doctors that are deleted but not purged."""
-    conn = db()
-    try:
-        _ensure_table(conn)
-        colors = _load_colors(conn)
-        deleted = []
-        for doc_id, info in colors.items():
-            if info.get("is_purged", 0):
-                continue
-            if info.get("is_active", 1):
-                continue
-            deleted.append(
-                {
-                    "doctor_id": doc_id,
-                    "doctor_label": info.get("label") or doc_id,
-                    "color": info.get("color") or DEFAULT_COLOR,
-                    "deleted_at": info.get("deleted_at"),
-                }
-            )
-        return deleted
-    finally:
-        conn.close()
+    deleted = []
+    for doc_id, info in _known_doctors().items():
+        if info.get("is_purged", 0):
+            continue
+        if info.get("is_active", 1):
+            continue
+        deleted.append(
+            {
+                "doctor_id": doc_id,
+                "doctor_label": info.get("label") or doc_id,
+                "color": info.get("color") or DEFAULT_COLOR,
+                "deleted_at": info.get("deleted_at"),
+            }
+        )
+    return deleted
 
 
 def get_doctor_entry(doctor_id: str) -> Optional[dict[str, object]]:
     """Return a single doctor entry if present."""
-    conn = db()
-    try:
-        _ensure_table(conn)
-        colors = _load_colors(conn)
-        return colors.get(doctor_id)
-    finally:
-        conn.close()
+    entry = _known_doctors().get(doctor_id)
+    return dict(entry) if entry is not None else None
 
 
 def ensure_unique_doctor_id(base_label: str) -> str:
     """Generate a unique doctor id based on a label (kept for backward compat)."""
-    conn = db()
-    try:
-        _ensure_table(conn)
-        colors = _load_colors(conn)
-        existing_ids = set(colors.keys()) | set(DEFAULT_COLORS.keys())
-    finally:
-        conn.close()
+    existing_ids = set(_known_doctors()) | set(DEFAULT_COLORS)
 
     base = _slugify(base_label) if base_label else "doctor"
     if base not in existing_ids:
@@ -359,13 +411,7 @@ def ensure_unique_doctor_id(base_label: str) -> str:
 
 def ensure_unique_numeric_id() -> str:
     """Generate a random numeric id that is unique across doctors."""
-    conn = db()
-    try:
-        _ensure_table(conn)
-        colors = _load_colors(conn)
-        existing_ids = set(colors.keys()) | set(DEFAULT_COLORS.keys())
-    finally:
-        conn.close()
+    existing_ids = set(_known_doctors()) | set(DEFAULT_COLORS)
     try:
         from clinic_app.services.appointments import doctor_choices
         for doc_id, _label, _active in doctor_choices(include_inactive=True, include_status=True):
@@ -386,24 +432,7 @@ def name_exists(name: str, *, exclude_id: Optional[str] = None) -> bool:
     target = (name or "").strip().lower()
     if not target:
         return False
-    conn = db()
-    try:
-        _ensure_table(conn)
-        colors = _load_colors(conn)
-        for doc_id, info in colors.items():
-            if exclude_id and doc_id == exclude_id:
-                continue
-            if info.get("is_purged", 0):
-                continue
-            if info.get("is_active", 1) == 0:
-                continue
-            label = (info.get("label") or doc_id or "").strip().lower()
-            if label == target:
-                return True
-    finally:
-        conn.close()
-
-    return False
+    return any(doc_id != exclude_id for doc_id in find_active_doctor_ids_by_name(target))
 
 
 def name_exists_any(name: str, *, exclude_id: Optional[str] = None) -> bool:
@@ -411,21 +440,7 @@ def name_exists_any(name: str, *, exclude_id: Optional[str] = None) -> bool:
     target = (name or "").strip().lower()
     if not target:
         return False
-    conn = db()
-    try:
-        _ensure_table(conn)
-        colors = _load_colors(conn)
-        for doc_id, info in colors.items():
-            if info.get("is_purged", 0):
-                continue
-            if exclude_id and doc_id == exclude_id:
-                continue
-            label = (info.get("label") or doc_id or "").strip().lower()
-            if label == target:
-                return True
-    finally:
-        conn.close()
-    return False
+    return any(doc_id != exclude_id for doc_id in _doctors_by_name().get(target, ()))
 
 
 def is_doctor_blocked(doctor_id: str) -> bool:
@@ -441,22 +456,12 @@ def find_active_doctor_ids_by_name(name: str) -> list[str]:
     target = (name or "").strip().lower()
     if not target:
         return []
-    matches: list[str] = []
-    conn = db()
-    try:
-        _ensure_table(conn)
-        colors = _load_colors(conn)
-        for doc_id, info in colors.items():
-            if info.get("is_purged", 0):
-                continue
-            if info.get("is_active", 1) == 0:
-                continue
-            label = (info.get("label") or doc_id or "").strip().lower()
-            if label == target:
-                matches.append(doc_id)
-    finally:
-        conn.close()
-    return matches
+    colors = _known_doctors()
+    return [
+        doc_id
+        for doc_id in _doctors_by_name().get(target, ())
+        if colors[doc_id].get("is_active", 1) != 0
+    ]
 
 
 def generate_unique_color(existing: Optional[list[str]] = None) -> str:
@@ -479,27 +484,21 @@ def generate_unique_color(existing: Optional[list[str]] = None) -> str:
 
 def get_all_doctors_with_colors() -> list[dict[str, str]]:
     """Get all active doctors with their current colors."""
-    conn = db()
-    try:
-        _ensure_table(conn)
-        colors = _load_colors(conn)
-        result: list[dict[str, str]] = []
-        for doc_id, info in colors.items():
-            if info.get("is_purged", 0):
-                continue
-            if info.get("is_active", 1) == 0:
-                continue
-            result.append(
-                {
-                    "doctor_id": doc_id,
-                    "doctor_label": info.get("label") or doc_id,
-                    "color": info.get("color") or DEFAULT_COLOR,
-                    "is_active": info.get("is_active", 1),
-                }
-            )
-        return result
-    finally:
-        conn.close()
+    result: list[dict[str, str]] = []
+    for doc_id, info in _known_doctors().items():
+        if info.get("is_purged", 0):
+            continue
+        if info.get("is_active", 1) == 0:
+            continue
+        result.append(
+            {
+                "doctor_id": doc_id,
+                "doctor_label": info.get("label") or doc_id,
+                "color": info.get("color") or DEFAULT_COLOR,
+                "is_active": info.get("is_active", 1),
+            }
+        )
+    return result
 
 
 def get_active_doctor_options(include_any: bool = True) -> list[dict[str, str]]:
@@ -532,7 +531,10 @@ def get_active_doctor_options(include_any: bool = True) -> list[dict[str, str]]:
 
 
 def init_doctor_colors_table() -> None:
-    """Initialize the doctor_colors table."""
+    """Initialize the doctor_colors table (columns + Any Doctor row).
+
+    Called once from ``create_app()``; afterwards ``_ensure_table`` is a no-op.
+    """
     conn = db()
     try:
         _ensure_table(conn)
@@ -140,6 +140,10 @@ def build_patient_group_key(short_id: str, full_name: str, phone: str = "") -> s
     return ""
 
 
+_ARABIC_INDIC_DIGITS = str.maketrans("٠١٢٣٤٥٦٧٨٩", "0123456789")
+_FIRST_NUMBER_RE = re.compile(r"(\d+)")
+
+
 def _first_page_number(raw: Optional[str]) -> str:
     """Return the first notebook page number found in a raw page string.
 
@@ -154,23 +158,8 @@ def _first_page_number(raw: Optional[str]) -> str:
     if not txt:
         return ""
     # Normalize Arabic-Indic digits.
-    txt = txt.translate(
-        str.maketrans(
-            {
-                "٠": "0",
-                "١": "1",
-                "٢": "2",
-                "٣": "3",
-                "٤": "4",
-                "٥": "5",
-                "٦": "6",
-                "٧": "7",
-                "٨": "8",
-                "٩": "9",
-            }
-        )
-    )
-    m = re.search(r"(\d+)", txt)
+    txt = txt.translate(_ARABIC_INDIC_DIGITS)
+    m = _FIRST_NUMBER_RE.search(txt)
     if not m:
         return ""
     digits = (m.group(1) or "").lstrip("0")
@@ -3,17 +3,37 @@
 from __future__ import annotations
 
 from datetime import datetime, timezone
-from typing import Dict, Optional
+from typing import Dict, Iterable, Optional, Tuple
+
+from flask import g, has_app_context
 
 from clinic_app.services.database import db
 
+# Per-request snapshot of every setting: render_page, the settings page and the
+# logo routes all read several keys per request, so one SELECT serves them all.
+_SETTINGS_CACHE_KEY = "_theme_settings_cache"
+
 
 def _utc_now() -> str:
     return datetime.now(timezone.utc).isoformat()
 
 
+def _request_settings() -> Optional[Dict[str, str]]:
+    """Settings snapshot for the current app context, loaded on first use."""
+    if not has_app_context():
+        return None
+    cached = g.get(_SETTINGS_CACHE_KEY)
+    if cached is None:
+        cached = _load_theme_variables()
+        setattr(g, _SETTINGS_CACHE_KEY, cached)
+    return cached
+
+
 def get_setting(key: str) -> Optional[str]:
     """Fetch a single setting value by key."""
+    cached = _request_settings()
+    if cached is not None:
+        return cached.get(key)
     conn = db()
     try:
         row = conn.execute(
@@ -32,9 +52,21 @@ def set_setting(key: str, value: str, category: Optional[str] = None) -> bool:
     Upsert a setting. Uses SQLite's ON CONFLICT for simplicity.
     Returns True on success, False on error.
     """
+    return set_settings([(key, value, category)])
+
+
+def set_settings(items: Iterable[Tuple[str, str, Optional[str]]]) -> bool:
+    """
+    Upsert several (key, value, category) settings in one transaction.
+    Returns True on success, False on error (nothing is written then).
+    """
+    items = list(items)
+    if not items:
+        return True
+    now = _utc_now()
     conn = db()
     try:
-        conn.execute(
+        conn.executemany(
             """
             INSERT INTO theme_settings (setting_key, setting_value, category, updated_at)
             VALUES (?, ?, ?, ?)
@@ -44,19 +76,31 @@ def set_setting(key: str, value: str, category: Optional[str] = None) -> bool:
                 category = COALESCE(excluded.category, theme_settings.category),
                 updated_at = excluded.updated_at
             """,
-            (key, value, category, _utc_now()),
+            [(key, value, category, now) for key, value, category in items],
         )
         conn.commit()
-        return True
     except Exception:
         conn.rollback()
         return False
+    else:
+        if has_app_context():
+            cached = g.get(_SETTINGS_CACHE_KEY)
+            if cached is not None:
+                cached.update((key, value) for key, value, _ in items)
+        return True
     finally:
         conn.close()
 
 
 def get_theme_variables() -> Dict[str, str]:
     """Return all active theme variables as a dict of key -> value."""
+    cached = _request_settings()
+    if cached is not None:
+        return dict(cached)
+    return _load_theme_variables()
+
+
+def _load_theme_variables() -> Dict[str, str]:
     conn = db()
     try:
         rows = conn.execute(
@@ -3,10 +3,12 @@
 from __future__ import annotations
 
 import time
+from functools import lru_cache
+from pathlib import Path
 from typing import Any
 from urllib.parse import urlparse
 
-from flask import g, render_template, request, session, url_for
+from flask import current_app, g, render_template, request, session, url_for
 from flask_wtf.csrf import generate_csrf
 
 from .i18n import T, dir_attr, get_lang
@@ -92,6 +94,131 @@ def back_to_home_url() -> str:
     return url_for("index", _ts=int(time.time()))
 
 
+def logo_version(rel_path: str) -> str:
+    """Cache-busting token for a logo URL: the file's mtime (ns) and size.
+
+    The URL then only changes when the logo file does, so browsers can keep
+    the image across page loads instead of refetching it every second.
+    Nanosecond mtimes keep two logo swaps within the same second apart.
+    """
+    try:
+        root = Path(current_app.config.get("DATA_ROOT", "data"))
+        st = (root / rel_path).stat()
+        return f"{st.st_mtime_ns}-{st.st_size}"
+    except Exception:
+        return str(time.time_ns())
+
+
+def _parse_hex_color(val: Any) -> tuple[int, int, int] | None:
+    try:
+        s = str(val or "").strip()
+        if not s.startswith("#"):
+            return None
+        h = s[1:]
+        if len(h) == 3:
+            h = "".join(c * 2 for c in h)
+        if len(h) != 6:
+            return None
+        r = int(h[0:2], 16)
+        g = int(h[2:4], 16)
+        b = int(h[4:6], 16)
+        return r, g, b
+    except Exception:
+        return None
+
+
+def _auto_btn_for(primary_val: Any) -> str | None:
+    rgb = _parse_hex_color(primary_val)
+    if not rgb:
+        return None
+    r, g, b = rgb
+    lum = 0.299 * r + 0.587 * g + 0.114 * b
+    return "#111827" if lum > 180 else "#ffffff"
+
+
+def _too_close(c1: Any, c2: Any) -> bool:
+    rgb1 = _parse_hex_color(c1)
+    rgb2 = _parse_hex_color(c2)
+    if not rgb1 or not rgb2:
+        return False
+    l1 = 0.299 * rgb1[0] + 0.587 * rgb1[1] + 0.114 * rgb1[2]
+    l2 = 0.299 * rgb2[0] + 0.587 * rgb2[1] + 0.114 * rgb2[2]
+    return abs(l1 - l2) < 80
+
+
+def _lighten_for_bg(val: Any, mix: float = 0.85) -> str | None:
+    rgb = _parse_hex_color(val)
+    if not rgb:
+        return None
+    r, g, b = rgb
+    # Mix a high percentage of white with the chosen color to keep it very light
+    def _mix(c: int) -> int:
+        return int(min(255, c + (255 - c) * mix))
+
+    lr, lg, lb = _mix(r), _mix(g), _mix(b)
+    return f"#{lr:02x}{lg:02x}{lb:02x}"
+
+
+@lru_cache(maxsize=32)
+def _theme_css(
+    primary: str | None,
+    accent: str | None,
+    base_font: str | None,
+    text_color: str | None,
+    btn_text_color: str | None,
+    metric_text_color: str | None,
+    page_bg_tint: str | None,
+) -> str | None:
+    """Render the ``:root`` theme overrides for the given settings.
+
+    A pure function of the stored values, so it is memoized: pages render the
+    cached string until an admin saves different colors.
+    """
+    overrides = []
+    if primary:
+        overrides.append(f"--primary-color: {primary};")
+    if accent:
+        overrides.append(f"--accent-color: {accent};")
+    if base_font:
+        try:
+            size_val = int(float(base_font))
+            clamped = max(14, min(size_val, 18))
+            overrides.append(f"font-size: clamp(14px, {clamped}px, 18px);")
+        except Exception:
+            pass
+    if text_color:
+        overrides.append(f"--ink: {text_color};")
+        overrides.append(f"--text-primary: {text_color};")
+    if metric_text_color:
+        overrides.append(f"--metric-color: {metric_text_color};")
+
+    # Button text color: auto-contrast from primary, with manual override
+    if primary:
+        auto_btn = _auto_btn_for(primary)
+        chosen_btn = None
+        if btn_text_color:
+            # If manual color is too close to the button background, fall back to auto for safety
+            if auto_btn and _too_close(btn_text_color, primary):
+                chosen_btn = auto_btn
+            else:
+                chosen_btn = btn_text_color
+        elif auto_btn:
+            chosen_btn = auto_btn
+        if chosen_btn:
+            overrides.append(f"--btn-text-on-primary: {chosen_btn};")
+
+    # Very light horizontal 3-stop page tint (color → light → color)
+    if page_bg_tint:
+        safe_bg = _lighten_for_bg(page_bg_tint) or page_bg_tint
+        overrides.append(
+            f"--page-bg: linear-gradient(90deg, {safe_bg} 0%, #fdfdfd 52%, {safe_bg} 100%);"
+        )
+
+    if not overrides:
+        return None
+    return ":root { " + " ".join(overrides) + " }"
+
+
 def render_page(template_name: str, **ctx: Any):
     lang_override = str(ctx.pop("lang_override", "") or "").strip().lower()
     if lang_override in ("en", "ar"):
@@ -114,112 +241,23 @@ def render_page(template_name: str, **ctx: Any):
     except Exception:
         show_file_numbers = True
 
-    theme_css_parts = []
+    theme_css = None
     if theme_vars:
-        overrides = []
-        primary = theme_vars.get("primary_color")
-        accent = theme_vars.get("accent_color")
-        base_font = theme_vars.get("base_font_size")
-        text_color = theme_vars.get("text_color")
-        btn_text_color = theme_vars.get("btn_text_color")
-        metric_text_color = theme_vars.get("metric_text_color")
-        page_bg_tint = theme_vars.get("page_bg_tint")
-        card_bg_tint = theme_vars.get("card_bg_tint")
-
-        if primary:
-            overrides.append(f"--primary-color: {primary};")
-        if accent:
-            overrides.append(f"--accent-color: {accent};")
-        if base_font:
-            try:
-                size_val = int(float(base_font))
-                clamped = max(14, min(size_val, 18))
-                overrides.append(f"font-size: clamp(14px, {clamped}px, 18px);")
-            except Exception:
-                pass
-        if text_color:
-            overrides.append(f"--ink: {text_color};")
-            overrides.append(f"--text-primary: {text_color};")
-        if metric_text_color:
-            overrides.append(f"--metric-color: {metric_text_color};")
-
-        # Button text color: auto-contrast from primary, with manual override
-        def _parse_hex_color(val: Any):
-            try:
-                s = str(val or "").strip()
-                if not s.startswith("#"):
-                    return None
-                h = s[1:]
-                if len(h) == 3:
-                    h = "".join(c * 2 for c in h)
-                if len(h) != 6:
-                    return None
-                r = int(h[0:2], 16)
-                g = int(h[2:4], 16)
-                b = int(h[4:6], 16)
-                return r, g, b
-            except Exception:
-                return None
-
-        def _auto_btn_for(primary_val: Any) -> str | None:
-            rgb = _parse_hex_color(primary_val)
-            if not rgb:
-                return None
-            r, g, b = rgb
-            lum = 0.299 * r + 0.587 * g + 0.114 * b
-            return "#111827" if lum > 180 else "#ffffff"
-
-        def _too_close(c1: Any, c2: Any) -> bool:
-            rgb1 = _parse_hex_color(c1)
-            rgb2 = _parse_hex_color(c2)
-            if not rgb1 or not rgb2:
-                return False
-            l1 = 0.299 * rgb1[0] + 0.587 * rgb1[1] + 0.114 * rgb1[2]
-            l2 = 0.299 * rgb2[0] + 0.587 * rgb2[1] + 0.114 * rgb2[2]
-            return abs(l1 - l2) < 80
-
-        def _lighten_for_bg(val: Any, mix: float = 0.85) -> str | None:
-            rgb = _parse_hex_color(val)
-            if not rgb:
-                return None
-            r, g, b = rgb
-            # Mix a high percentage of white with the chosen color to keep it very light
-            def _mix(c: int) -> int:
-                return int(min(255, c + (255 - c) * mix))
-
-            lr, lg, lb = _mix(r), _mix(g), _mix(b)
-            return f"#{lr:02x}{lg:02x}{lb:02x}"
-
-        if primary:
-            auto_btn = _auto_btn_for(primary)
-            chosen_btn = None
-            if btn_text_color:
-                # If manual color is too close to the button background, fall back to auto for safety
-                if auto_btn and _too_close(btn_text_color, primary):
-                    chosen_btn = auto_btn
-                else:
-                    chosen_btn = btn_text_color
-            elif auto_btn:
-                chosen_btn = auto_btn
-            if chosen_btn:
-                overrides.append(f"--btn-text-on-primary: {chosen_btn};")
-
-        # Very light horizontal 3-stop page tint (color → light → color)
-        if page_bg_tint:
-            safe_bg = _lighten_for_bg(page_bg_tint) or page_bg_tint
-            overrides.append(
-                f"--page-bg: linear-gradient(90deg, {safe_bg} 0%, #fdfdfd 52%, {safe_bg} 100%);"
-            )
-
-        if overrides:
-            theme_css_parts.append(":root { " + " ".join(overrides) + " }")
-    theme_css = "\n".join(theme_css_parts) if theme_css_parts else None
+        theme_css = _theme_css(
+            theme_vars.get("primary_color"),
+            theme_vars.get("accent_color"),
+            theme_vars.get("base_font_size"),
+            theme_vars.get("text_color"),
+            theme_vars.get("btn_text_color"),
+            theme_vars.get("metric_text_color"),
+            theme_vars.get("page_bg_tint"),
+        )
 
     theme_logo_url = None
     logo_path = theme_vars.get("logo_path") if theme_vars else None
     if logo_path:
         try:
-            theme_logo_url = url_for("admin_settings.theme_logo", _ts=int(time.time()))
+            theme_logo_url = url_for("admin_settings.theme_logo", _ts=logo_version(logo_path))
         except Exception:
             theme_logo_url = None
 
@@ -0,0 +1,38 @@
+"""Index the non-leading columns of the RBAC junction tables."""
+
+from __future__ import annotations
+
+import sqlalchemy as sa
+from alembic import op
+
+
+revision = "0019_rbac_junction_indexes"
+down_revision = "0018_patient_contacts_and_notebooks"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    """Index user_roles.role_id and role_permissions.permission_id.
+
+    The composite primary keys already cover user_roles(user_id, ...) and
+    role_permissions(role_id, ...); lookups by the second column scanned the table.
+    """
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+    tables = set(inspector.get_table_names())
+
+    if "user_roles" in tables:
+        existing = {idx["name"] for idx in inspector.get_indexes("user_roles")}
+        if "ix_user_roles_role_id" not in existing:
+            op.create_index("ix_user_roles_role_id", "user_roles", ["role_id"])
+
+    if "role_permissions" in tables:
+        existing = {idx["name"] for idx in inspector.get_indexes("role_permissions")}
+        if "ix_role_permissions_permission_id" not in existing:
+            op.create_index("ix_role_permissions_permission_id", "role_permissions", ["permission_id"])
+
+
+def downgrade() -> None:
+    op.drop_index("ix_role_permissions_permission_id", table_name="role_permissions")
+    op.drop_index("ix_user_roles_role_id", table_name="user_roles")
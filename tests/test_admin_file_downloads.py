@@ -0,0 +1,147 @@
+import csv
+import io
+import tempfile
+from pathlib import Path
+
+from clinic_app.services.database import db
+
+
+def test_backup_and_report_downloads_are_served_from_disk(app, logged_in_client):
+    root = Path(app.config["DATA_ROOT"])
+    (root / "backups" / "snap.db").write_bytes(b"SQLite format 3\x00data")
+    (root / "import_reports" / "r.json").write_bytes(b'{"ok": true}')
+    backup = logged_in_client.get("/admin/settings/db-backups/download/snap.db")
+    assert backup.status_code == 200
+    assert backup.data == b"SQLite format 3\x00data"
+    assert backup.headers["Content-Length"] == "20"
+    report = logged_in_client.get("/admin/settings/data-import/report/r.json")
+    assert report.get_json() == {"ok": True}
+    assert logged_in_client.get("/admin/settings/db-backups/download/missing.db").status_code == 404
+
+
+def test_payments_export_streams_rows_oldest_first(app, logged_in_client):
+
+    conn = db()
+    try:
+        conn.execute(
+            "INSERT INTO patients(id, short_id, full_name, phone, created_at) "
+            "VALUES ('pat-exp', 'P0042', 'Export Pat', '0100', datetime('now'))"
+        )
+        conn.execute(
+            "INSERT INTO patient_pages(id, patient_id, page_number) VALUES ('pg-2', 'pat-exp', '7'), ('pg-1', 'pat-exp', '3')"
+        )
+        conn.execute(
+            "INSERT INTO patients(id, short_id, full_name, phone, primary_page_number, created_at) "
+            "VALUES ('pat-solo', 'P0043', 'Solo Pat', '0101', '9', datetime('now'))"
+        )
+        for pay_id, pid, paid_at, cents in (
+            ("pay-b", "pat-exp", "2025-02-01", 2500),
+            ("pay-a", "pat-exp", "2025-01-01", 1000),
+            ("pay-c", "pat-solo", "2025-03-01", 500),
+        ):
+            conn.execute(
+                """
+                INSERT INTO payments(
+                    id, patient_id, paid_at, amount_cents, method, note, treatment,
+                    remaining_cents, total_amount_cents, examination_flag, followup_flag, discount_cents
+                ) VALUES (?, ?, ?, ?, 'cash', '', 'Clean', 0, ?, 1, 0, 0)
+                """,
+                (pay_id, pid, paid_at, cents, cents),
+            )
+        conn.commit()
+    finally:
+        conn.close()
+
+    resp = logged_in_client.get("/admin/settings/data-export/payments.csv")
+    assert resp.status_code == 200
+    assert resp.mimetype == "text/csv"
+    assert resp.headers["Content-Disposition"].startswith('attachment; filename="clinic-payments-')
+    header, first, second, third = csv.reader(io.StringIO(resp.get_data().decode("utf-8-sig")))
+    assert header[:3] == ["file_number", "page_number", "full_name"]
+    assert first[:6] == ["P0042", "3, 7", "Export Pat", "0100", "2025-01-01", "10.00"]
+    assert first[8] == "exam"
+    assert second[:2] == ["P0042", "3, 7"] and second[-1] == "pay-b"
+    assert third[:2] == ["P0043", "9"]
+
+
+def test_payments_export_closes_its_connection_once(logged_in_client, monkeypatch):
+    from clinic_app.blueprints import admin_settings
+
+    closes = []
+
+    class _Counting:
+        def __init__(self, conn):
+            self._conn = conn
+
+        def __getattr__(self, name):
+            return getattr(self._conn, name)
+
+        def close(self):
+            closes.append(1)
+            self._conn.close()
+
+    monkeypatch.setattr(admin_settings, "db_sqlite", lambda: _Counting(db()))
+    resp = logged_in_client.get("/admin/settings/data-export/payments.csv")
+    assert resp.status_code == 200
+    resp.close()
+    assert closes == [1]
+
+
+def test_import_template_is_prebuilt_and_revalidates(logged_in_client):
+    resp = logged_in_client.get("/admin/settings/data-import/template.csv")
+    assert resp.status_code == 200
+    assert resp.data.startswith("\ufefffile_number,page_number,".encode("utf-8"))
+    assert resp.headers["Last-Modified"]
+    again = logged_in_client.get(
+        "/admin/settings/data-import/template.csv",
+        headers={"If-None-Match": resp.headers["ETag"]},
+    )
+    assert again.status_code == 304
+
+
+def test_import_preview_reads_the_uploaded_template(logged_in_client, get_csrf_token, tmp_path, monkeypatch):
+    scratch = tmp_path / "scratch"
+    scratch.mkdir()
+    monkeypatch.setattr(tempfile, "tempdir", str(scratch))
+    template = logged_in_client.get("/admin/settings/data-import/template.csv")
+    assert template.status_code == 200
+    token = get_csrf_token(logged_in_client.get("/admin/users/new"))
+    resp = logged_in_client.post(
+        "/admin/settings/data-import/first-stable/preview",
+        data={"csrf_token": token, "excel_file": (io.BytesIO(template.data), "clinic.csv")},
+        content_type="multipart/form-data",
+    )
+    body = resp.get_json()
+    assert resp.status_code == 200, body
+    assert body["success"] is True
+    assert body["rows"]
+    assert list(scratch.iterdir()) == []
+
+
+def test_db_duplicate_merge_keeps_source_page_number(app, logged_in_client, get_csrf_token):
+    with app.app_context():
+        conn = db()
+        try:
+            conn.executemany(
+                "INSERT INTO patients(id, short_id, full_name, phone, primary_page_number, created_at)"
+                " VALUES (?, ?, 'Omar Ahmed', '', ?, datetime('now'))",
+                [("merge-src", "P0921", "44"), ("merge-tgt", "P0922", " ")],
+            )
+            conn.commit()
+        finally:
+            conn.close()
+    token = get_csrf_token(logged_in_client.get("/admin/users/new"))
+    resp = logged_in_client.post(
+        "/admin/settings/data-import/duplicates-db/merge",
+        json={"csrf_token": token, "source_id": "merge-src", "target_id": "merge-tgt"},
+    )
+    assert resp.status_code == 200, resp.get_json()
+    with app.app_context():
+        conn = db()
+        try:
+            rows = conn.execute(
+                "SELECT id, primary_page_number FROM patients WHERE id IN ('merge-src', 'merge-tgt')"
+            ).fetchall()
+        finally:
+            conn.close()
+    assert [tuple(r) for r in rows] == [("merge-tgt", "44")]
@@ -86,3 +86,346 @@ def test_edit_role_updates_permissions(logged_in_client, get_csrf_token):
         assert missing["c"] == 0
     finally:
         conn.close()
+
+
+def test_create_role_skips_unknown_and_malformed_permission_ids(logged_in_client, get_csrf_token):
+    token = get_csrf_token(logged_in_client.get("/admin/roles/new"))
+    perm_id = _get_permission_id("patients:view")
+    resp = logged_in_client.post(
+        "/admin/roles/new",
+        data={"csrf_token": token, "name": "Viewer", "permissions": [str(perm_id), "999999", "abc"]},
+        follow_redirects=False,
+    )
+    assert resp.status_code in (302, 303)
+    role_id, _ = _get_role("Viewer")
+    conn = raw_db()
+    try:
+        rows = conn.execute(
+            "SELECT permission_id FROM role_permissions WHERE role_id=?", (role_id,)
+        ).fetchall()
+    finally:
+        conn.close()
+    assert [r["permission_id"] for r in rows] == [perm_id]
+
+
+def test_edit_role_form_checks_assigned_permissions(logged_in_client):
+    logged_in_client.get("/admin/settings")
+    role_id, _ = _get_role("Receptionist (View Only)")
+    perm_id = _get_permission_id("patients:view")
+    other_id = _get_permission_id("admin.user.manage")
+    html = logged_in_client.get(f"/admin/roles/{role_id}/edit").get_data(as_text=True)
+    assert f'value="{perm_id}" checked' in html
+    assert f'value="{other_id}" checked' not in html
+
+
+def test_create_role_rejects_duplicate_name(logged_in_client, get_csrf_token):
+    token = get_csrf_token(logged_in_client.get("/admin/roles/new"))
+    data = {"csrf_token": token, "name": "Auditor"}
+    first = logged_in_client.post("/admin/roles/new", data=data, follow_redirects=False)
+    assert first.status_code in (302, 303)
+    second = logged_in_client.post("/admin/roles/new", data=data, follow_redirects=False)
+    assert second.status_code == 200
+    assert "Role name already exists." in second.get_data(as_text=True)
+    conn = raw_db()
+    try:
+        count = conn.execute("SELECT COUNT(*) AS c FROM roles WHERE name='Auditor'").fetchone()["c"]
+    finally:
+        conn.close()
+    assert count == 1
+
+
+def test_delete_role_refuses_while_assigned(logged_in_client, get_csrf_token):
+    token = get_csrf_token(logged_in_client.get("/admin/roles/new"))
+    logged_in_client.post("/admin/roles/new", data={"csrf_token": token, "name": "Temp"})
+    role_id, _ = _get_role("Temp")
+    conn = raw_db()
+    try:
+        user_id = conn.execute("SELECT id FROM users LIMIT 1").fetchone()["id"]
+        conn.execute("INSERT INTO user_roles(user_id, role_id) VALUES (?, ?)", (user_id, role_id))
+        conn.commit()
+    finally:
+        conn.close()
+    resp = logged_in_client.post(f"/admin/roles/{role_id}/delete", json={"csrf_token": token})
+    assert resp.status_code == 400
+    conn = raw_db()
+    try:
+        conn.execute("DELETE FROM user_roles WHERE role_id=?", (role_id,))
+        conn.commit()
+    finally:
+        conn.close()
+    resp = logged_in_client.post(f"/admin/roles/{role_id}/delete", json={"csrf_token": token})
+    assert resp.get_json()["success"] is True
+
+
+def test_edit_role_rejects_short_name_before_other_checks(logged_in_client, get_csrf_token):
+    role_id, _ = _get_role("Reception")
+    token = get_csrf_token(logged_in_client.get(f"/admin/roles/{role_id}/edit"))
+    resp = logged_in_client.post(
+        f"/admin/roles/{role_id}/edit",
+        data={"csrf_token": token, "name": "R", "permissions": ["not-a-number"]},
+    )
+    assert resp.status_code == 200
+    html = resp.get_data(as_text=True)
+    assert "Role name must be at least 2 characters." in html
+    assert "You cannot remove your own user-management access." not in html
+    assert _get_role("Reception")[0] == role_id
+
+
+def test_get_role_returns_permission_ids(logged_in_client):
+    role_id, _ = _get_role("Reception")
+    payload = logged_in_client.get(f"/admin/roles/{role_id}").get_json()
+    assert payload["success"] is True
+    assert payload["role"]["name"] == "Reception"
+    assert _get_permission_id("patients:view") in payload["role"]["permissions"]
+    assert logged_in_client.get("/admin/roles/999999").status_code == 404
+
+
+def test_edit_role_only_touches_changed_permission_links(logged_in_client, get_csrf_token):
+    role_id, description = _get_role("Reception")
+    conn = raw_db()
+    try:
+        before = {
+            r["permission_id"]: r["rowid"]
+            for r in conn.execute(
+                "SELECT rowid, permission_id FROM role_permissions WHERE role_id=?", (role_id,)
+            ).fetchall()
+        }
+    finally:
+        conn.close()
+    kept_id = _get_permission_id("patients:view")
+    assert kept_id in before
+    added_id = _get_permission_id("admin.user.manage")
+    token = get_csrf_token(logged_in_client.get(f"/admin/roles/{role_id}/edit"))
+    resp = logged_in_client.post(
+        f"/admin/roles/{role_id}/edit",
+        data={
+            "csrf_token": token,
+            "name": "Reception",
+            "description": description or "",
+            "permissions": [str(kept_id), str(added_id)],
+        },
+    )
+    assert resp.status_code in (302, 303)
+    conn = raw_db()
+    try:
+        after = {
+            r["permission_id"]: r["rowid"]
+            for r in conn.execute(
+                "SELECT rowid, permission_id FROM role_permissions WHERE role_id=?", (role_id,)
+            ).fetchall()
+        }
+    finally:
+        conn.close()
+    assert set(after) == {kept_id, added_id}
+    assert after[kept_id] == before[kept_id]
+
+
+def test_edit_role_with_no_permissions_clears_its_links(logged_in_client, get_csrf_token):
+    role_id, description = _get_role("Reception")
+    token = get_csrf_token(logged_in_client.get(f"/admin/roles/{role_id}/edit"))
+    resp = logged_in_client.post(
+        f"/admin/roles/{role_id}/edit",
+        data={"csrf_token": token, "name": "Reception", "description": description or ""},
+    )
+    assert resp.status_code in (302, 303)
+    conn = raw_db()
+    try:
+        count = conn.execute("SELECT count(*) FROM role_permissions WHERE role_id=?", (role_id,)).fetchone()[0]
+    finally:
+        conn.close()
+    assert count == 0
+
+
+def test_settings_index_lists_roles_with_permission_badges(logged_in_client):
+    html = logged_in_client.get("/admin/settings").get_data(as_text=True)
+    role_id, _ = _get_role("Receptionist (View Only)")
+    assert f'<tr data-role-id="{role_id}">' in html
+    assert ">appointments:view</span>" in html
+
+
+def test_default_roles_are_seeded_once_per_app(app, logged_in_client):
+    logged_in_client.get("/admin/settings")
+    assert app.extensions["admin_settings.default_roles_ready"] is True
+    role_id, _ = _get_role("Doctor")
+    conn = raw_db()
+    try:
+        conn.execute("DELETE FROM role_permissions WHERE role_id=?", (role_id,))
+        conn.execute("DELETE FROM roles WHERE id=?", (role_id,))
+        conn.commit()
+    finally:
+        conn.close()
+    assert logged_in_client.get("/admin/settings").status_code == 200
+    conn = raw_db()
+    try:
+        assert conn.execute("SELECT 1 FROM roles WHERE name='Doctor'").fetchone() is None
+    finally:
+        conn.close()
+
+
+def test_settings_index_role_cache_is_dropped_on_role_write(app, logged_in_client, get_csrf_token):
+    logged_in_client.get("/admin/settings")
+    assert "admin_settings.role_index" in app.extensions
+    token = get_csrf_token(logged_in_client.get("/admin/roles/new"))
+    resp = logged_in_client.post(
+        "/admin/roles/new",
+        data={"csrf_token": token, "name": "Cached Auditor", "description": ""},
+        follow_redirects=False,
+    )
+    assert resp.status_code in (302, 303)
+    assert "admin_settings.role_index" not in app.extensions
+    html = logged_in_client.get("/admin/settings").get_data(as_text=True)
+    role_id, _ = _get_role("Cached Auditor")
+    assert f'<tr data-role-id="{role_id}">' in html
+
+
+def test_admin_role_must_keep_user_management(logged_in_client, get_csrf_token):
+    logged_in_client.get("/admin/settings")
+    role_id, description = _get_role("Admin")
+    token = get_csrf_token(logged_in_client.get(f"/admin/roles/{role_id}/edit"))
+    resp = logged_in_client.post(
+        f"/admin/roles/{role_id}/edit",
+        data={
+            "csrf_token": token,
+            "name": "Admin",
+            "description": description or "",
+            "permissions": [str(_get_permission_id("patients:view"))],
+        },
+    )
+    assert resp.status_code == 200
+    assert "Admin role must keep user management permission." in resp.get_data(as_text=True)
+
+
+def test_role_json_writes_return_saved_permissions(logged_in_client, get_csrf_token):
+    token = get_csrf_token(logged_in_client.get("/admin/roles/new"))
+    view_id = _get_permission_id("patients:view")
+    edit_id = _get_permission_id("payments:edit")
+    created = logged_in_client.post(
+        "/admin/roles/new",
+        json={"csrf_token": token, "name": "Json Role", "permissions": [view_id, 999999]},
+    ).get_json()
+    assert created["success"] is True
+    assert [p["id"] for p in created["role"]["permissions"]] == [view_id]
+    role_id = created["role"]["id"]
+    updated = logged_in_client.post(
+        f"/admin/roles/{role_id}/edit",
+        json={"csrf_token": token, "name": "Json Role", "permissions": [edit_id, view_id]},
+    ).get_json()
+    assert updated["success"] is True
+    assert [p["code"] for p in updated["role"]["permissions"]] == ["patients:view", "payments:edit"]
+    duplicate = logged_in_client.post(
+        f"/admin/roles/{role_id}/edit",
+        json={"csrf_token": token, "name": "Admin", "permissions": [view_id]},
+    ).get_json()
+    assert "Role name already exists." in duplicate["errors"]
+
+
+def test_edit_role_blocks_removing_own_user_management(logged_in_client, get_csrf_token):
+    manage_id = _get_permission_id("admin.user.manage")
+    token = get_csrf_token(logged_in_client.get("/admin/roles/new"))
+    logged_in_client.post(
+        "/admin/roles/new",
+        data={"csrf_token": token, "name": "Keeper", "permissions": [str(manage_id)]},
+    )
+    keeper_id, _ = _get_role("Keeper")
+    conn = raw_db()
+    try:
+        conn.execute("DELETE FROM user_roles WHERE user_id='admin-test'")
+        conn.execute("INSERT INTO user_roles(user_id, role_id) VALUES ('admin-test', ?)", (keeper_id,))
+        conn.execute("UPDATE users SET role='doctor' WHERE id='admin-test'")
+        conn.commit()
+    finally:
+        conn.close()
+    resp = logged_in_client.post(
+        f"/admin/roles/{keeper_id}/edit",
+        data={"csrf_token": token, "name": "Keeper", "permissions": [str(_get_permission_id("patients:view"))]},
+    )
+    assert resp.status_code == 200
+    assert "You cannot remove your own user-management access." in resp.get_data(as_text=True)
+
+
+def test_edit_role_keeps_one_role_with_user_management(logged_in_client, get_csrf_token):
+    manage_id = _get_permission_id("admin.user.manage")
+    token = get_csrf_token(logged_in_client.get("/admin/roles/new"))
+    logged_in_client.post(
+        "/admin/roles/new",
+        data={"csrf_token": token, "name": "Solo", "permissions": [str(manage_id)]},
+    )
+    solo_id, _ = _get_role("Solo")
+    conn = raw_db()
+    try:
+        # The logged-in admin keeps access through Solo; every other role loses it.
+        conn.execute("INSERT INTO user_roles(user_id, role_id) VALUES ('admin-test', ?)", (solo_id,))
+        conn.execute(
+            "DELETE FROM role_permissions WHERE role_id != ? AND permission_id IN "
+            "(SELECT id FROM permissions WHERE code IN ('users:manage', 'admin.user.manage'))",
+            (solo_id,),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    resp = logged_in_client.post(
+        f"/admin/roles/{solo_id}/edit",
+        data={"csrf_token": token, "name": "Solo", "permissions": [str(_get_permission_id("patients:view"))]},
+    )
+    assert resp.status_code == 200
+    assert "At least one role must keep user management permission." in resp.get_data(as_text=True)
+
+
+def test_junction_tables_are_indexed_by_their_second_column(app):
+    with app.app_context():
+        conn = raw_db()
+        try:
+            user_plan = " ".join(
+                row[3] for row in conn.execute("EXPLAIN QUERY PLAN SELECT count(*) FROM user_roles WHERE role_id=1")
+            )
+            perm_plan = " ".join(
+                row[3]
+                for row in conn.execute("EXPLAIN QUERY PLAN SELECT role_id FROM role_permissions WHERE permission_id=1")
+            )
+        finally:
+            conn.close()
+    assert "ix_user_roles_role_id" in user_plan
+    assert "ix_role_permissions_permission_id" in perm_plan
+
+
+def test_create_role_checks_names_on_legacy_roles_table(app, admin_user, get_csrf_token):
+    from clinic_app import create_app
+
+    conn = raw_db()
+    try:
+        # Pre-RBAC-migration shape: no UNIQUE on name, duplicates already present.
+        conn.execute("PRAGMA foreign_keys=OFF")
+        conn.executescript(
+            """
+            CREATE TABLE roles_legacy (id INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, description TEXT);
+            INSERT INTO roles_legacy(id, name, description) SELECT id, name, description FROM roles;
+            DROP TABLE roles;
+            ALTER TABLE roles_legacy RENAME TO roles;
+            INSERT INTO roles(name) VALUES ('Twin'), ('Twin');
+            """
+        )
+        conn.execute("PRAGMA foreign_keys=ON")
+    finally:
+        conn.close()
+
+    legacy_app = create_app()
+    legacy_app.config.update(TESTING=True, WTF_CSRF_ENABLED=True)
+    assert legacy_app.config["ROLE_NAME_UNIQUE"] is False
+    client = legacy_app.test_client()
+    login_token = get_csrf_token(client.get("/auth/login"))
+    client.post(
+        "/auth/login",
+        data={"username": admin_user["username"], "password": admin_user["password"], "csrf_token": login_token},
+    )
+    token = get_csrf_token(client.get("/admin/roles/new"))
+    resp = client.post("/admin/roles/new", data={"csrf_token": token, "name": "Auditor"}, follow_redirects=False)
+    assert resp.status_code in (302, 303)
+    dup = client.post("/admin/roles/new", data={"csrf_token": token, "name": "Auditor"}, follow_redirects=False)
+    assert "Role name already exists." in dup.get_data(as_text=True)
+
+    conn = raw_db()
+    try:
+        count = conn.execute("SELECT COUNT(*) AS c FROM roles WHERE name='Auditor'").fetchone()["c"]
+    finally:
+        conn.close()
+    assert count == 1
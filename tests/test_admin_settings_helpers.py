@@ -0,0 +1,289 @@
+from pathlib import Path
+from types import SimpleNamespace
+
+from werkzeug.datastructures import MultiDict
+
+from clinic_app.blueprints.admin_settings import (
+    _all_roles,
+    _bool_from_value,
+    _copy_logo,
+    _create_db_backup,
+    _data_relpath,
+    _data_root,
+    _first_page_number_token,
+    _db_duplicate_groups,
+    _get_user_by_any_id,
+    _grouped_permissions,
+    _is_ck_users_role_error,
+    _is_protected_admin,
+    _merge_patient_pages_for_merge,
+    _normalize_db_phone,
+    _normalize_file_number_token,
+    _permission_group,
+    _roles_from_form,
+    _schema_flags,
+    _suggest_theme_colors_cached,
+    _suggest_theme_colors_from_logo,
+    _user_fk_targets,
+    _all_permissions,
+    _valid_hex_color,
+    invalidate_permissions_cache,
+)
+from clinic_app.extensions import db
+from clinic_app.services.database import db as raw_db
+
+
+def test_valid_hex_color_accepts_short_and_long_forms():
+    assert _valid_hex_color("#1A2b3C")
+    assert _valid_hex_color(" #abc ")
+    assert not _valid_hex_color("#12345g")
+    assert not _valid_hex_color("123456#")
+    assert not _valid_hex_color("#1234")
+    assert not _valid_hex_color(None)
+
+
+def test_all_permissions_is_cached_until_invalidated(app):
+    with app.app_context():
+        session = db.session()
+        first = _all_permissions(session)
+        codes = [p.code for p in first]
+        assert codes == sorted(codes)
+        conn = raw_db()
+        try:
+            conn.execute("INSERT INTO permissions(code, description) VALUES ('zz:test', 'Test')")
+            conn.commit()
+        finally:
+            conn.close()
+        assert _all_permissions(session) == first
+        invalidate_permissions_cache()
+        assert _all_permissions(session)[-1].code == "zz:test"
+
+
+def test_grouped_permissions_keeps_category_priority(app):
+    with app.test_request_context():
+        groups = _grouped_permissions(db.session())
+        by_code = {perm.code: label for label, perms in groups.items() for perm in perms}
+        labels = list(groups)
+    assert by_code["admin.user.manage"].startswith("👥")
+    assert by_code["appointments:view"].startswith("📅")
+    assert by_code["patients:view"].startswith("🏥")
+    assert by_code["payments:view"].startswith("💰")
+    assert by_code["reports:view"].startswith("📊")
+    assert labels[0].startswith("👥")
+    assert all(groups.values())
+
+
+def test_user_fk_targets_lists_existing_columns_once(app):
+    with app.test_request_context():
+        targets = _user_fk_targets(db.session())
+        assert ("receipts", "issued_by_user_id") in targets
+        assert app.extensions["admin_settings.user_fk_targets"] is targets
+
+
+def test_get_user_by_any_id_loads_roles_by_id_or_username(app, admin_user):
+    with app.test_request_context():
+        session = db.session()
+        by_name = _get_user_by_any_id(session, admin_user["username"], load_roles=True)
+        assert by_name is not None
+        assert "roles" in by_name.__dict__
+        assert _get_user_by_any_id(session, by_name.id, load_roles=True) is by_name
+        assert _get_user_by_any_id(session, "nobody", load_roles=True) is None
+
+
+def test_is_ck_users_role_error_matches_sqlite_message():
+    assert _is_ck_users_role_error(Exception("CHECK constraint failed: ck_users_role"))
+    assert _is_ck_users_role_error(Exception("ck_users_role: Check Constraint Failed"))
+    assert not _is_ck_users_role_error(Exception("UNIQUE constraint failed: users.username"))
+
+
+def test_roles_from_form_resolves_against_loaded_roles(app):
+    with app.test_request_context():
+        session = db.session()
+        roles = _all_roles(session)
+        roles_by_id = {role.id: role for role in roles}
+        first = roles[0]
+        form = MultiDict([("roles", str(first.id)), ("roles", "x"), ("roles", str(first.id)), ("roles", "999999")])
+        assert _roles_from_form(session, form, roles_by_id) == [first]
+        assert _roles_from_form(session, form) == [first]
+        assert _roles_from_form(session, MultiDict(), roles_by_id) == []
+        assert _roles_from_form(session, {"roles": [first.id, True, None, " 2x", f" {first.id} "]}, roles_by_id) == [first]
+        assert _roles_from_form(session, None, roles_by_id) == []
+        junk = {"roles": ["--5", "- -3", "abc", "", True, f"+{first.id}"]}
+        assert _roles_from_form(session, junk, roles_by_id) == [first]
+        assert _roles_from_form(session, junk) == [first]
+
+
+def test_is_protected_admin_checks_username_or_id_prefix():
+    assert _is_protected_admin(SimpleNamespace(username="admin", id=None))
+    assert _is_protected_admin(SimpleNamespace(username="root", id="admin-1"))
+    assert not _is_protected_admin(SimpleNamespace(username="nurse", id=None))
+
+
+def test_permission_group_uses_first_matching_rule():
+    assert _permission_group("admin.user.manage") == 0
+    assert _permission_group("Patients:Export") == 2
+    assert _permission_group("expenses:view") == 7
+    assert _permission_group("unknown:thing") == 5
+
+
+def test_bool_from_value_handles_json_and_form_values():
+    assert _bool_from_value(True) is True
+    assert _bool_from_value(False) is False
+    assert _bool_from_value("on") and _bool_from_value("1")
+    assert not _bool_from_value("Off")
+    assert not _bool_from_value("")
+    assert not _bool_from_value(0) and not _bool_from_value(None)
+
+
+def test_suggest_theme_colors_picks_most_frequent_saturated_color(tmp_path):
+    from PIL import Image
+
+    img = Image.new("RGBA", (10, 10), (255, 255, 255, 255))
+    img.putdata([(200, 30, 40, 255)] * 40 + [(20, 90, 200, 255)] * 10 + [(128, 128, 128, 255)] * 50)
+    logo = tmp_path / "logo.png"
+    img.save(logo)
+    assert _suggest_theme_colors_from_logo(logo)[2] == "#c81e28"
+
+    Image.new("RGBA", (10, 10), (250, 250, 250, 255)).save(logo)
+    assert _suggest_theme_colors_from_logo(logo) == ("#3b82f6", "#0ea5e9", "#d4a74a")
+
+
+def test_copy_logo_keeps_history_files_independent(tmp_path):
+    first = tmp_path / "logos" / "logo-1.png"
+    second = tmp_path / "logos" / "logo-2.png"
+    first.parent.mkdir()
+    first.write_bytes(b"first")
+    second.write_bytes(b"second")
+    current = tmp_path / "theme" / "logo-current.png"
+    _copy_logo(first, current)
+    _copy_logo(second, current)
+    _copy_logo(current, current)
+    assert current.read_bytes() == b"second"
+    assert first.read_bytes() == b"first"
+
+
+def test_suggest_theme_colors_is_cached_per_file_version(tmp_path):
+    import os
+
+    from PIL import Image
+
+    logo = tmp_path / "logo.png"
+    Image.new("RGBA", (4, 4), (200, 30, 40, 255)).save(logo)
+    os.utime(logo, ns=(1_000, 1_000))
+    assert _suggest_theme_colors_from_logo(logo)[2] == "#c81e28"
+    hits = _suggest_theme_colors_cached.cache_info().hits
+    assert _suggest_theme_colors_from_logo(logo)[2] == "#c81e28"
+    assert _suggest_theme_colors_cached.cache_info().hits == hits + 1
+
+    Image.new("RGBA", (4, 4), (20, 90, 200, 255)).save(logo)
+    os.utime(logo, ns=(2_000, 2_000))
+    assert _suggest_theme_colors_from_logo(logo)[2] == "#145ac8"
+
+
+def test_schema_flags_are_probed_once_per_app(app):
+    with app.app_context():
+        conn = raw_db()
+        try:
+            assert _schema_flags(conn) == (True, True)
+        finally:
+            conn.close()
+        # Answered from the cache: the closed connection is never touched.
+        assert _schema_flags(conn) == (True, True)
+
+
+def test_db_duplicate_groups_only_returns_repeated_names(app):
+    with app.app_context():
+        conn = raw_db()
+        try:
+            conn.executemany(
+                "INSERT INTO patients(id, short_id, full_name, phone, created_at) VALUES (?, ?, ?, ?, datetime('now'))",
+                [
+                    ("dup-1", "P0901", "Omar  Ahmed Ali", "010-1"),
+                    ("dup-2", "P0902", "omar ahmed", "0101"),
+                    ("dup-3", "P0903", "Omar Ahmed Said", "0999"),
+                    ("solo", "P0904", "Mona Adel", ""),
+                    ("blank", "P0905", "   ", ""),
+                ],
+            )
+            conn.commit()
+        finally:
+            conn.close()
+        groups = _db_duplicate_groups("safe")
+        assert [g["first_two_name"] for g in groups] == ["omar ahmed"]
+        assert {c["id"] for c in groups[0]["candidates"]} == {"dup-1", "dup-2", "dup-3"}
+        assert _db_duplicate_groups("safe", restrict_to_patient_ids={"solo"}) == []
+
+
+def test_digit_normalisers_keep_only_digits():
+    assert _normalize_db_phone("+20 (10) 123-45") == "201012345"
+    assert _normalize_db_phone(None) == ""
+    assert _normalize_file_number_token(" P-000123 ") == "123"
+    assert _normalize_file_number_token("P000") == "0"
+    assert _normalize_file_number_token("abc") == ""
+
+
+def test_first_page_number_token_normalises_arabic_digits():
+    assert _first_page_number_token("٠٤٥-٤٦") == "45"
+    assert _first_page_number_token(" p 0012 , 14") == "12"
+    assert _first_page_number_token("000") == "0"
+    assert _first_page_number_token("none") == ""
+
+
+def test_create_db_backup_writes_a_readable_snapshot(app, monkeypatch):
+    import sqlite3
+    from datetime import datetime as real_datetime
+
+    class _FixedNow(real_datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return real_datetime(2025, 1, 2, 3, 4, 5)
+
+    monkeypatch.setattr("clinic_app.blueprints.admin_settings.datetime", _FixedNow)
+    with app.app_context():
+        first = _create_db_backup()
+        # Same timestamp again: VACUUM INTO refuses the existing file and the
+        # backup API overwrites it instead.
+        assert _create_db_backup() == first
+    conn = sqlite3.connect(str(first))
+    try:
+        assert conn.execute("SELECT count(*) FROM roles").fetchone()[0] > 0
+    finally:
+        conn.close()
+
+
+def test_merge_patient_pages_moves_only_missing_pages(app):
+    with app.app_context():
+        conn = raw_db()
+        try:
+            conn.executemany(
+                "INSERT INTO patients(id, short_id, full_name, phone, created_at) VALUES (?, ?, ?, '', datetime('now'))",
+                [("pg-src", "P0911", "Source"), ("pg-tgt", "P0912", "Target")],
+            )
+            conn.executemany(
+                "INSERT INTO patient_pages(id, patient_id, page_number, notebook_name) VALUES (?, ?, ?, ?)",
+                [
+                    ("pp-1", "pg-src", " 12 ", "Blue"),
+                    ("pp-2", "pg-src", "12", "Red"),
+                    ("pp-3", "pg-src", "7", None),
+                    ("pp-4", "pg-src", "", None),
+                    ("pp-5", "pg-tgt", "7", "Green"),
+                ],
+            )
+            _merge_patient_pages_for_merge(conn, source_id="pg-src", target_id="pg-tgt")
+            rows = conn.execute(
+                "SELECT patient_id, page_number, notebook_name FROM patient_pages"
+                " WHERE patient_id IN ('pg-src', 'pg-tgt') ORDER BY page_number"
+            ).fetchall()
+            assert [tuple(r) for r in rows] == [("pg-tgt", "12", "Blue"), ("pg-tgt", "7", "Green")]
+        finally:
+            conn.rollback()
+            conn.close()
+
+
+def test_data_root_is_resolved_once_per_context(app):
+    with app.app_context():
+        root = _data_root()
+        assert str(root) == app.config["DATA_ROOT"]
+        assert _data_root() is root
+        assert _data_relpath(root / "theme" / "logo-current.png") == str(Path("theme", "logo-current.png"))
+    assert _data_root() == Path("data")
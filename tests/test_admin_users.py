@@ -292,3 +292,36 @@ def test_primary_admin_cannot_be_deleted_even_with_other_admins(logged_in_client
         assert row is not None
     finally:
         conn.close()
+
+
+def test_create_user_rejects_duplicate_username(logged_in_client, get_csrf_token):
+    logged_in_client.get("/admin/settings")
+    token = get_csrf_token(logged_in_client.get("/admin/users/new"))
+    form = {
+        "csrf_token": token,
+        "username": "twin_user",
+        "password": "any",
+        "roles": [str(_make_role_id("Doctor"))],
+    }
+    assert logged_in_client.post("/admin/users/new", data=form).status_code in (302, 303)
+    resp = logged_in_client.post("/admin/users/new", data=form)
+    assert resp.status_code == 200
+    assert "Username already exists." in resp.get_data(as_text=True)
+
+
+def test_get_user_json_lists_roles(logged_in_client):
+    logged_in_client.get("/admin/settings")
+    admin_id = _get_primary_admin_id()
+    payload = logged_in_client.get(f"/admin/users/{admin_id}").get_json()
+    assert payload["success"] is True
+    assert _make_role_id("Admin") in payload["user"]["roles"]
+
+
+def test_edit_user_form_checks_assigned_roles(logged_in_client):
+    logged_in_client.get("/admin/settings")
+    admin_id = _get_primary_admin_id()
+    html = logged_in_client.get(f"/admin/users/{admin_id}/edit").get_data(as_text=True)
+    admin_role_id = _make_role_id("Admin")
+    doctor_role_id = _make_role_id("Doctor")
+    assert f'value="{admin_role_id}" checked' in html
+    assert f'value="{doctor_role_id}" >' in html
@@ -0,0 +1,201 @@
+from datetime import datetime
+import uuid
+
+import pytest
+
+from clinic_app.services.appointments import (
+    ISO_FMT,
+    AppointmentOverlap,
+    _duration_minutes,
+    _parse_iso,
+    _resolve_patient,
+    _slugify,
+    doctor_choices,
+    format_time_range,
+    get_consecutive_slots,
+    get_appointment_by_id,
+    get_appointment_time_status,
+    list_for_day,
+    timeline_blocks,
+    update_appointment,
+    validate_time_slot_overlap,
+)
+from clinic_app.services.database import db
+from clinic_app.services.doctor_colors import set_doctor_color
+
+
+def _insert_appointment(starts_at: str, ends_at: str, *, patient_id=None, doctor_id="any-doctor", title="Visit"):
+    appt_id = f"appt-{uuid.uuid4()}"
+    conn = db()
+    try:
+        conn.execute(
+            """
+            INSERT INTO appointments(
+                id, patient_id, patient_name, patient_phone, doctor_id, doctor_label,
+                title, starts_at, ends_at, status, reminder_minutes, created_at, updated_at
+            ) VALUES (?, ?, 'Pat', '0100', ?, ?, ?, ?, ?, 'scheduled', 0, datetime('now'), datetime('now'))
+            """,
+            (appt_id, patient_id, doctor_id, doctor_id, title, starts_at, ends_at),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    return appt_id
+
+
+def _insert_patient(short_id: str = "P0500", full_name: str = "Sara Test") -> str:
+    pid = f"patient-{uuid.uuid4()}"
+    conn = db()
+    try:
+        conn.execute(
+            "INSERT INTO patients(id, short_id, full_name, phone, created_at) VALUES (?, ?, ?, '0100', datetime('now'))",
+            (pid, short_id, full_name),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    return pid
+
+
+def test_parse_iso_matches_strptime():
+    value = "2025-03-07T14:05:09"
+    assert _parse_iso(value) == datetime.strptime(value, ISO_FMT)
+
+
+def test_duration_minutes_same_day_and_across_midnight():
+    assert _duration_minutes("2025-01-02T09:00:00", "2025-01-02T09:30:00") == 30
+    assert _duration_minutes("2025-01-02T23:45:00", "2025-01-03T00:15:00") == 30
+
+
+def test_format_time_range_labels():
+    assert format_time_range("2025-01-02T09:00:00", "2025-01-02T13:05:00") == "9:00 AM → 1:05 PM"
+    assert format_time_range("2025-01-02T00:30:00", "2025-01-02T12:00:00") == "12:30 AM → 12:00 PM"
+
+
+def test_slugify_keeps_word_characters_only():
+    assert _slugify("Dr. Lina_Ali") == "dr-lina-ali"
+    assert _slugify("د. عمر") == "د-عمر"
+    assert _slugify("!!!") == "doctor"
+
+
+def test_doctor_choices_cache_is_dropped_on_write(app):
+    with app.app_context():
+        before = doctor_choices()
+        assert doctor_choices() == before
+        set_doctor_color("dr-new", "#123456", "Dr New")
+        assert ("dr-new", "Dr New") in doctor_choices()
+
+
+def test_get_appointment_by_id_includes_patient_short_id(app):
+    with app.app_context():
+        pid = _insert_patient(short_id="P0777")
+        appt_id = _insert_appointment("2025-01-02T09:00:00", "2025-01-02T09:45:00", patient_id=pid)
+        appt = get_appointment_by_id(appt_id)
+        assert appt["patient_short_id"] == "P0777"
+        assert appt["duration"] == 45
+        orphan_id = _insert_appointment("2025-01-02T11:00:00", "2025-01-02T11:30:00")
+        assert get_appointment_by_id(orphan_id)["patient_short_id"] is None
+
+
+def test_list_for_day_joins_short_id_and_searches_it(app):
+    with app.app_context():
+        pid = _insert_patient(short_id="P0888")
+        _insert_appointment("2025-02-03T09:00:00", "2025-02-03T09:30:00", patient_id=pid)
+        _insert_appointment("2025-02-03T10:00:00", "2025-02-03T10:30:00", title="Walk-in")
+        rows = list_for_day("2025-02-03", show="all")
+        assert [r["patient_short_id"] for r in rows] == ["P0888", None]
+        matched = list_for_day("2025-02-03", show="all", search="p0888")
+        assert [r["patient_short_id"] for r in matched] == ["P0888"]
+
+
+
+def test_list_for_day_search_folds_non_ascii_case(app):
+    with app.app_context():
+        _insert_appointment("2025-02-04T09:00:00", "2025-02-04T09:30:00", title="ÉCLAIR Review")
+        _insert_appointment("2025-02-04T10:00:00", "2025-02-04T10:30:00", title="Checkup")
+        for needle in ("éclair", "Éclair", "ÉCLAIR"):
+            assert [r["title"] for r in list_for_day("2025-02-04", show="all", search=needle)] == ["ÉCLAIR Review"]
+
+
+def test_list_for_day_show_filter_runs_in_sql(app):
+    with app.app_context():
+        _insert_appointment("2000-01-01T09:00:00", "2000-01-01T09:30:00", title="Old")
+        _insert_appointment("2999-01-01T09:00:00", "2999-01-01T09:30:00", title="Future")
+        assert [r["title"] for r in list_for_day("1999-12-31", show="past")] == ["Old"]
+        assert [r["title"] for r in list_for_day("1999-12-31", show="upcoming")] == ["Future"]
+        assert [r["title"] for r in list_for_day("1999-12-31", show="bogus")] == ["Future"]
+        assert len(list_for_day("1999-12-31", show="all")) == 2
+
+
+def test_timeline_blocks_buckets_by_hour():
+    appts = [
+        {"starts_at": "2025-01-02T09:00:00"},
+        {"starts_at": "2025-01-02T09:30:00"},
+        {"starts_at": "2025-01-02T14:15:00"},
+    ]
+    blocks = timeline_blocks(appts)
+    assert len(blocks) == 24
+    assert blocks[9] == {"hour": "09", "entries": appts[:2]}
+    assert blocks[14]["entries"] == [appts[2]]
+    assert blocks[0] == {"hour": "00", "entries": []}
+
+
+def test_epoch_columns_follow_iso_and_drive_overlap(app):
+    with app.app_context():
+        appt_id = _insert_appointment("2025-03-01T09:00:00", "2025-03-01T09:30:00", doctor_id="dr-a")
+        conn = db()
+        try:
+            row = conn.execute(
+                "SELECT starts_at_ts, ends_at_ts FROM appointments WHERE id=?", (appt_id,)
+            ).fetchone()
+            assert row["ends_at_ts"] - row["starts_at_ts"] == 1800
+            conn.execute(
+                "UPDATE appointments SET starts_at='2025-03-01T12:00:00', ends_at='2025-03-01T12:30:00' WHERE id=?",
+                (appt_id,),
+            )
+            conn.commit()
+        finally:
+            conn.close()
+        assert not validate_time_slot_overlap("dr-a", "09:00", "09:30", "2025-03-01")
+        assert validate_time_slot_overlap("dr-a", "12:10", "12:20", "2025-03-01")
+        assert not validate_time_slot_overlap("dr-a", "12:10", "12:20", "2025-03-01", appt_id)
+        assert validate_time_slot_overlap("dr-a", "12:10", "12:20", "2025-03-01")
+        assert not validate_time_slot_overlap("dr-a", "9:00", "9:30", "2025-03-01")
+
+
+def test_consecutive_slots_accept_unpadded_start_time(app):
+    with app.app_context():
+        _insert_appointment("2025-03-02T08:45:00", "2025-03-02T09:15:00", doctor_id="dr-b")
+        slots = get_consecutive_slots("dr-b", "2025-03-02", "8:00", count=2)
+        assert [s["start_time"] for s in slots] == ["8:00", "08:30"]
+        assert [s["available"] for s in slots] == [True, False]
+
+
+def test_get_appointment_time_status_thresholds():
+    start, end = 10_000, 11_800
+    assert get_appointment_time_status(start, end, start - 4000) == "scheduled"
+    assert get_appointment_time_status(start, end, start - 60) == "upcoming"
+    assert get_appointment_time_status(start, end, start) == "in-progress"
+    assert get_appointment_time_status(start, end, end) == "in-progress"
+    assert get_appointment_time_status(start, end, end + 1) == "overdue"
+
+
+def test_update_appointment_rejects_overlap_in_single_statement(app):
+    with app.app_context():
+        _insert_appointment("2025-04-01T09:00:00", "2025-04-01T09:30:00", doctor_id="dr-a", title="First")
+        second = _insert_appointment("2025-04-01T11:00:00", "2025-04-01T11:30:00", doctor_id="dr-a", title="Second")
+        with pytest.raises(AppointmentOverlap, match="conflict_with:"):
+            update_appointment(second, {"day": "2025-04-01", "start_time": "09:10"}, actor_id=None)
+        assert update_appointment(second, {"day": "2025-04-01", "start_time": "13:00"}, actor_id=None) == second
+
+
+def test_resolve_patient_matches_short_id_or_name_case_insensitively(app):
+    with app.app_context():
+        pid = _insert_patient(short_id="P0999", full_name="Mona Adel")
+        conn = db()
+        try:
+            assert _resolve_patient(conn, "p0999")[0] == pid
+            assert _resolve_patient(conn, "  mona ADEL ")[0] == pid
+            assert _resolve_patient(conn, "nobody") == (None, None, None)
+        finally:
+            conn.close()
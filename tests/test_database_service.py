@@ -1,7 +1,9 @@
 
 import importlib
 
-from clinic_app.services.database import db
+from flask import g
+
+from clinic_app.services.database import db, request_db
 
 
 def test_database_service_imports():
@@ -20,3 +22,39 @@ def test_sqlite_pragmas_active(app):
     assert mode.lower() == "wal"
     assert timeout == 5000
     assert foreign == 1
+
+
+def test_request_db_is_shared_within_context(app):
+    with app.app_context():
+        first = request_db()
+        first.execute("CREATE TABLE scratch (v INTEGER)")
+        first.execute("INSERT INTO scratch VALUES (1)")
+        first.close()  # rolls back the open transaction, keeps the connection
+        second = request_db()
+        assert second is first
+        assert second.execute("SELECT COUNT(*) FROM scratch").fetchone()[0] == 0
+    with app.app_context():
+        assert "_request_sqlite_conn" not in g
+        assert request_db() is not first
+
+
+def test_nested_request_db_close_keeps_outer_transaction(app):
+    with app.app_context():
+        outer = request_db()
+        outer.execute("CREATE TABLE nested_scratch (v INTEGER)")
+        outer.execute("BEGIN IMMEDIATE")
+        outer.execute("INSERT INTO nested_scratch VALUES (1)")
+        inner = request_db()
+        assert inner.execute("SELECT COUNT(*) FROM nested_scratch").fetchone()[0] == 1
+        inner.close()  # nested helper: must not roll back the outer write
+        assert outer.in_transaction
+        outer.commit()
+        outer.close()
+        with request_db() as conn:
+            conn.execute("INSERT INTO nested_scratch VALUES (2)")
+        conn.close()
+        check = db()
+        try:
+            assert check.execute("SELECT COUNT(*) FROM nested_scratch").fetchone()[0] == 2
+        finally:
+            check.close()
@@ -0,0 +1,43 @@
+import json
+import sqlite3
+
+from clinic_app.services.db_restore import RESTORE_MARKER_NAME, apply_pending_db_restore
+
+
+def _write_db(path, value):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE t (v TEXT)")
+    conn.execute("INSERT INTO t VALUES (?)", (value,))
+    conn.commit()
+    conn.close()
+
+
+def _read_db(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT v FROM t").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_apply_pending_db_restore_swaps_db_and_clears_marker(tmp_path):
+    (tmp_path / "backups").mkdir()
+    main_db = tmp_path / "app.db"
+    _write_db(main_db, "current")
+    _write_db(tmp_path / "backups" / "old.db", "restored")
+    marker = tmp_path / RESTORE_MARKER_NAME
+    marker.write_text(json.dumps({"backup_name": "old.db"}), encoding="utf-8")
+
+    assert apply_pending_db_restore(tmp_path, main_db) is True
+    assert _read_db(main_db) == "restored"
+    assert not marker.exists()
+    safety = list((tmp_path / "backups").glob("app-before-restore-*.db"))
+    assert len(safety) == 1 and _read_db(safety[0]) == "current"
+
+
+def test_apply_pending_db_restore_rejects_path_traversal(tmp_path):
+    main_db = tmp_path / "app.db"
+    _write_db(main_db, "current")
+    (tmp_path / RESTORE_MARKER_NAME).write_text(json.dumps({"backup_name": "../x.db"}), encoding="utf-8")
+    assert apply_pending_db_restore(tmp_path, main_db) is False
+    assert _read_db(main_db) == "current"
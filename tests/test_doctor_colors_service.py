@@ -0,0 +1,134 @@
+from clinic_app.services.database import db
+from clinic_app.services.doctor_colors import (
+    ANY_DOCTOR_ID,
+    ANY_DOCTOR_LABEL,
+    bulk_reset_doctor_colors,
+    delete_doctor_color,
+    find_active_doctor_ids_by_name,
+    get_all_doctors_with_colors,
+    get_doctor_entry,
+    name_exists,
+    name_exists_any,
+    set_doctor_color,
+)
+
+
+def test_doctor_lookups_share_one_snapshot_until_a_write(app):
+    with app.app_context():
+        set_doctor_color("dr-snap", "#112233", "Dr Snap")
+        assert name_exists("dr snap")
+        conn = db()
+        try:
+            conn.execute("UPDATE doctor_colors SET doctor_label='Dr Raw' WHERE doctor_id='dr-snap'")
+            conn.commit()
+        finally:
+            conn.close()
+        # Raw SQL bypasses the service, so the context keeps its snapshot.
+        assert get_doctor_entry("dr-snap")["label"] == "Dr Snap"
+        set_doctor_color("dr-other", "#445566", "Dr Other")
+        assert get_doctor_entry("dr-snap")["label"] == "Dr Raw"
+        assert "dr-other" in {d["doctor_id"] for d in get_all_doctors_with_colors()}
+
+
+def test_bulk_reset_doctor_colors_updates_rows_and_appointments(app):
+    with app.app_context():
+        set_doctor_color("dr-bulk", "#112233", "Dr Bulk")
+        set_doctor_color("dr-gone", "#445566", "Dr Gone")
+        delete_doctor_color("dr-gone")
+        conn = db()
+        try:
+            conn.execute(
+                """
+                INSERT INTO appointments(
+                    id, patient_name, doctor_id, doctor_label, title, starts_at, ends_at,
+                    status, reminder_minutes, created_at, updated_at
+                ) VALUES ('appt-bulk', 'Pat', 'dr-bulk', 'Dr Bulk', 'Visit', '2025-01-02T09:00:00',
+                          '2025-01-02T09:30:00', 'scheduled', 0, datetime('now'), datetime('now'))
+                """
+            )
+            conn.commit()
+        finally:
+            conn.close()
+        assert get_doctor_entry("dr-bulk")["color"] == "#112233"
+        assert bulk_reset_doctor_colors("#6B7280") >= 1
+        assert get_doctor_entry("dr-bulk")["color"] == "#6B7280"
+        assert get_doctor_entry("dr-gone")["color"] == "#445566"
+        conn = db()
+        try:
+            row = conn.execute("SELECT color FROM appointments WHERE id='appt-bulk'").fetchone()
+        finally:
+            conn.close()
+        assert row["color"] == "#6B7280"
+
+
+def test_doctor_colors_table_is_prepared_at_startup(app):
+    assert app.config["DOCTOR_COLORS_TABLE_READY"] is True
+    with app.app_context():
+        conn = db()
+        try:
+            cols = {row["name"] for row in conn.execute("PRAGMA table_info(doctor_colors)")}
+            any_row = conn.execute(
+                "SELECT doctor_label FROM doctor_colors WHERE doctor_id=?", (ANY_DOCTOR_ID,)
+            ).fetchone()
+        finally:
+            conn.close()
+    assert {"doctor_label", "is_active", "deleted_at", "is_purged"} <= cols
+    assert any_row["doctor_label"] == ANY_DOCTOR_LABEL
+
+
+def test_new_doctor_gets_an_unused_palette_color(app, logged_in_client, get_csrf_token):
+    token = get_csrf_token(logged_in_client.get("/admin/settings"))
+    resp = logged_in_client.post(
+        "/admin/settings/colors/update",
+        json={"csrf_token": token, "doctor_label": "Dr Palette", "color": "#000000"},
+    )
+    payload = resp.get_json()
+    assert payload["success"] is True
+    with app.app_context():
+        colors = [d["color"] for d in get_all_doctors_with_colors()]
+        new_color = get_doctor_entry(payload["doctor_id"])["color"]
+    assert new_color != "#000000"
+    assert colors.count(new_color) == 1
+
+
+def test_name_lookups_use_label_index_and_respect_status(app):
+    with app.app_context():
+        set_doctor_color("dr-idx", "#112233", "Dr Index")
+        set_doctor_color("dr-gone", "#223344", "Dr Gone")
+        delete_doctor_color("dr-gone")
+        assert find_active_doctor_ids_by_name(" dr index ") == ["dr-idx"]
+        assert name_exists("DR INDEX")
+        assert not name_exists("Dr Index", exclude_id="dr-idx")
+        assert not name_exists("Dr Gone")
+        assert name_exists_any("dr gone")
+        assert not name_exists_any("Dr Gone", exclude_id="dr-gone")
+        set_doctor_color("dr-idx", "#112233", "Dr Renamed")
+        assert not name_exists("Dr Index")
+        assert name_exists("dr renamed")
+
+
+def test_set_doctor_color_updates_appointments_in_the_same_commit(app):
+    with app.app_context():
+        set_doctor_color("dr-one", "#112233", "Dr One")
+        conn = db()
+        try:
+            conn.execute(
+                """
+                INSERT INTO appointments(
+                    id, patient_name, doctor_id, doctor_label, title, starts_at, ends_at,
+                    status, reminder_minutes, created_at, updated_at
+                ) VALUES ('appt-one', 'Pat', 'dr-one', 'Dr One', 'Visit', '2025-01-02T09:00:00',
+                          '2025-01-02T09:30:00', 'scheduled', 0, datetime('now'), datetime('now'))
+                """
+            )
+            conn.commit()
+        finally:
+            conn.close()
+        set_doctor_color("dr-one", "#445566", "Dr Uno")
+        conn = db()
+        try:
+            row = conn.execute("SELECT color, doctor_label FROM appointments WHERE id='appt-one'").fetchone()
+        finally:
+            conn.close()
+        assert (row["color"], row["doctor_label"]) == ("#445566", "Dr Uno")
+        assert get_doctor_entry("dr-one")["color"] == "#445566"
@@ -0,0 +1,178 @@
+import re
+from pathlib import Path
+
+from clinic_app.services.theme_settings import set_setting
+
+
+def _install_logo(app) -> Path:
+    logo = Path(app.config["DATA_ROOT"]) / "theme" / "logo-current.png"
+    logo.parent.mkdir(parents=True, exist_ok=True)
+    logo.write_bytes(b"\x89PNG\r\n\x1a\nfake")
+    with app.app_context():
+        set_setting("logo_path", "theme/logo-current.png", category="logo")
+    return logo
+
+
+def test_theme_logo_supports_conditional_get(app, client):
+    _install_logo(app)
+    first = client.get("/admin/theme/logo?_ts=1")
+    assert first.status_code == 200
+    assert first.cache_control.max_age == 86400
+    etag = first.headers["ETag"]
+    again = client.get("/admin/theme/logo", headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.cache_control.max_age is None
+
+
+def test_rendered_logo_url_is_stable_until_the_file_changes(app, logged_in_client):
+    logo = _install_logo(app)
+    pattern = re.compile(r"/admin/theme/logo\?_ts=([\d-]+)")
+    first = pattern.search(logged_in_client.get("/admin/settings").get_data(as_text=True))
+    assert first is not None
+    st = logo.stat()
+    assert first.group(1) == f"{st.st_mtime_ns}-{st.st_size}"
+    second = pattern.search(logged_in_client.get("/admin/settings").get_data(as_text=True))
+    assert second.group(1) == first.group(1)
+
+
+def test_logo_upload_enforces_type_and_size(app, logged_in_client):
+    import io
+
+    ok = logged_in_client.post(
+        "/admin/theme/logo/upload",
+        data={"logo": (io.BytesIO(b"\x89PNG small"), "logo.png")},
+        content_type="multipart/form-data",
+    ).get_json()
+    assert ok["success"] is True
+    assert (Path(app.config["DATA_ROOT"]) / "theme" / "logo-current.png").read_bytes() == b"\x89PNG small"
+
+    wrong_type = logged_in_client.post(
+        "/admin/theme/logo/upload",
+        data={"logo": (io.BytesIO(b"GIF89a"), "logo.gif")},
+        content_type="multipart/form-data",
+    ).get_json()
+    assert wrong_type["errors"] == ["Logo must be a PNG or JPG image."]
+
+    too_big = logged_in_client.post(
+        "/admin/theme/logo/upload",
+        data={"logo": (io.BytesIO(b"x" * (2 * 1024 * 1024 + 1)), "big.png")},
+        content_type="multipart/form-data",
+    ).get_json()
+    assert too_big["errors"] == ["Logo is too large (max 2MB)."]
+
+
+
+def test_update_theme_settings_saves_colors_and_branding(app, logged_in_client, get_csrf_token):
+    from clinic_app.services.theme_settings import get_theme_variables
+
+    token = get_csrf_token(logged_in_client.get("/admin/users/new"))
+    resp = logged_in_client.post(
+        "/admin/settings/theme/update",
+        json={
+            "csrf_token": token,
+            "primary_color": "#123456",
+            "accent_color": "#ffffff",
+            "clinic_name": "Smile",
+            "clinic_name_enabled": "1",
+            "logo_scale": "120",
+        },
+    )
+    assert resp.get_json() == {"success": True}
+    with app.app_context():
+        saved = get_theme_variables()
+    assert saved["primary_color"] == "#123456"
+    assert saved["accent_color"] == "#f3f4f6"
+    assert saved["clinic_name"] == "Smile"
+    assert saved["clinic_name_enabled"] == "1"
+    assert saved["clinic_brand_color"] == ""
+    assert saved["logo_scale"] == "120"
+
+
+def test_logo_history_lists_newest_first_by_mtime(app, logged_in_client):
+    import os
+
+    logos = Path(app.config["DATA_ROOT"]) / "theme" / "logos"
+    logos.mkdir(parents=True, exist_ok=True)
+    for name, mtime in (("logo-b.png", 100), ("logo-a.png", 300), ("logo-c.png", 200), ("notes.txt", 400)):
+        path = logos / name
+        path.write_bytes(b"x")
+        os.utime(path, (mtime, mtime))
+    history = logged_in_client.get("/admin/theme/logo/history").get_json()["logo_history"]
+    assert [item["label"] for item in history] == ["a", "c", "b"]
+    assert history[0]["path"] == os.path.join("theme", "logos", "logo-a.png")
+
+
+def test_oversized_logo_body_is_rejected_before_the_form_is_parsed(app, logged_in_client, monkeypatch):
+    import io
+
+    from flask import Request
+
+    def _no_parse(self):
+        raise AssertionError("form should not be parsed")
+
+    monkeypatch.setattr(Request, "_load_form_data", _no_parse)
+    for url in ("/admin/theme/logo/upload", "/admin/theme/pdf_logo/upload"):
+        resp = logged_in_client.post(
+            url,
+            data={"logo": (io.BytesIO(b"x" * (3 * 1024 * 1024)), "big.png")},
+            content_type="multipart/form-data",
+        )
+        assert resp.status_code == 400
+        assert resp.get_json()["errors"] == ["Logo is too large (max 2MB)."]
+
+
+def test_theme_reset_restores_color_defaults_only(app, logged_in_client):
+    from clinic_app.services.theme_settings import get_theme_variables
+
+    with app.app_context():
+        set_setting("primary_color", "#000000", category="colors")
+        set_setting("clinic_name", "Smile", category="branding")
+    assert logged_in_client.post("/admin/theme/reset").get_json() == {"success": True}
+    with app.app_context():
+        saved = get_theme_variables()
+    assert saved["primary_color"] == "#3b82f6"
+    assert saved["btn_text_color"] == ""
+    assert saved["base_font_size"] == "16"
+    assert saved["clinic_name"] == "Smile"
+
+
+def test_select_pdf_logo_stores_path_relative_to_data_root(app, logged_in_client, get_csrf_token):
+    import os
+
+    from clinic_app.services.theme_settings import get_setting
+
+    pdf_logos = Path(app.config["DATA_ROOT"]) / "theme" / "pdf_logos"
+    pdf_logos.mkdir(parents=True, exist_ok=True)
+    (pdf_logos / "pdf-logo-old.png").write_bytes(b"png")
+    token = get_csrf_token(logged_in_client.get("/admin/users/new"))
+    resp = logged_in_client.post(
+        "/admin/theme/pdf_logo/select",
+        json={"csrf_token": token, "logo_path": "theme/pdf_logos/pdf-logo-old.png"},
+    )
+    assert resp.get_json() == {"success": True}
+    with app.app_context():
+        assert get_setting("pdf_logo_path") == os.path.join("theme", "pdf-logo-current.png")
+    assert (Path(app.config["DATA_ROOT"]) / "theme" / "pdf-logo-current.png").read_bytes() == b"png"
+
+
+def test_logo_urls_change_for_swaps_within_one_second(app, logged_in_client, get_csrf_token):
+    import io
+    import os
+
+    uploaded = logged_in_client.post(
+        "/admin/theme/logo/upload",
+        data={"logo": (io.BytesIO(b"\x89PNG new"), "logo.png")},
+        content_type="multipart/form-data",
+    ).get_json()
+    logos = Path(app.config["DATA_ROOT"]) / "theme" / "logos"
+    old = logos / "logo-old.png"
+    old.write_bytes(b"\x89PNG old!")
+    token = get_csrf_token(logged_in_client.get("/admin/users/new"))
+    selected = logged_in_client.post(
+        "/admin/theme/logo/select",
+        json={"csrf_token": token, "logo_path": os.path.join("theme", "logos", "logo-old.png")},
+    ).get_json()
+    assert selected["success"] is True
+    assert selected["logo_url"] != uploaded["logo_url"]
+    html = logged_in_client.get("/admin/settings").get_data(as_text=True)
+    assert selected["logo_url"].split("?")[1] in html
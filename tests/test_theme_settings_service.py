@@ -0,0 +1,54 @@
+from clinic_app.services.database import db
+from clinic_app.services.theme_settings import get_setting, get_theme_variables, set_setting, set_settings
+
+
+def _write_raw(key: str, value: str) -> None:
+    conn = db()
+    try:
+        conn.execute(
+            "INSERT OR REPLACE INTO theme_settings(setting_key, setting_value, updated_at) VALUES (?, ?, datetime('now'))",
+            (key, value),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def test_settings_are_read_once_per_context_and_follow_writes(app):
+    with app.app_context():
+        _write_raw("clinic_name", "Before")
+    with app.app_context():
+        assert get_setting("clinic_name") == "Before"
+        _write_raw("clinic_name", "Outside")
+        assert get_setting("clinic_name") == "Before"
+        assert set_setting("clinic_name", "After", category="branding")
+        assert get_setting("clinic_name") == "After"
+        variables = get_theme_variables()
+        variables["clinic_name"] = "mutated"
+        assert get_theme_variables()["clinic_name"] == "After"
+    with app.app_context():
+        assert get_setting("clinic_name") == "After"
+        assert get_setting("missing_key") is None
+
+
+def test_set_settings_writes_all_keys_in_one_transaction(app):
+    with app.app_context():
+        assert set_settings([("primary_color", "#112233", "colors"), ("logo_scale", "90", "branding")])
+        assert set_settings([])
+    with app.app_context():
+        assert get_setting("primary_color") == "#112233"
+        assert get_setting("logo_scale") == "90"
+
+
+def test_theme_css_is_rendered_once_per_settings_combination():
+    from clinic_app.services.ui import _theme_css
+
+    _theme_css.cache_clear()
+    css = _theme_css("#ffffff", None, "20", None, None, None, "#000000")
+    assert css.startswith(":root { --primary-color: #ffffff;")
+    assert "font-size: clamp(14px, 18px, 18px);" in css
+    assert "--btn-text-on-primary: #111827;" in css
+    assert "--page-bg: linear-gradient(90deg, #d8d8d8 0%" in css
+    assert _theme_css("#ffffff", None, "20", None, None, None, "#000000") is css
+    assert _theme_css.cache_info().hits == 1
+    assert _theme_css(None, None, None, None, None, None, None) is None